@@ -0,0 +1,132 @@
+"""initial
+
+Revision ID: 424ada2e3b03
+Revises: 
+Create Date: 2023-04-02 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '424ada2e3b03'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('author',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_author_id'), 'author', ['id'], unique=False)
+    op.create_table('book',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('year_published', sa.Integer(), nullable=True),
+    sa.Column('description', sa.String(length=250), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('available', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_book_id'), 'book', ['id'], unique=False)
+    op.create_table('tag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tag_id'), 'tag', ['id'], unique=False)
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=320), nullable=False),
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('hashed_password', sa.LargeBinary(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('is_admin', sa.Boolean(), nullable=False),
+    sa.Column('register_at', sa.TIMESTAMP(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_user_email'), 'user', ['email'], unique=True)
+    op.create_index(op.f('ix_user_id'), 'user', ['id'], unique=False)
+    op.create_index(op.f('ix_user_username'), 'user', ['username'], unique=True)
+    op.create_table('auth_refresh_token',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('refresh_token', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_auth_refresh_token_id'), 'auth_refresh_token', ['id'], unique=False)
+    op.create_table('book_author',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['author.id'], ),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'author_id')
+    )
+    op.create_table('book_tag',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'tag_id')
+    )
+    op.create_table('book_user',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('give_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('returned_at', sa.TIMESTAMP(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'user_id', 'give_at')
+    )
+    op.create_table('comment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created', sa.TIMESTAMP(), nullable=False),
+    sa.Column('content', sa.String(length=300), nullable=False),
+    sa.Column('changed', sa.TIMESTAMP(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('book_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_comment_id'), 'comment', ['id'], unique=False)
+    op.create_table('rating',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('book_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_rating_id'), 'rating', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_rating_id'), table_name='rating')
+    op.drop_table('rating')
+    op.drop_index(op.f('ix_comment_id'), table_name='comment')
+    op.drop_table('comment')
+    op.drop_table('book_user')
+    op.drop_table('book_tag')
+    op.drop_table('book_author')
+    op.drop_index(op.f('ix_auth_refresh_token_id'), table_name='auth_refresh_token')
+    op.drop_table('auth_refresh_token')
+    op.drop_index(op.f('ix_user_username'), table_name='user')
+    op.drop_index(op.f('ix_user_id'), table_name='user')
+    op.drop_index(op.f('ix_user_email'), table_name='user')
+    op.drop_table('user')
+    op.drop_index(op.f('ix_tag_id'), table_name='tag')
+    op.drop_table('tag')
+    op.drop_index(op.f('ix_book_id'), table_name='book')
+    op.drop_table('book')
+    op.drop_index(op.f('ix_author_id'), table_name='author')
+    op.drop_table('author')
@@ -0,0 +1,25 @@
+"""rating and comment book_id indexes
+
+Revision ID: 55aac4634dff
+Revises: 424ada2e3b03
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '55aac4634dff'
+down_revision = '424ada2e3b03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_rating_book_id'), 'rating', ['book_id'], unique=False)
+    op.create_index(op.f('ix_comment_book_id'), 'comment', ['book_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_comment_book_id'), table_name='comment')
+    op.drop_index(op.f('ix_rating_book_id'), table_name='rating')
@@ -0,0 +1,51 @@
+"""book rating and comment counters
+
+Revision ID: 8c1e5f0b7a42
+Revises: 55aac4634dff
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1e5f0b7a42'
+down_revision = '55aac4634dff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('book', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('book', sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('book', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill counters from existing ratings and comments
+    op.execute("""
+        UPDATE book SET
+            rating_sum = r.rating_sum,
+            rating_count = r.rating_count
+        FROM (
+            SELECT book_id, COALESCE(SUM(value), 0) AS rating_sum, COUNT(value) AS rating_count
+            FROM rating
+            GROUP BY book_id
+        ) AS r
+        WHERE book.id = r.book_id
+    """)
+    op.execute("""
+        UPDATE book SET
+            comment_count = c.comment_count
+        FROM (
+            SELECT book_id, COUNT(id) AS comment_count
+            FROM comment
+            GROUP BY book_id
+        ) AS c
+        WHERE book.id = c.book_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('book', 'comment_count')
+    op.drop_column('book', 'rating_count')
+    op.drop_column('book', 'rating_sum')
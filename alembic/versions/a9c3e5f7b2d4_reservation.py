@@ -0,0 +1,44 @@
+"""reservation waitlist
+
+Revision ID: a9c3e5f7b2d4
+Revises: f2b8d6e1a4c7
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c3e5f7b2d4'
+down_revision = 'f2b8d6e1a4c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('reservation',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('book_id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('status', sa.String(length=20), server_default='waiting', nullable=False),
+                    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+                    sa.Column('held_until', sa.TIMESTAMP(), nullable=True),
+                    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id'))
+    op.create_index(op.f('ix_reservation_id'), 'reservation', ['id'], unique=False)
+    op.create_index('ix_reservation_book_waiting', 'reservation', ['book_id', 'id'], unique=False,
+                    postgresql_where=sa.text("status = 'waiting'"))
+    op.create_index('ix_reservation_held_until', 'reservation', ['held_until'], unique=False,
+                    postgresql_where=sa.text("status = 'held'"))
+    op.create_index('uq_reservation_active', 'reservation', ['book_id', 'user_id'], unique=True,
+                    postgresql_where=sa.text("status IN ('waiting', 'held')"))
+
+
+def downgrade() -> None:
+    op.drop_index('uq_reservation_active', table_name='reservation')
+    op.drop_index('ix_reservation_held_until', table_name='reservation')
+    op.drop_index('ix_reservation_book_waiting', table_name='reservation')
+    op.drop_index(op.f('ix_reservation_id'), table_name='reservation')
+    op.drop_table('reservation')
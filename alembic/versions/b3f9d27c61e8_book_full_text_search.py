@@ -0,0 +1,111 @@
+"""book full-text search
+
+Revision ID: b3f9d27c61e8
+Revises: 8c1e5f0b7a42
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f9d27c61e8'
+down_revision = '8c1e5f0b7a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('book', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_search_vector(title text, description text, authors text)
+        RETURNS tsvector AS $$
+        BEGIN
+            RETURN setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+                || setweight(to_tsvector('english', coalesce(title, '')), 'A')
+                || setweight(to_tsvector('russian', coalesce(authors, '')), 'B')
+                || setweight(to_tsvector('english', coalesce(authors, '')), 'B')
+                || setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+                || setweight(to_tsvector('english', coalesce(description, '')), 'C');
+        END
+        $$ LANGUAGE plpgsql IMMUTABLE
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_author_names(target_book_id integer)
+        RETURNS text AS $$
+        BEGIN
+            RETURN (SELECT string_agg(author.name, ' ')
+                    FROM author JOIN book_author ON book_author.author_id = author.id
+                    WHERE book_author.book_id = target_book_id);
+        END
+        $$ LANGUAGE plpgsql STABLE
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_search_vector_on_book() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := book_search_vector(NEW.title, NEW.description, book_author_names(NEW.id));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_search_vector_on_book_author() RETURNS trigger AS $$
+        BEGIN
+            UPDATE book
+            SET search_vector = book_search_vector(book.title, book.description, book_author_names(book.id))
+            WHERE book.id IN (SELECT book_id FROM changed_rows);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_search_vector_on_author() RETURNS trigger AS $$
+        BEGIN
+            UPDATE book
+            SET search_vector = book_search_vector(book.title, book.description, book_author_names(book.id))
+            WHERE book.id IN (SELECT book_id FROM book_author WHERE author_id = NEW.id);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER book_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, description ON book
+        FOR EACH ROW EXECUTE FUNCTION book_search_vector_on_book()
+    """)
+    op.execute("""
+        CREATE TRIGGER book_author_search_vector_insert
+        AFTER INSERT ON book_author REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION book_search_vector_on_book_author()
+    """)
+    op.execute("""
+        CREATE TRIGGER book_author_search_vector_delete
+        AFTER DELETE ON book_author REFERENCING OLD TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION book_search_vector_on_book_author()
+    """)
+    op.execute("""
+        CREATE TRIGGER author_search_vector_update
+        AFTER UPDATE OF name ON author
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+        EXECUTE FUNCTION book_search_vector_on_author()
+    """)
+
+    op.execute("UPDATE book SET search_vector = book_search_vector(title, description, book_author_names(id))")
+    op.create_index('ix_book_search_vector', 'book', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_book_search_vector', table_name='book', postgresql_using='gin')
+    op.execute("DROP TRIGGER IF EXISTS author_search_vector_update ON author")
+    op.execute("DROP TRIGGER IF EXISTS book_author_search_vector_delete ON book_author")
+    op.execute("DROP TRIGGER IF EXISTS book_author_search_vector_insert ON book_author")
+    op.execute("DROP TRIGGER IF EXISTS book_search_vector_update ON book")
+    op.execute("DROP FUNCTION IF EXISTS book_search_vector_on_author()")
+    op.execute("DROP FUNCTION IF EXISTS book_search_vector_on_book_author()")
+    op.execute("DROP FUNCTION IF EXISTS book_search_vector_on_book()")
+    op.execute("DROP FUNCTION IF EXISTS book_author_names(integer)")
+    op.execute("DROP FUNCTION IF EXISTS book_search_vector(text, text, text)")
+    op.drop_column('book', 'search_vector')
@@ -0,0 +1,44 @@
+"""rating unique per user and book
+
+Revision ID: b7d2f4a9c3e1
+Revises: e1f4a8c2b6d3
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2f4a9c3e1'
+down_revision = 'e1f4a8c2b6d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Duplicates from concurrent first ratings: keep the latest one
+    op.execute("""
+        DELETE FROM rating
+        USING rating AS newer
+        WHERE rating.user_id = newer.user_id
+          AND rating.book_id = newer.book_id
+          AND rating.id < newer.id
+    """)
+    op.execute("""
+        UPDATE book SET
+            rating_sum = COALESCE(r.rating_sum, 0),
+            rating_count = COALESCE(r.rating_count, 0)
+        FROM book AS b
+        LEFT JOIN (
+            SELECT book_id, SUM(value) AS rating_sum, COUNT(value) AS rating_count
+            FROM rating
+            GROUP BY book_id
+        ) AS r ON r.book_id = b.id
+        WHERE book.id = b.id
+          AND (book.rating_sum, book.rating_count) IS DISTINCT FROM (COALESCE(r.rating_sum, 0), COALESCE(r.rating_count, 0))
+    """)
+    op.create_unique_constraint('uq_rating_user_book', 'rating', ['user_id', 'book_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_rating_user_book', 'rating', type_='unique')
@@ -0,0 +1,48 @@
+"""book availability NOTIFY trigger
+
+Revision ID: c4d8e2a6f1b9
+Revises: a9c3e5f7b2d4
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2a6f1b9'
+down_revision = 'a9c3e5f7b2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_availability_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('library_events', json_build_object(
+                'channel', 'book:' || NEW.id,
+                'event', 'availability',
+                'data', json_build_object(
+                    'book_id', NEW.id,
+                    'available', NEW.available,
+                    'quantity', NEW.quantity,
+                    'available_delta', NEW.available - OLD.available,
+                    'quantity_delta', NEW.quantity - OLD.quantity,
+                    'version', NEW.version
+                )
+            )::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER book_availability_update
+        AFTER UPDATE OF available, quantity ON book
+        FOR EACH ROW WHEN (OLD.available IS DISTINCT FROM NEW.available OR OLD.quantity IS DISTINCT FROM NEW.quantity)
+        EXECUTE FUNCTION book_availability_notify()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS book_availability_update ON book")
+    op.execute("DROP FUNCTION IF EXISTS book_availability_notify()")
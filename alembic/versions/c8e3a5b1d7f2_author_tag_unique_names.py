@@ -0,0 +1,61 @@
+"""unique author names and tag contents
+
+Authors with the same name and tags with the same content are merged before the
+unique indexes are created: links move to the record with the smallest id, the
+other records are deleted. Their ids are gone for good, downgrade() only drops
+the indexes and does not restore them.
+
+Revision ID: c8e3a5b1d7f2
+Revises: b7d2f4a9c3e1
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e3a5b1d7f2'
+down_revision = 'b7d2f4a9c3e1'
+branch_labels = None
+depends_on = None
+
+
+def merge_duplicates(table: str, column: str, link_table: str, link_column: str) -> None:
+    # Links of duplicates move to the record with the smallest id, then duplicates are deleted
+    op.execute(f"""
+        CREATE TEMPORARY TABLE {table}_duplicate AS
+        SELECT id, min(id) OVER (PARTITION BY {column}) AS keep_id
+        FROM {table}
+    """)
+    op.execute(f"""
+        INSERT INTO {link_table} (book_id, {link_column})
+        SELECT l.book_id, d.keep_id
+        FROM {link_table} AS l
+        JOIN {table}_duplicate AS d ON d.id = l.{link_column}
+        WHERE d.id <> d.keep_id
+        ON CONFLICT DO NOTHING
+    """)
+    op.execute(f"""
+        DELETE FROM {link_table} AS l
+        USING {table}_duplicate AS d
+        WHERE d.id = l.{link_column} AND d.id <> d.keep_id
+    """)
+    op.execute(f"""
+        DELETE FROM {table} AS t
+        USING {table}_duplicate AS d
+        WHERE d.id = t.id AND d.id <> d.keep_id
+    """)
+    op.execute(f'DROP TABLE {table}_duplicate')
+
+
+def upgrade() -> None:
+    merge_duplicates('author', 'name', 'book_author', 'author_id')
+    merge_duplicates('tag', 'content', 'book_tag', 'tag_id')
+    op.create_index('uq_author_name', 'author', ['name'], unique=True)
+    op.create_index('uq_tag_content', 'tag', ['content'], unique=True)
+
+
+def downgrade() -> None:
+    # Merged duplicates are not restored
+    op.drop_index('uq_tag_content', table_name='tag')
+    op.drop_index('uq_author_name', table_name='author')
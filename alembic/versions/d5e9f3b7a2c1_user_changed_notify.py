@@ -0,0 +1,40 @@
+"""user changed NOTIFY trigger
+
+Revision ID: d5e9f3b7a2c1
+Revises: c4d8e2a6f1b9
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e9f3b7a2c1'
+down_revision = 'c4d8e2a6f1b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE OR REPLACE FUNCTION user_changed_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('library_events', json_build_object(
+                'channel', 'users',
+                'event', 'changed',
+                'data', json_build_object('id', OLD.id)
+            )::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER user_changed
+        AFTER UPDATE OR DELETE ON "user"
+        FOR EACH ROW EXECUTE FUNCTION user_changed_notify()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS user_changed ON "user"')
+    op.execute("DROP FUNCTION IF EXISTS user_changed_notify()")
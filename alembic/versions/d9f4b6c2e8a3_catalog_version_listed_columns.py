@@ -0,0 +1,46 @@
+"""catalog version only on listed book columns
+
+Revision ID: d9f4b6c2e8a3
+Revises: c8e3a5b1d7f2
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f4b6c2e8a3'
+down_revision = 'c8e3a5b1d7f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Column lists cannot be combined with transition tables, so the update trigger
+    # gets its own function without the changed_rows check
+    op.execute("""
+        CREATE OR REPLACE FUNCTION catalog_version_bump() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO catalog_version (shard, value) VALUES (pg_backend_pid() % 16, 1)
+            ON CONFLICT (shard) DO UPDATE SET value = catalog_version.value + 1;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS catalog_version_update ON book")
+    op.execute("""
+        CREATE TRIGGER catalog_version_update
+        AFTER UPDATE OF title, year_published, description, rating_sum, rating_count, comment_count,
+            search_vector, version ON book
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS catalog_version_update ON book")
+    op.execute("""
+        CREATE TRIGGER catalog_version_update
+        AFTER UPDATE ON book REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_on_book()
+    """)
+    op.execute("DROP FUNCTION IF EXISTS catalog_version_bump()")
@@ -0,0 +1,41 @@
+"""refresh token hash with unique index
+
+Revision ID: e1f4a8c2b6d3
+Revises: d5e9f3b7a2c1
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f4a8c2b6d3'
+down_revision = 'd5e9f3b7a2c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Истекшие токены не нужны, живые хешируются на месте - активные сессии сохраняются
+    op.execute("DELETE FROM auth_refresh_token WHERE expires_at <= now() AT TIME ZONE 'utc'")
+    op.add_column('auth_refresh_token', sa.Column('token_hash', sa.LargeBinary(32), nullable=True))
+    op.execute("UPDATE auth_refresh_token SET token_hash = sha256(convert_to(refresh_token, 'UTF8'))")
+    op.alter_column('auth_refresh_token', 'token_hash', nullable=False)
+    op.drop_column('auth_refresh_token', 'refresh_token')
+
+    op.create_index(op.f('ix_auth_refresh_token_token_hash'), 'auth_refresh_token', ['token_hash'], unique=True)
+    op.create_index(op.f('ix_auth_refresh_token_expires_at'), 'auth_refresh_token', ['expires_at'], unique=False)
+    op.create_index('ix_auth_refresh_token_user_id_expires_at', 'auth_refresh_token',
+                    ['user_id', 'expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_auth_refresh_token_user_id_expires_at', table_name='auth_refresh_token')
+    op.drop_index(op.f('ix_auth_refresh_token_expires_at'), table_name='auth_refresh_token')
+    op.drop_index(op.f('ix_auth_refresh_token_token_hash'), table_name='auth_refresh_token')
+
+    # Токены по хешу не восстановить: все пользователи входят заново
+    op.execute("DELETE FROM auth_refresh_token")
+    op.add_column('auth_refresh_token', sa.Column('refresh_token', sa.String(), nullable=False))
+    op.drop_column('auth_refresh_token', 'token_hash')
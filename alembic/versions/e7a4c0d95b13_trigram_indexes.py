@@ -0,0 +1,28 @@
+"""trigram indexes for fuzzy search
+
+Revision ID: e7a4c0d95b13
+Revises: b3f9d27c61e8
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4c0d95b13'
+down_revision = 'b3f9d27c61e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_author_name_trgm', 'author', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_book_title_trgm', 'book', ['title'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_book_title_trgm', table_name='book')
+    op.drop_index('ix_author_name_trgm', table_name='author')
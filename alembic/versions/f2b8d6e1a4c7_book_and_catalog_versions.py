@@ -0,0 +1,130 @@
+"""book and catalog versions for ETag
+
+Revision ID: f2b8d6e1a4c7
+Revises: e7a4c0d95b13
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d6e1a4c7'
+down_revision = 'e7a4c0d95b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('book', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('catalog_version',
+                    sa.Column('shard', sa.Integer(), autoincrement=False, nullable=False),
+                    sa.Column('value', sa.BigInteger(), server_default='0', nullable=False),
+                    sa.PrimaryKeyConstraint('shard'))
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_version_on_book() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := greatest(NEW.version, OLD.version + 1);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_version_on_book_tag() RETURNS trigger AS $$
+        BEGIN
+            UPDATE book SET version = version + 1
+            WHERE id IN (SELECT book_id FROM changed_rows);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_version_on_tag() RETURNS trigger AS $$
+        BEGIN
+            UPDATE book SET version = version + 1
+            WHERE id IN (SELECT book_id FROM book_tag WHERE tag_id = NEW.id);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION book_version_on_comment() RETURNS trigger AS $$
+        BEGIN
+            UPDATE book SET version = version + 1 WHERE id = NEW.book_id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION catalog_version_on_book() RETURNS trigger AS $$
+        BEGIN
+            IF EXISTS (SELECT FROM changed_rows) THEN
+                INSERT INTO catalog_version (shard, value) VALUES (pg_backend_pid() % 16, 1)
+                ON CONFLICT (shard) DO UPDATE SET value = catalog_version.value + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER book_version_update
+        BEFORE UPDATE ON book
+        FOR EACH ROW EXECUTE FUNCTION book_version_on_book()
+    """)
+    op.execute("""
+        CREATE TRIGGER book_tag_version_insert
+        AFTER INSERT ON book_tag REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION book_version_on_book_tag()
+    """)
+    op.execute("""
+        CREATE TRIGGER book_tag_version_delete
+        AFTER DELETE ON book_tag REFERENCING OLD TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION book_version_on_book_tag()
+    """)
+    op.execute("""
+        CREATE TRIGGER tag_version_update
+        AFTER UPDATE OF content ON tag
+        FOR EACH ROW WHEN (OLD.content IS DISTINCT FROM NEW.content)
+        EXECUTE FUNCTION book_version_on_tag()
+    """)
+    op.execute("""
+        CREATE TRIGGER comment_version_update
+        AFTER UPDATE OF content ON comment
+        FOR EACH ROW WHEN (OLD.content IS DISTINCT FROM NEW.content)
+        EXECUTE FUNCTION book_version_on_comment()
+    """)
+    op.execute("""
+        CREATE TRIGGER catalog_version_insert
+        AFTER INSERT ON book REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_on_book()
+    """)
+    op.execute("""
+        CREATE TRIGGER catalog_version_update
+        AFTER UPDATE ON book REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_on_book()
+    """)
+    op.execute("""
+        CREATE TRIGGER catalog_version_delete
+        AFTER DELETE ON book REFERENCING OLD TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_on_book()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS catalog_version_delete ON book")
+    op.execute("DROP TRIGGER IF EXISTS catalog_version_update ON book")
+    op.execute("DROP TRIGGER IF EXISTS catalog_version_insert ON book")
+    op.execute("DROP TRIGGER IF EXISTS comment_version_update ON comment")
+    op.execute("DROP TRIGGER IF EXISTS tag_version_update ON tag")
+    op.execute("DROP TRIGGER IF EXISTS book_tag_version_delete ON book_tag")
+    op.execute("DROP TRIGGER IF EXISTS book_tag_version_insert ON book_tag")
+    op.execute("DROP TRIGGER IF EXISTS book_version_update ON book")
+    op.execute("DROP FUNCTION IF EXISTS catalog_version_on_book()")
+    op.execute("DROP FUNCTION IF EXISTS book_version_on_comment()")
+    op.execute("DROP FUNCTION IF EXISTS book_version_on_tag()")
+    op.execute("DROP FUNCTION IF EXISTS book_version_on_book_tag()")
+    op.execute("DROP FUNCTION IF EXISTS book_version_on_book()")
+    op.drop_table('catalog_version')
+    op.drop_column('book', 'version')
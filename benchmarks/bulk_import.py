@@ -0,0 +1,105 @@
+"""
+Импорт каталога: POST /library/admin/ по одной книге против массового импорта (COPY).
+Нужна пустая тестовая БД (TEST_DATABASE_URL), схема создается и удаляется скриптом.
+
+    python -m benchmarks.bulk_import [кол-во книг] [кол-во книг для поштучного импорта]
+"""
+import asyncio
+import random
+import string
+import sys
+import time
+
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.auth.jwt import create_access_token
+from src.auth.models import User
+from src.auth.schema import JWTData
+from src.books.importer import import_books
+from src.books.models import Author
+from src.config import TEST_DATABASE_URL
+from src.db import Base, get_async_session
+from src.main import app
+
+engine = create_async_engine(TEST_DATABASE_URL)
+session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def override_get_async_session():
+    async with session_maker() as session:
+        yield session
+
+app.dependency_overrides[get_async_session] = override_get_async_session
+
+
+def word() -> str:
+    return ''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 10)))
+
+
+def make_books(size: int):
+    authors = [f'{word()} {word()}' for _ in range(max(size // 10, 1))]
+    tags = [word() for _ in range(100)]
+    for i in range(size):
+        yield i + 1, {
+            'title': ' '.join(word() for _ in range(random.randint(1, 5))),
+            'year_published': random.randint(1800, 2020),
+            'description': ' '.join(word() for _ in range(10)),
+            'quantity': random.randint(0, 10),
+            'authors': random.sample(authors, random.randint(1, 2)),
+            'tags': random.sample(tags, random.randint(0, 3)),
+        }
+
+
+async def per_book(books) -> float:
+    async with session_maker() as session:
+        admin = User(username='admin', email='admin@mail.com', hashed_password=b'0', is_admin=True)
+        authors = [Author(name=f'{word()} {word()}') for _ in range(10)]
+        session.add_all([admin, *authors])
+        await session.commit()
+        token = create_access_token(user=JWTData(sub=admin.id, is_admin=True))
+        author_ids = [author.id for author in authors]
+
+    async with AsyncClient(app=app, base_url='http://localhost:8000') as client:
+        started = time.perf_counter()
+        for _, book in books:
+            await client.post('/library/admin/',
+                              cookies={'access_token': token},
+                              json={'title': book['title'],
+                                    'year_published': book['year_published'],
+                                    'description': book['description'],
+                                    'quantity': book['quantity'],
+                                    'authors_id': random.sample(author_ids, 2)})
+        return time.perf_counter() - started
+
+
+async def bulk(books) -> float:
+    async with session_maker() as session:
+        started = time.perf_counter()
+        result = await import_books(books, session)
+        elapsed = time.perf_counter() - started
+    assert result['imported'] == len(books), result
+    return elapsed
+
+
+async def main(size: int, single_size: int) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    try:
+        single = await per_book(list(make_books(single_size)))
+        many = await bulk(list(make_books(size)))
+    finally:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+
+    single_rate = single_size / single
+    bulk_rate = size / many
+    print(f'per book: {single_size} books in {single:.1f} s, {single_rate:.0f} books/s')
+    print(f'bulk:     {size} books in {many:.1f} s, {bulk_rate:.0f} books/s')
+    print(f'speedup:  {bulk_rate / single_rate:.0f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 1000))
@@ -0,0 +1,82 @@
+"""
+Страница каталога: объекты Book с selectinload авторов, тегов и читателей (как раньше)
+против строк book_list_columns с json_agg одним запросом. Время, CPU и пик памяти
+на страницу вместе со сборкой ответа. Нужна пустая тестовая БД (TEST_DATABASE_URL).
+
+    python -m benchmarks.catalog_listing [кол-во книг] [кол-во страниц]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, Any
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker, selectinload
+
+import src.books.schema as book_schema
+from src.books.importer import import_books
+from src.books.models import Book
+from src.books.service import get_books_list
+from src.config import TEST_DATABASE_URL
+from src.db import Base, engine_options
+from src.pagination import paginate, MAX_PAGE_SIZE
+from src.serialization import serialize_page
+
+engine = create_async_engine(TEST_DATABASE_URL, **engine_options())
+session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def orm_page(session: AsyncSession) -> Dict[str, Any]:
+    query = select(Book) \
+        .options(selectinload(Book.authors),
+                 selectinload(Book.tags),
+                 selectinload(Book.users))
+    return await paginate(query, session, [Book.id], MAX_PAGE_SIZE)
+
+
+async def rows_page(session: AsyncSession) -> Dict[str, Any]:
+    return await get_books_list('', session, MAX_PAGE_SIZE)
+
+
+async def measure(load: Callable[[AsyncSession], Awaitable[Dict[str, Any]]], pages: int) -> str:
+    wall, cpu, peak = 0.0, 0.0, 0
+    for _ in range(pages):
+        async with session_maker() as session:
+            tracemalloc.start()
+            started, started_cpu = time.perf_counter(), time.process_time()
+            serialize_page(await load(session), book_schema.serialize_books)
+            wall += time.perf_counter() - started
+            cpu += time.process_time() - started_cpu
+            peak += tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return (f'{wall / pages * 1000:.1f} ms/page, CPU {cpu / pages * 1000:.1f} ms/page, '
+            f'peak memory {peak / pages / 1024:.0f} KiB/page')
+
+
+async def main(size: int, pages: int) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    try:
+        async with session_maker() as session:
+            await import_books(((i, {'title': f'Book {i}', 'quantity': 1,
+                                     'authors': [f'Author {i % 100}', f'Author {100 + i % 37}'],
+                                     'tags': [f'tag {i % 20}', f'tag {20 + i % 7}']})
+                                for i in range(size)), session)
+
+        # Прогрев: соединения пула и кэш подготовленных запросов
+        await measure(orm_page, 3)
+        await measure(rows_page, 3)
+        print(f'{MAX_PAGE_SIZE} books per page, {pages} pages')
+        print(f'ORM objects + selectinload: {await measure(orm_page, pages)}')
+        print(f'rows + json_agg:            {await measure(rows_page, pages)}')
+    finally:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 200))
@@ -0,0 +1,99 @@
+"""
+Одновременная выдача одной книги: N запросов на книгу с quantity экземпляров.
+Проверяет, что выдано ровно min(N, quantity) экземпляров, и сравнивает время
+одновременных выдач с последовательными и с прежней выдачей (чтение книги с читателями,
+изменение в Python, коммит) под блокировкой строки книги — без блокировки она перевыдаёт. Нужна пустая тестовая БД (TEST_DATABASE_URL).
+
+    python -m benchmarks.circulation [кол-во запросов] [кол-во экземпляров]
+"""
+import asyncio
+import sys
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from src.auth.models import User
+from src.books.models import Book, book_user
+from src.books.service import _give_book_to_user
+from src.config import TEST_DATABASE_URL
+from src.db import Base
+
+engine = create_async_engine(TEST_DATABASE_URL, pool_size=50, max_overflow=0)
+session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def checkout(book_id: int, user_id: int) -> bool:
+    async with session_maker() as session:
+        try:
+            await _give_book_to_user(book_id, user_id, session)
+            return True
+        except HTTPException:
+            return False
+
+
+async def legacy_checkout(book_id: int, user_id: int) -> bool:
+    async with session_maker() as session:
+        query_book = (select(Book).where(Book.id == book_id).options(joinedload(Book.users))
+                      .with_for_update(of=Book))
+        book = await session.scalar(query_book)
+        user = await session.scalar(select(User).where(User.id == user_id))
+        if book.available == 0:
+            return False
+        book.available -= 1
+        book.users.append(user)
+        await session.commit()
+        return True
+
+
+async def setup(size: int, quantity: int):
+    async with session_maker() as session:
+        users = [User(username=f'reader_{i}', email=f'reader_{i}@mail.com', hashed_password=b'0')
+                 for i in range(size)]
+        books = [Book(title=f'Popular book {i}', quantity=quantity, available=quantity) for i in range(3)]
+        session.add_all(users + books)
+        await session.commit()
+        return [user.id for user in users], [book.id for book in books]
+
+
+async def main(size: int, quantity: int) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    try:
+        user_ids, (concurrent_book, sequential_book, legacy_book) = await setup(size, quantity)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(checkout(concurrent_book, user_id) for user_id in user_ids))
+        concurrent_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for user_id in user_ids:
+            await checkout(sequential_book, user_id)
+        sequential_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        legacy_results = await asyncio.gather(*(legacy_checkout(legacy_book, user_id) for user_id in user_ids))
+        legacy_time = time.perf_counter() - started
+
+        async with session_maker() as session:
+            available = await session.scalar(select(Book.available).where(Book.id == concurrent_book))
+            loans = await session.scalar(select(func.count()).where(book_user.c.book_id == concurrent_book))
+    finally:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+
+    expected = min(size, quantity)
+    print(f'requests: {size}, copies: {quantity}')
+    print(f'succeeded: {sum(results)}, loans: {loans}, available: {available}')
+    print(f'concurrent: {concurrent_time:.2f} s, sequential: {sequential_time:.2f} s, '
+          f'speedup: {sequential_time / concurrent_time:.1f}x')
+    print(f'legacy concurrent (row lock): {legacy_time:.2f} s, succeeded: {sum(legacy_results)}, '
+          f'single statement is {legacy_time / concurrent_time:.1f}x faster')
+    assert sum(results) == loans == expected and available == quantity - expected, 'oversold'
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 150))
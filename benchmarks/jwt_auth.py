@@ -0,0 +1,44 @@
+"""
+Накладные расходы аутентификации на запрос: проверка подписи JWT и сборка JWTData
+на каждый запрос против кэша проверенных токенов. БД не нужна.
+
+    python -m benchmarks.jwt_auth [кол-во запросов] [кол-во разных токенов]
+"""
+import asyncio
+import sys
+import time
+
+from src.auth.jwt import VerifiedTokenCache, create_access_token, decode_token, decode_jwt_data
+from src.auth.schema import JWTData
+
+
+async def authenticate(decode, token: str) -> JWTData:
+    """
+    Цепочка зависимостей _decode_jwt_data -> decode_jwt_data, как ее вызывает FastAPI.
+    """
+    return await decode_jwt_data(decode(token))
+
+
+async def measure(decode, tokens, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        await authenticate(decode, tokens[i % len(tokens)])
+    return (time.perf_counter() - started) / requests
+
+
+async def main(requests: int, sessions: int) -> None:
+    tokens = [create_access_token(JWTData(sub=i)) for i in range(sessions)]
+    cache = VerifiedTokenCache()
+
+    uncached = await measure(lambda token: decode_token(token)[0], tokens, requests)
+    cached = await measure(cache.decode, tokens, requests)
+
+    print(f'requests: {requests}, sessions: {sessions}')
+    print(f'jose decode each request: {uncached * 1e6:.1f} us/request')
+    print(f'verified token cache: {cached * 1e6:.1f} us/request ({uncached / cached:.1f}x), '
+          f'hit rate {cache.stats()["hit_rate"]:.2%}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 1000))
@@ -0,0 +1,116 @@
+"""
+Задержка каталога во время наплыва входов: p50/p99 GET /library/ при N одновременных
+POST /auth/user/token. Сравнивается bcrypt в цикле событий (как раньше) и в пуле
+password_hasher. Нужна пустая тестовая БД (TEST_DATABASE_URL).
+
+    python -m benchmarks.login_burst [кол-во входов] [запросов каталога]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from typing import AsyncGenerator, List
+
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import src.auth.service as auth_service
+from src.auth.models import User
+from src.auth.utils import check_password, hash_password, password_hasher
+from src.books.models import Book
+from src.config import TEST_DATABASE_URL
+from src.db import Base, get_async_session
+from src.main import app
+
+PASSWORD = 'Qwe123!'
+
+# Входы с bcrypt в цикле событий держат соединения всё время наплыва: ожидание соединения
+# должно попасть в задержку каталога, а не оборвать запрос через 30 секунд
+engine = create_async_engine(TEST_DATABASE_URL, pool_size=20, max_overflow=0, pool_timeout=600)
+session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with session_maker() as session:
+        yield session
+
+
+class InlineHasher:
+    """
+    Прежнее поведение: bcrypt прямо в обработчике, цикл событий стоит на время проверки.
+    """
+
+    async def check(self, password: str, password_in_db: bytes) -> bool:
+        return check_password(password, password_in_db)
+
+
+async def setup(size: int) -> None:
+    hashed = hash_password(PASSWORD)
+    async with session_maker() as session:
+        session.add_all([User(username=f'reader_{i}', email=f'reader_{i}@mail.com', hashed_password=hashed)
+                         for i in range(size)])
+        session.add_all([Book(title=f'Book {i}', quantity=1, available=1) for i in range(100)])
+        await session.commit()
+
+
+async def catalog_latencies(client: AsyncClient, requests: int, stop: asyncio.Event) -> List[float]:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get('/library/', headers={'Cache-Control': 'no-cache'})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        if stop.is_set():
+            break
+    return latencies
+
+
+async def login(client: AsyncClient, i: int) -> int:
+    response = await client.post('/auth/user/token', json={'email': f'reader_{i}@mail.com', 'password': PASSWORD})
+    return response.status_code
+
+
+async def run(client: AsyncClient, size: int, requests: int) -> None:
+    stop = asyncio.Event()
+    catalog = asyncio.create_task(catalog_latencies(client, requests, stop))
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(login(client, i) for i in range(size)))
+    login_time = time.perf_counter() - started
+    if size:
+        stop.set()
+    latencies = sorted(await catalog)
+
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f'  logins: {statuses.count(200)} ok, {statuses.count(503)} rejected (503) in {login_time:.2f} s')
+    print(f'  catalog: {len(latencies)} requests, p50 {statistics.median(latencies) * 1000:.1f} ms, '
+          f'p99 {p99 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms')
+
+
+async def main(size: int, requests: int) -> None:
+    app.dependency_overrides[get_async_session] = override_get_async_session
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    try:
+        await setup(size)
+        async with AsyncClient(app=app, base_url='http://localhost:8000') as client:
+            print('idle:')
+            await run(client, 0, requests)
+
+            auth_service.password_hasher = InlineHasher()
+            print(f'{size} logins, bcrypt on the event loop:')
+            await run(client, size, requests)
+
+            auth_service.password_hasher = password_hasher
+            print(f'{size} logins, bcrypt in {password_hasher.executor_type} pool '
+                  f'({password_hasher.workers} workers, max pending {password_hasher.max_pending}):')
+            await run(client, size, requests)
+    finally:
+        password_hasher.shutdown()
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 500))
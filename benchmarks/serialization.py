@@ -0,0 +1,66 @@
+"""
+CPU на сериализацию страницы книг: from_orm, валидация Page[BooksSchema] и json.dumps,
+как FastAPI отдает response_model, против compile_serializer и ORJSONResponse.
+Книги собираются в памяти, с авторами и тегами, БД не нужна.
+
+    python -m benchmarks.serialization [книг на странице] [кол-во страниц]
+"""
+import asyncio
+import json
+import sys
+import time
+from typing import Callable, List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import src.books.schema as book_schema
+from src.books.models import Book, Author, Tag
+from src.pagination import Page
+from src.serialization import serialize_page
+
+
+def make_books(size: int) -> List[Book]:
+    authors = [Author(id=i, name=f'Author {i}') for i in range(50)]
+    tags = [Tag(id=i, content=f'tag {i}') for i in range(30)]
+    books = []
+    for i in range(size):
+        book = Book(id=i, title=f'Book {i}', year_published=1900 + i % 120,
+                    rating_sum=i % 50, rating_count=i % 10, comment_count=i % 7)
+        book.authors = [authors[(i + j) % len(authors)] for j in range(2)]
+        book.tags = [tags[(i + j) % len(tags)] for j in range(3)]
+        books.append(book)
+    return books
+
+
+async def measure(render: Callable, page: dict, pages: int) -> float:
+    started = time.process_time()
+    for _ in range(pages):
+        await render(page)
+    return time.process_time() - started
+
+
+async def main(size: int, pages: int) -> None:
+    page = {'items': make_books(size), 'next_cursor': 'MQ', 'total': None}
+    field = create_response_field(name='response', type_=Page[book_schema.BooksSchema])
+
+    async def pydantic_render(content: dict) -> bytes:
+        return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+    async def compiled_render(content: dict) -> bytes:
+        return ORJSONResponse(serialize_page(content, book_schema.serialize_books)).body
+
+    assert json.loads(await pydantic_render(page)) == json.loads(await compiled_render(page))
+    before = await measure(pydantic_render, page, pages)
+    after = await measure(compiled_render, page, pages)
+    books = size * pages
+
+    print(f'books per page: {size}, pages: {pages}')
+    print(f'from_orm + json: {before / books * 1000 * 1000:.1f} ms CPU per 1000 books')
+    print(f'compiled + orjson: {after / books * 1000 * 1000:.1f} ms CPU per 1000 books ({before / after:.1f}x)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 200))
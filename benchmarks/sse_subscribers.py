@@ -0,0 +1,66 @@
+"""
+Простаивающие подписчики SSE в одном воркере: N потоков sse_stream, подписанных
+на случайные книги. Измеряет память на подписчика, загрузку цикла событий в простое
+и время доставки события всем подписчикам популярной книги. БД не нужна.
+
+    python -m benchmarks.sse_subscribers [кол-во подписчиков] [книг на подписчика]
+"""
+import asyncio
+import random
+import sys
+import time
+import tracemalloc
+
+from src.books.availability import book_channel
+from src.events import broker, sse_stream
+
+HOT_BOOK_ID = 0
+
+
+async def consume(stream, received: list) -> None:
+    async for chunk in stream:
+        if chunk.startswith('event:'):
+            received.append(time.perf_counter())
+
+
+async def main(size: int, books_per_subscriber: int) -> None:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    received = []
+    tasks = []
+    for _ in range(size):
+        book_ids = {HOT_BOOK_ID, *random.sample(range(1, 100000), books_per_subscriber - 1)}
+        stream = sse_stream([book_channel(book_id) for book_id in book_ids])
+        tasks.append(asyncio.create_task(consume(stream, received)))
+    await asyncio.sleep(1)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Простой: доля времени, когда цикл событий занят, по задержке sleep(0.1)
+    lag = 0.0
+    for _ in range(20):
+        started = time.perf_counter()
+        await asyncio.sleep(0.1)
+        lag += time.perf_counter() - started - 0.1
+
+    started = time.perf_counter()
+    broker.publish(book_channel(HOT_BOOK_ID), 'availability', {'book_id': HOT_BOOK_ID, 'available': 1})
+    publish_time = time.perf_counter() - started
+    while len(received) < size:
+        await asyncio.sleep(0.01)
+    delivery_time = max(received) - started
+
+    print(f'subscribers: {size}, subscriptions: {broker.stats()["subscriptions"]}')
+    print(f'memory per subscriber: {(after - before) / size / 1024:.1f} KiB')
+    print(f'idle event loop lag: {lag / 20 * 1000:.2f} ms')
+    print(f'publish: {publish_time * 1000:.1f} ms, delivered to all: {delivery_time * 1000:.1f} ms')
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 20))
@@ -0,0 +1,56 @@
+"""
+Время построения, память и задержка поиска префиксного индекса автодополнения.
+
+    python -m benchmarks.suggest_index [кол-во записей]
+"""
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+from src.books.suggest import PrefixIndex, KINDS
+
+WORDS = [''.join(random.choices(string.ascii_lowercase + 'абвгдежзиклмнопрстуфхцчшэюя', k=random.randint(3, 10)))
+         for _ in range(50000)]
+
+
+def make_entries(size: int):
+    for i in range(size):
+        yield KINDS[i % len(KINDS)], i, ' '.join(random.choices(WORDS, k=random.randint(1, 5)))
+
+
+def main(size: int) -> None:
+    entries = list(make_entries(size))
+
+    started = time.perf_counter()
+    index = PrefixIndex.from_entries(entries)
+    build_time = time.perf_counter() - started
+    del index
+
+    tracemalloc.start()
+    index = PrefixIndex.from_entries(entries)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    queries = [random.choice(WORDS)[:random.randint(1, 4)] for _ in range(10000)]
+    started = time.perf_counter()
+    for query in queries:
+        index.search(query, 10)
+    search_time = (time.perf_counter() - started) / len(queries)
+
+    started = time.perf_counter()
+    for i in range(1000):
+        index.add('book', size + i, 'new book title')
+    add_time = (time.perf_counter() - started) / 1000
+
+    print(f'entries:     {size}')
+    print(f'keys:        {len(index)}')
+    print(f'build:       {build_time:.2f} s')
+    print(f'memory:      {current / 2 ** 20:.0f} MiB (peak while building {peak / 2 ** 20:.0f} MiB)')
+    print(f'search:      {search_time * 1e6:.1f} us per query')
+    print(f'add:         {add_time * 1e6:.1f} us per entry')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
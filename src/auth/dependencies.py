@@ -1,24 +1,49 @@
+from typing import Optional
+
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .jwt import decode_jwt_data, decode_jwt_data_admin
-from .models import User
-from .schema import JWTData
+from src.config import AUTH_USER_LOOKUP
+from src.metrics import register_metrics
+from .jwt import decode_jwt_data, decode_jwt_data_admin, token_cache
+from .schema import JWTData, CurrentUser
 from .service import get_user
+from .user_cache import user_cache
 from ..db import get_async_session
 
+# jwt.py не импортирует metrics: роутер метрик сам зависит от jwt
+register_metrics('jwt_cache', token_cache.stats)
+
+
+async def _lookup_user(jwt_data: JWTData, session: AsyncSession) -> Optional[CurrentUser]:
+    if AUTH_USER_LOOKUP == 'db':
+        user = await get_user(jwt_data.id, session)
+        return CurrentUser.from_orm(user) if user is not None else None
+    return await user_cache.get(jwt_data.id, session)
+
 
 async def get_current_user(
         jwt_data: JWTData = Depends(decode_jwt_data),
         session: AsyncSession = Depends(get_async_session)
-) -> User:
-    user = await get_user(jwt_data.id, session)
+) -> CurrentUser:
+    user = await _lookup_user(jwt_data, session)
     return user
 
 
+async def get_current_user_claims(
+        jwt_data: JWTData = Depends(decode_jwt_data)
+) -> CurrentUser:
+    """
+    Пользователь только из данных токена (id, is_admin), без обращения к кэшу и БД.
+    Для эндпоинтов, которым нужен лишь id: изменения пользователя (блокировка, снятие
+    прав) до истечения токена здесь не видны.
+    """
+    return CurrentUser(id=jwt_data.id, is_admin=jwt_data.is_admin)
+
+
 async def get_current_admin_user(
         jwt_data: JWTData = Depends(decode_jwt_data_admin),
         session: AsyncSession = Depends(get_async_session)
-) -> User:
-    user = await get_user(jwt_data.id, session)
+) -> CurrentUser:
+    user = await _lookup_user(jwt_data, session)
     return user
@@ -1,10 +1,13 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Union, Optional
+from typing import Any, Dict, Tuple, Union, Optional
 
 from fastapi import Depends, Cookie
 from jose import JWTError, jwt
 
-from src.config import JWT_SECRET, JWY_ALGORITHM
+from src.config import JWT_SECRET, JWY_ALGORITHM, JWT_CACHE_MAX_SIZE
 from src.exceptions import InvalidTokenException, AuthRequiredException, AuthAdminRequiredException
 from .schema import JWTData
 
@@ -19,17 +22,73 @@ def create_access_token(user: JWTData, exp_delta: timedelta = timedelta(minutes=
     return jwt.encode(data, key=JWT_SECRET, algorithm=JWY_ALGORITHM)
 
 
+def decode_token(access_token: str) -> Tuple[JWTData, Optional[float]]:
+    """
+    Проверка подписи и срока токена.
+    :return: Данные токена и exp (unix time).
+    """
+    try:
+        payload = jwt.decode(token=access_token, key=JWT_SECRET, algorithms=[JWY_ALGORITHM])
+    except JWTError:
+        raise InvalidTokenException
+    return JWTData(**payload), payload.get('exp')
+
+
+class VerifiedTokenCache:
+    """
+    LRU проверенных токенов: sha256 токена -> (exp, JWTData). Сессия присылает одну и ту же
+    cookie сотни раз, подпись проверяется один раз. Запись живет не дольше exp токена,
+    токены без exp и неверные токены не кэшируются.
+    """
+
+    def __init__(self, max_size: int = JWT_CACHE_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self._data: 'OrderedDict[bytes, Tuple[float, JWTData]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def decode(self, access_token: str) -> JWTData:
+        key = hashlib.sha256(access_token.encode()).digest()
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, data = item
+            if expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return data
+            del self._data[key]
+
+        self.misses += 1
+        data, expires_at = decode_token(access_token)
+        if expires_at is not None and self.max_size > 0:
+            self._data[key] = (expires_at, data)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 4) if requests else None,
+            'evictions': self.evictions,
+        }
+
+
+token_cache = VerifiedTokenCache()
+
+
 async def _decode_jwt_data(
         access_token: Optional[str] = Cookie(default=None, alias='access_token')
 ) -> Union[JWTData, None]:
 
     if not access_token:
         return None
-    try:
-        payload = jwt.decode(token=access_token, key=JWT_SECRET, algorithms=[JWY_ALGORITHM])
-    except JWTError:
-        raise InvalidTokenException
-    return JWTData(**payload)
+    return token_cache.decode(access_token)
 
 
 async def decode_jwt_data(token: Union[JWTData, None] = Depends(_decode_jwt_data)) -> JWTData:
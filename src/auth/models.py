@@ -1,9 +1,12 @@
 from datetime import datetime
 
-from sqlalchemy import String, Boolean, Column, Integer, TIMESTAMP, ForeignKey, LargeBinary
+from sqlalchemy import String, Boolean, Column, Integer, TIMESTAMP, ForeignKey, LargeBinary, Index, DDL, event
 from sqlalchemy.orm import relationship
 
 from src.db import Base
+from src.events import EVENTS_CHANNEL
+
+USERS_CHANNEL = 'users'
 
 
 class User(Base):
@@ -22,12 +25,43 @@ class User(Base):
     ratings = relationship('Rating', back_populates='user')
 
 
+# Изменение или удаление пользователя сбрасывает его в кэшах всех воркеров (src/auth/user_cache.py)
+USER_NOTIFY_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION user_changed_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{EVENTS_CHANNEL}', json_build_object(
+            'channel', '{USERS_CHANNEL}',
+            'event', 'changed',
+            'data', json_build_object('id', OLD.id)
+        )::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER user_changed
+    AFTER UPDATE OR DELETE ON "user"
+    FOR EACH ROW EXECUTE FUNCTION user_changed_notify()
+    """,
+]
+for statement in USER_NOTIFY_DDL:
+    event.listen(User.__table__, 'after_create', DDL(statement))
+
+
 class AuthRefreshToken(Base):
+    """
+    Хранится только sha256 токена: поиск по уникальному индексу фиксированной длины,
+    утечка таблицы не дает рабочих токенов. Истекшие строки удаляются фоновой задачей.
+    """
     __tablename__ = 'auth_refresh_token'
+    __table_args__ = (
+        Index('ix_auth_refresh_token_user_id_expires_at', 'user_id', 'expires_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    refresh_token = Column(String, nullable=False)
+    token_hash = Column(LargeBinary(32), unique=True, index=True, nullable=False)
     user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
-    expires_at = Column(TIMESTAMP, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
     created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
     updated_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
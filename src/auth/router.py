@@ -1,6 +1,6 @@
 from typing import Optional, Dict
 
-from fastapi import APIRouter, Depends, status, Response, Cookie
+from fastapi import APIRouter, Depends, status, Response, Cookie, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .jwt import decode_jwt_data, create_access_token
@@ -11,11 +11,12 @@ from .service import (
     authenticate_user,
     create_refresh_token,
     expire_refresh_token,
-    valid_refresh_token,
-    get_user_from_refresh_token,
+    rotate_refresh_token,
     user_books,
 )
+from ..books.schema import BookBase
 from ..db import get_async_session
+from ..pagination import Page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter(
     prefix='/auth',
@@ -87,13 +88,8 @@ async def refresh_tokens(
         session: AsyncSession = Depends(get_async_session),
         user_refresh_token: Optional[str] = Cookie(default=None, alias='refresh_token')
 ):
-    refresh_token = await valid_refresh_token(user_refresh_token, session)
-
-    user = await get_user_from_refresh_token(user_refresh_token, session)
-    await expire_refresh_token(user_refresh_token, session)
-
+    user, new_refresh_token = await rotate_refresh_token(user_refresh_token, session)
     new_access_token = create_access_token(user)
-    new_refresh_token = await create_refresh_token(refresh_token.user_id, session)
 
     response.set_cookie(
         key='access_token',
@@ -133,10 +129,13 @@ async def user_logout(
 
 @router.get(
     '/user/books',
+    response_model=Page[BookBase],
     status_code=status.HTTP_200_OK)
 async def get_user_books(
+        limmit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        with_total: bool = False,
         jwt_data: JWTData = Depends(decode_jwt_data),
         session: AsyncSession = Depends(get_async_session)
 ):
-    books = await user_books(jwt_data.id, session)
-    return books
+    return await user_books(jwt_data.id, session, limmit, cursor, with_total)
@@ -1,5 +1,6 @@
 import re
 from datetime import datetime
+from typing import Optional
 
 from pydantic import BaseModel, EmailStr, Field, validator
 # from src.books.schema import BooksSchema
@@ -11,6 +12,8 @@ class JWTData(BaseModel):
 
     class Config:
         orm_mode = True
+        # Экземпляр из кэша проверенных токенов общий для всех запросов с этим токеном
+        allow_mutation = False
 
 
 class UserCreate(BaseModel):
@@ -49,6 +52,21 @@ class UserResponse(BaseModel):
         orm_mode = True
 
 
+class CurrentUser(BaseModel):
+    """
+    Пользователь запроса. Без пароля и связей, поэтому хранится в кэше и не привязан к сессии.
+    От get_current_user_claims заполнены только id и is_admin из токена.
+    """
+    id: int
+    is_admin: bool = False
+    is_active: bool = True
+    email: Optional[str] = None
+    username: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
 class TokenResponse(BaseModel):
     access_token: str
     refresh_token: str
@@ -1,24 +1,32 @@
+import asyncio
+import logging
 from datetime import datetime, timedelta
-from typing import Union, List
+from typing import Union, Optional, Dict, Any, Tuple
 
-from sqlalchemy import select, or_
+from sqlalchemy import select, insert, delete, literal, cast, or_, LargeBinary
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.books.models import Book
+from src.config import REFRESH_TOKENS_PER_USER, REFRESH_TOKEN_PURGE_SECONDS, REFRESH_TOKEN_PURGE_BATCH
 from src.exceptions import UserDataTakenException, InvalidCredentialsException, InvalidRefreshTokenException
+from src.pagination import paginate, DEFAULT_PAGE_SIZE
 from .models import User, AuthRefreshToken
 from .schema import UserCreate, UserAuth
-from .utils import hash_password, check_password, generate_alphanum_random_string
+from .utils import password_hasher, generate_alphanum_random_string, hash_refresh_token
+
+logger = logging.getLogger(__name__)
 
 
 async def create_user(new_user_data: UserCreate, session: AsyncSession) -> User:
     if await check_email_and_username(new_user_data, session):
         raise UserDataTakenException
+    # Соединение возвращается в пул на время хеширования
+    await session.commit()
 
     user = User(
         email=new_user_data.email,
         username=new_user_data.username,
-        hashed_password=hash_password(new_user_data.password)
+        hashed_password=await password_hasher.hash(new_user_data.password)
     )
 
     session.add(user)
@@ -36,13 +44,17 @@ async def get_user(user_id: int, session: AsyncSession) -> User:
     return await session.scalar(query)
 
 
-async def user_books(user_id: int, session: AsyncSession) -> List[Book]:
+async def user_books(
+        user_id: int,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+) -> Dict[str, Any]:
     query = select(Book)\
         .filter(Book.users.any(id=user_id))
 
-    res = await session.execute(query)
-
-    return res.scalars().all()
+    return await paginate(query, session, [Book.id], limit, cursor, with_total)
 
 
 async def authenticate_user(user_data: UserAuth, session: AsyncSession) -> User:
@@ -51,21 +63,41 @@ async def authenticate_user(user_data: UserAuth, session: AsyncSession) -> User:
 
     if not user:
         raise InvalidCredentialsException
+    # Соединение возвращается в пул на время проверки пароля, при наплыве входов
+    # оно нужнее запросам каталога
+    await session.commit()
 
-    if not check_password(user_data.password, user.hashed_password):
+    if not await password_hasher.check(user_data.password, user.hashed_password):
         raise InvalidCredentialsException
 
     return user
 
 
 async def create_refresh_token(user_id: int, session: AsyncSession) -> str:
+    """
+    Новый refresh-токен. Истекшие токены пользователя и самые старые сверх
+    REFRESH_TOKENS_PER_USER удаляются в той же транзакции.
+    :return: Токен, в БД сохраняется только его хеш.
+    """
     refresh_token = generate_alphanum_random_string()
+    now = datetime.utcnow()
     token = AuthRefreshToken(
-        refresh_token=refresh_token,
+        token_hash=hash_refresh_token(refresh_token),
         user_id=user_id,
-        expires_at=datetime.utcnow() + timedelta(minutes=1440)
+        expires_at=now + timedelta(minutes=1440)
     )
     session.add(token)
+    await session.flush()
+
+    newest = select(AuthRefreshToken.id) \
+        .where(AuthRefreshToken.user_id == user_id, AuthRefreshToken.expires_at > now) \
+        .order_by(AuthRefreshToken.expires_at.desc()) \
+        .limit(REFRESH_TOKENS_PER_USER)
+    await session.execute(
+        delete(AuthRefreshToken)
+        .where(AuthRefreshToken.user_id == user_id, AuthRefreshToken.id.not_in(newest))
+        .execution_options(synchronize_session=False)
+    )
     await session.commit()
     return refresh_token
 
@@ -74,29 +106,95 @@ async def get_refresh_token(
         user_refresh_token: str,
         session: AsyncSession
 ) -> Union[AuthRefreshToken, None]:
-    query = select(AuthRefreshToken).where(AuthRefreshToken.refresh_token == user_refresh_token)
+    if not user_refresh_token:
+        return None
+    query = select(AuthRefreshToken).where(AuthRefreshToken.token_hash == hash_refresh_token(user_refresh_token))
     return await session.scalar(query)
 
 
 async def expire_refresh_token(user_refresh_token: str, session: AsyncSession) -> None:
-    refresh_token = await get_refresh_token(user_refresh_token, session)
-    if not refresh_token:
+    if not user_refresh_token:
+        raise InvalidRefreshTokenException
+    res = await session.execute(
+        delete(AuthRefreshToken)
+        .where(AuthRefreshToken.token_hash == hash_refresh_token(user_refresh_token))
+        .returning(AuthRefreshToken.id)
+        .execution_options(synchronize_session=False)
+    )
+    if res.first() is None:
+        await session.rollback()
         raise InvalidRefreshTokenException
-    refresh_token.expires_at = datetime.utcnow() - timedelta(hours=24)
     await session.commit()
 
 
-async def valid_refresh_token(user_refresh_token: str, session: AsyncSession) -> AuthRefreshToken:
-    db_refresh_token = await get_refresh_token(user_refresh_token, session)
-    if not db_refresh_token:
-        raise InvalidRefreshTokenException
-    if db_refresh_token.expires_at <= datetime.utcnow():
+async def purge_expired_refresh_tokens(session: AsyncSession, batch_size: int = REFRESH_TOKEN_PURGE_BATCH) -> int:
+    """
+    Удаление истекших токенов пачками по индексу expires_at, каждая пачка - короткая транзакция.
+    SKIP LOCKED позволяет воркерам чистить таблицу одновременно, не ожидая друг друга.
+    :return: Кол-во удаленных токенов.
+    """
+    expired = select(AuthRefreshToken.id) \
+        .where(AuthRefreshToken.expires_at <= datetime.utcnow()) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True)
+    purged = 0
+    while True:
+        res = await session.execute(
+            delete(AuthRefreshToken)
+            .where(AuthRefreshToken.id.in_(expired.scalar_subquery()))
+            .returning(AuthRefreshToken.id)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = len(res.all())
+        await session.commit()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+        await asyncio.sleep(0)
+
+
+async def purge_refresh_tokens_periodically(session_maker, interval: Optional[int] = None) -> None:
+    interval = REFRESH_TOKEN_PURGE_SECONDS if interval is None else interval
+    while interval > 0:
+        try:
+            async with session_maker() as session:
+                purged = await purge_expired_refresh_tokens(session)
+            if purged:
+                logger.info('Purged %s expired refresh tokens.', purged)
+        except Exception:
+            logger.exception('Refresh token purge failed.')
+        await asyncio.sleep(interval)
+
+
+async def rotate_refresh_token(user_refresh_token: str, session: AsyncSession) -> Tuple[User, str]:
+    """
+    Замена refresh-токена одним запросом: DELETE действующего токена, INSERT нового для того же
+    пользователя и выборка пользователя. Из двух параллельных запросов с одним токеном строку
+    удалит только первый, второй после его коммита ничего не найдет и получит ошибку.
+    :return: Пользователь и новый токен.
+    """
+    if not user_refresh_token:
         raise InvalidRefreshTokenException
-    return db_refresh_token
-
 
-async def get_user_from_refresh_token(user_refresh_token: str, session: AsyncSession) -> User:
-    refresh_token = await valid_refresh_token(user_refresh_token, session)
-    if not refresh_token:
+    refresh_token = generate_alphanum_random_string()
+    now = datetime.utcnow()
+    rotated = delete(AuthRefreshToken.__table__) \
+        .where(AuthRefreshToken.token_hash == hash_refresh_token(user_refresh_token),
+               AuthRefreshToken.expires_at > now) \
+        .returning(AuthRefreshToken.user_id) \
+        .cte('rotated')
+    issued = insert(AuthRefreshToken.__table__) \
+        .from_select(
+            ['token_hash', 'user_id', 'expires_at', 'created_at', 'updated_at'],
+            select(cast(literal(hash_refresh_token(refresh_token)), LargeBinary), rotated.c.user_id,
+                   literal(now + timedelta(minutes=1440)), literal(now), literal(now))
+        ) \
+        .returning(AuthRefreshToken.user_id) \
+        .cte('issued')
+
+    user = await session.scalar(select(User).join(issued, User.id == issued.c.user_id))
+    if user is None:
+        await session.rollback()
         raise InvalidRefreshTokenException
-    return await get_user(refresh_token.user_id, session)
+    await session.commit()
+    return user, refresh_token
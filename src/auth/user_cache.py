@@ -0,0 +1,58 @@
+from typing import Any, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache import MemoryCacheBackend
+from src.config import USER_CACHE_TTL, USER_CACHE_MAX_SIZE
+from src.events import notification_listener, RESYNC_EVENT
+from src.metrics import register_metrics
+from .models import USERS_CHANNEL
+from .schema import CurrentUser
+from .service import get_user
+
+
+class UserCache:
+    """
+    Пользователи по id в памяти процесса, с TTL. Сбрасываются триггером user_changed через
+    NOTIFY на всех воркерах; TTL ограничивает устаревание, если уведомление потеряно.
+    """
+
+    def __init__(self, ttl: int = USER_CACHE_TTL, max_size: int = USER_CACHE_MAX_SIZE) -> None:
+        self._backend = MemoryCacheBackend(ttl=ttl, max_size=max_size)
+        # Растет при каждом сбросе: пользователь, прочитанный из БД до сброса, в кэш не попадает
+        self._generation = 0
+
+    async def get(self, user_id: int, session: AsyncSession) -> Optional[CurrentUser]:
+        value = await self._backend.get(str(user_id))
+        if value is not None:
+            return CurrentUser.parse_raw(value)
+
+        generation = self._generation
+        user = await get_user(user_id, session)
+        if user is None:
+            return None
+        current_user = CurrentUser.from_orm(user)
+        if generation == self._generation:
+            await self._backend.set(str(user_id), current_user.json())
+        return current_user
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """
+        :param user_id: None - сбросить всех.
+        """
+        self._generation += 1
+        if user_id is None:
+            self._backend.clear()
+        else:
+            self._backend.discard(str(user_id))
+
+    def on_notification(self, event: str, data: Dict[str, Any]) -> None:
+        self.invalidate(None if event == RESYNC_EVENT else data['id'])
+
+    async def stats(self) -> Dict[str, Any]:
+        return await self._backend.stats()
+
+
+user_cache = UserCache()
+notification_listener.add_handler(USERS_CHANNEL, user_cache.on_notification)
+register_metrics('user_cache', user_cache.stats)
@@ -1,6 +1,14 @@
+import asyncio
 import bcrypt
-import random
+import hashlib
+import secrets
 import string
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from src.config import PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+from src.exceptions import ServiceOverloadedException
+from src.metrics import register_metrics
 
 
 def hash_password(password: str) -> bytes:
@@ -14,6 +22,95 @@ def check_password(password: str, password_in_db: bytes) -> bool:
     return bcrypt.checkpw(password_bytes, password_in_db)
 
 
+class PasswordHasher:
+    """
+    bcrypt в отдельном пуле, чтобы хеширование (~250 мс) не блокировало цикл событий.
+    Семафор пропускает в пул не больше workers задач, остальные ждут в цикле событий:
+    запрос, отмененный во время ожидания, не оставляет работы в пуле. Если ожидающих
+    больше max_pending, запрос сразу получает 503.
+    """
+
+    def __init__(
+            self,
+            executor_type: str = PASSWORD_HASH_EXECUTOR,
+            workers: int = PASSWORD_HASH_WORKERS,
+            max_pending: int = PASSWORD_HASH_MAX_PENDING,
+    ) -> None:
+        self.executor_type = executor_type
+        self.workers = max(workers, 1)
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        # Создается при первом вызове, внутри цикла событий приложения
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ServiceOverloadedException
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        self.pending += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.pending -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> bytes:
+        return await self._run(hash_password, password)
+
+    async def check(self, password: str, password_in_db: bytes) -> bool:
+        return await self._run(check_password, password, password_in_db)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'executor': self.executor_type,
+            'workers': self.workers,
+            'pending': self.pending,
+            'running': self.running,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+
+password_hasher = PasswordHasher()
+register_metrics('password_hash', password_hasher.stats)
+
+
 def generate_alphanum_random_string(length: int = 25) -> str:
     letters_and_digits = string.ascii_letters + string.digits
-    return ''.join(random.choices(letters_and_digits, k=length))
+    return ''.join(secrets.choice(letters_and_digits) for _ in range(length))
+
+
+def hash_refresh_token(refresh_token: str) -> bytes:
+    """
+    Токен случайный (~149 бит), поэтому достаточно быстрого sha256 без соли:
+    одинаковый токен дает одинаковый хеш для поиска по индексу.
+    """
+    return hashlib.sha256(refresh_token.encode()).digest()
@@ -0,0 +1,78 @@
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import column, select, table, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.events import EVENTS_CHANNEL
+
+# Больше книг в одной подписке - 422, подписка на весь каталог не нужна ни одному экрану
+MAX_SUBSCRIBED_BOOKS = 200
+
+AVAILABILITY_EVENT = 'availability'
+
+
+def book_channel(book_id: int) -> str:
+    return f'book:{book_id}'
+
+
+# Изменения available/quantity публикуются триггером, а не из кода сервиса: событие
+# получают выдача, возврат, пакетная циркуляция, удержания резерваций и правка книги,
+# и только после коммита. version позволяет клиенту отбросить событие старее снимка.
+AVAILABILITY_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION book_availability_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{EVENTS_CHANNEL}', json_build_object(
+            'channel', '{book_channel('')}' || NEW.id,
+            'event', '{AVAILABILITY_EVENT}',
+            'data', json_build_object(
+                'book_id', NEW.id,
+                'available', NEW.available,
+                'quantity', NEW.quantity,
+                'available_delta', NEW.available - OLD.available,
+                'quantity_delta', NEW.quantity - OLD.quantity,
+                'version', NEW.version
+            )
+        )::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER book_availability_update
+    AFTER UPDATE OF available, quantity ON book
+    FOR EACH ROW WHEN (OLD.available IS DISTINCT FROM NEW.available OR OLD.quantity IS DISTINCT FROM NEW.quantity)
+    EXECUTE FUNCTION book_availability_notify()
+    """,
+]
+
+_book = table('book', column('id'), column('available'), column('quantity'), column('version'))
+
+
+async def get_availability(book_ids: List[int], session: AsyncSession) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Снимок наличия книг для начала потока событий. Соединение возвращается в пул сразу,
+    чтобы простаивающие подписчики не держали соединения БД.
+    :return: События availability с нулевыми дельтами.
+    """
+    try:
+        res = await session.execute(
+            select(_book.c.id, _book.c.available, _book.c.quantity, _book.c.version)
+            .where(_book.c.id == any_(bindparam('book_ids', list(book_ids), type_=ARRAY(Integer))))
+            .order_by(_book.c.id)
+        )
+        rows = res.all()
+    finally:
+        await session.close()
+    return [
+        (AVAILABILITY_EVENT, {
+            'book_id': book_id,
+            'available': available,
+            'quantity': quantity,
+            'available_delta': 0,
+            'quantity_delta': 0,
+            'version': version,
+        })
+        for book_id, available, quantity, version in rows
+    ]
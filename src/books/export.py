@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, Sequence
+
+from sqlalchemy import select, func
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import EXPORT_BATCH_SIZE
+from .models import Book, Author, Tag, book_author, book_tag
+
+EXPORT_FIELDS = [
+    'id', 'title', 'year_published', 'description', 'quantity', 'available',
+    'avg_rating', 'rating_count', 'count_comments', 'authors', 'tags',
+]
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_query():
+    """
+    Плоские строки каталога: колонки книги, счетчики и массивы имен авторов и тегов.
+    Без ORM-объектов и relationship, чтобы строки не накапливались в identity map.
+    """
+    authors = select(func.array_agg(Author.name)) \
+        .join(book_author, book_author.c.author_id == Author.id) \
+        .where(book_author.c.book_id == Book.id) \
+        .scalar_subquery()
+    tags = select(func.array_agg(Tag.content)) \
+        .join(book_tag, book_tag.c.tag_id == Tag.id) \
+        .where(book_tag.c.book_id == Book.id) \
+        .scalar_subquery()
+
+    return select(Book.id, Book.title, Book.year_published, Book.description,
+                  Book.quantity, Book.available,
+                  Book.rating_sum, Book.rating_count, Book.comment_count,
+                  authors.label('authors'), tags.label('tags')) \
+        .order_by(Book.id)
+
+
+def _export_item(row: Row) -> Dict[str, Any]:
+    return {
+        'id': row.id,
+        'title': row.title,
+        'year_published': row.year_published,
+        'description': row.description,
+        'quantity': row.quantity,
+        'available': row.available,
+        'avg_rating': row.rating_sum / row.rating_count if row.rating_count else None,
+        'rating_count': row.rating_count,
+        'count_comments': row.comment_count,
+        'authors': row.authors or [],
+        'tags': row.tags or [],
+    }
+
+
+def _ndjson_chunk(rows: Sequence[Row]) -> str:
+    return ''.join(json.dumps(_export_item(row), ensure_ascii=False) + '\n' for row in rows)
+
+
+def _csv_chunk(rows: Sequence[Row], header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        item = _export_item(row)
+        item['authors'] = '; '.join(item['authors'])
+        item['tags'] = '; '.join(item['tags'])
+        writer.writerow([item[field] for field in EXPORT_FIELDS])
+    return buffer.getvalue()
+
+
+async def stream_catalog(
+        session: AsyncSession,
+        file_format: str = 'ndjson',
+        batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[str]:
+    """
+    Выгрузка всего каталога через серверный курсор: в памяти не больше одной пачки строк.
+    :param file_format: ndjson или csv.
+    :param batch_size: Кол-во строк, забираемых из курсора за раз.
+    """
+    if file_format == 'csv':
+        yield _csv_chunk([], header=True)
+
+    res = await session.stream(export_query().execution_options(yield_per=batch_size))
+    async for rows in res.partitions():
+        if file_format == 'csv':
+            yield _csv_chunk(rows)
+        else:
+            yield _ndjson_chunk(rows)
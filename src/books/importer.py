@@ -0,0 +1,287 @@
+"""
+Массовый импорт каталога из CSV или JSON Lines.
+
+    python -m src.books.importer books.csv
+    python -m src.books.importer books.jsonl --format ndjson
+
+CSV: колонки title, year_published, description, quantity, authors, tags;
+авторы и теги - имена через ';'. JSON Lines: объект на строку, authors и tags - списки имен.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TextIO
+
+from pydantic import ValidationError
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, func, any_, bindparam, String
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import src.books.schema as book_schema
+from src.config import IMPORT_BATCH_SIZE
+from src.events import notify
+from .models import Author, Tag, book_author, book_tag
+from .suggest import index_message, notify_rebuild
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# В ответе только первые ошибки, остальные учитываются в failed
+MAX_REPORTED_ERRORS = 1000
+
+# Больше новых записей - вместо уведомлений о каждой индексы автодополнения всех воркеров
+# перестраиваются целиком
+SUGGEST_REBUILD_THRESHOLD = 10000
+
+BOOK_COLUMNS = ['id', 'title', 'year_published', 'description', 'quantity', 'available']
+
+
+def read_csv(file: TextIO) -> Iterator[Tuple[int, Any]]:
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(file: TextIO) -> Iterator[Tuple[int, Any]]:
+    for line_num, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as e:
+            yield line_num, e
+
+
+def read_records(file: TextIO, file_format: str = 'csv') -> Iterator[Tuple[int, Any]]:
+    """
+    :return: (номер строки, словарь полей или ошибка разбора)
+    """
+    return read_ndjson(file) if file_format == 'ndjson' else read_csv(file)
+
+
+def _validation_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return '; '.join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+
+def _batches(records: Iterable[Tuple[int, Any]], size: int) -> Iterator[List[Tuple[int, Any]]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_batch(
+        batches: Iterator[List[Tuple[int, Any]]],
+) -> Optional[Tuple[List[int], List[book_schema.BookImportSchema], List[Tuple[int, Exception]]]]:
+    """
+    Следующая пачка: чтение файла, разбор и валидация. Блокирующая, вызывается в пуле потоков.
+    :return: Номера строк, книги, ошибки (номер строки, ошибка) или None, если записи кончились.
+    """
+    batch = next(batches, None)
+    if batch is None:
+        return None
+    lines, items, errors = [], [], []
+    for line, data in batch:
+        if isinstance(data, Exception):
+            errors.append((line, data))
+            continue
+        try:
+            items.append(book_schema.BookImportSchema.parse_obj(data))
+            lines.append(line)
+        except (ValidationError, TypeError) as e:
+            errors.append((line, e))
+    return lines, items, errors
+
+
+async def _resolve_names(
+        model: Any,
+        column: Any,
+        names: Iterable[str],
+        known: Dict[str, int],
+        session: AsyncSession,
+) -> List[Tuple[int, str]]:
+    """
+    id авторов или тегов по именам: одним SELECT по массиву имен, недостающие - одним
+    INSERT ... ON CONFLICT DO NOTHING RETURNING. Имена, которые тем временем создал
+    параллельный импорт, выбираются повторно.
+    :param known: Уже найденные имена, дополняется.
+    :return: Созданные записи (id, имя).
+    """
+    missing = sorted({name for name in names if name not in known})
+    if not missing:
+        return []
+
+    async def select_known(names: List[str]) -> None:
+        names_param = bindparam('names', names, type_=ARRAY(String))
+        res = await session.execute(select(column, model.id).where(column == any_(names_param)))
+        for name, obj_id in res:
+            known[name] = obj_id
+
+    await select_known(missing)
+    new = [name for name in missing if name not in known]
+    if not new:
+        return []
+    # Один INSERT со списком VALUES в Core: ORM ждет строку RETURNING на каждую вставку,
+    # а ON CONFLICT DO NOTHING пропускает занятые имена
+    table = model.__table__
+    statement = pg_insert(table) \
+        .values([{column.key: name} for name in new]) \
+        .on_conflict_do_nothing(index_elements=[table.c[column.key]]) \
+        .returning(table.c.id, table.c[column.key])
+    created = (await session.execute(statement)).all()
+    for obj_id, name in created:
+        known[name] = obj_id
+
+    taken = [name for name in new if name not in known]
+    if taken:
+        await select_known(taken)
+    return created
+
+
+async def _driver_connection(session: AsyncSession) -> Any:
+    """
+    Соединение asyncpg текущей транзакции сессии, для COPY.
+    """
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    return raw_connection.driver_connection
+
+
+async def _copy_books(items: List[book_schema.BookImportSchema], session: AsyncSession) -> List[int]:
+    """
+    COPY книг с заранее выделенными из последовательности id, затем COPY связей с авторами и тегами.
+    Поисковый вектор и версии заполняются триггерами.
+    """
+    res = await session.execute(
+        select(func.nextval(func.pg_get_serial_sequence('book', 'id')))
+        .select_from(func.generate_series(1, len(items)))
+    )
+    ids = res.scalars().all()
+
+    driver = await _driver_connection(session)
+    await driver.copy_records_to_table(
+        'book',
+        columns=BOOK_COLUMNS,
+        records=[(book_id, item.title, item.year_published, item.description, item.quantity, item.quantity)
+                 for book_id, item in zip(ids, items)],
+    )
+    return ids
+
+
+async def _copy_links(table: Any, column: str, links: List[Tuple[int, int]], session: AsyncSession) -> None:
+    if not links:
+        return
+    driver = await _driver_connection(session)
+    await driver.copy_records_to_table(table.name, columns=['book_id', column], records=links)
+
+
+async def import_books(
+        records: Iterable[Tuple[int, Any]],
+        session: AsyncSession,
+        batch_size: int = IMPORT_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Импорт книг пачками, каждая пачка - отдельная транзакция.
+    Строки с ошибками валидации пропускаются, ошибка БД отменяет всю пачку.
+    :param records: (номер строки, словарь полей) - из read_records или готовые данные.
+    :return: Словарь для схемы ImportResultSchema.
+    """
+    result = {'imported': 0, 'authors_created': 0, 'tags_created': 0, 'failed': 0, 'errors': []}
+    authors: Dict[str, int] = {}
+    tags: Dict[str, int] = {}
+    suggested = 0
+
+    def fail(line: int, error: Any) -> None:
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line, 'error': _validation_message(error)})
+
+    batches = _batches(records, batch_size)
+    while True:
+        parsed = await run_in_threadpool(_parse_batch, batches)
+        if parsed is None:
+            break
+        lines, items, errors = parsed
+        for line, error in errors:
+            fail(line, error)
+        if not items:
+            continue
+
+        try:
+            new_authors = await _resolve_names(Author, Author.name,
+                                               (name for item in items for name in item.authors),
+                                               authors, session)
+            new_tags = await _resolve_names(Tag, Tag.content,
+                                            (name for item in items for name in item.tags),
+                                            tags, session)
+            ids = await _copy_books(items, session)
+            await _copy_links(book_author, 'author_id',
+                              [(book_id, author_id) for book_id, item in zip(ids, items)
+                               for author_id in {authors[name] for name in item.authors}],
+                              session)
+            await _copy_links(book_tag, 'tag_id',
+                              [(book_id, tag_id) for book_id, item in zip(ids, items)
+                               for tag_id in {tags[name] for name in item.tags}],
+                              session)
+            entries = len(ids) + len(new_authors) + len(new_tags)
+            if suggested + entries <= SUGGEST_REBUILD_THRESHOLD:
+                await notify([index_message('book', book_id, item.title) for book_id, item in zip(ids, items)]
+                             + [index_message('author', obj_id, name) for obj_id, name in new_authors]
+                             + [index_message('tag', obj_id, name) for obj_id, name in new_tags],
+                             session)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.exception('Import batch failed.')
+            # Имена, созданные в отмененной транзакции, больше не существуют
+            authors.clear()
+            tags.clear()
+            for line in lines:
+                fail(line, e)
+            continue
+
+        result['imported'] += len(ids)
+        result['authors_created'] += len(new_authors)
+        result['tags_created'] += len(new_tags)
+        suggested += entries
+
+    if suggested > SUGGEST_REBUILD_THRESHOLD:
+        await notify_rebuild(session)
+        await session.commit()
+
+    return result
+
+
+async def main(path: str, file_format: str, batch_size: int) -> None:
+    from src.db import async_session_maker
+
+    with open(path, encoding='utf-8', newline='') as file:
+        async with async_session_maker() as session:
+            result = await import_books(read_records(file, file_format), session, batch_size)
+
+    for error in result['errors']:
+        print(f"line {error['line']}: {error['error']}")
+    print(f"imported: {result['imported']}, authors created: {result['authors_created']}, "
+          f"tags created: {result['tags_created']}, failed: {result['failed']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk catalog import.')
+    parser.add_argument('path')
+    parser.add_argument('--format', dest='file_format', choices=IMPORT_FORMATS, default=None,
+                        help='csv or ndjson, by default from file extension')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.file_format or ('ndjson' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    asyncio.run(main(args.path, file_format, args.batch_size))
@@ -1,11 +1,17 @@
 from datetime import datetime
+from typing import Optional
 
-from sqlalchemy import Integer, String, ForeignKey, Table, Column, TIMESTAMP
-from sqlalchemy.orm import relationship, query_expression
+from sqlalchemy import Integer, BigInteger, String, ForeignKey, Table, Column, TIMESTAMP, Index, DDL, event, text, \
+    UniqueConstraint
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, query_expression, deferred
 
 from src.auth.models import User
 
 from src.db import Base
+from .search import SEARCH_DDL, TRGM_DDL
+from .versions import VERSION_DDL
+from .availability import AVAILABILITY_DDL
 
 # Many-to-many table books-authors
 book_author = Table(
@@ -33,17 +39,36 @@ book_tag = Table(
     Column('tag_id', ForeignKey('tag.id'), primary_key=True),
 )
 
+# Catalog-wide change counter, split into shards, maintained by triggers from src/books/versions.py
+catalog_version = Table(
+    'catalog_version',
+    Base.metadata,
+    Column('shard', Integer, primary_key=True, autoincrement=False),
+    Column('value', BigInteger, default=0, server_default='0', nullable=False),
+)
+
 
 class Author(Base):
     __tablename__ = 'author'
+    __table_args__ = (
+        Index('ix_author_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Import resolves authors by name with INSERT ... ON CONFLICT
+        Index('uq_author_name', 'name', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     books = relationship('Book', secondary='book_author', back_populates='authors')
 
+    search_rank = query_expression()
+
 
 class Book(Base):
     __tablename__ = 'book'
+    __table_args__ = (
+        Index('ix_book_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_book_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -52,16 +77,36 @@ class Book(Base):
     quantity = Column(Integer, default=0, nullable=False)
     available = Column(Integer, default=0, nullable=False)
 
+    # Denormalized counters, maintained by rating/comment writes
+    rating_sum = Column(Integer, default=0, server_default='0', nullable=False)
+    rating_count = Column(Integer, default=0, server_default='0', nullable=False)
+    comment_count = Column(Integer, default=0, server_default='0', nullable=False)
+
+    # Full-text search document, maintained by triggers from src/books/search.py
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
+    search_rank = query_expression()
+
+    # Version for ETag, bumped by triggers from src/books/versions.py
+    version = Column(Integer, default=0, server_default='0', nullable=False)
+
     authors = relationship('Author', secondary='book_author', back_populates='books')
     users = relationship('User', secondary='book_user', back_populates='books')
 
     comments = relationship('Comment', back_populates='book')
-    count_comments = query_expression()
 
     tags = relationship('Tag', secondary='book_tag', back_populates='books')
 
     ratings = relationship('Rating', back_populates='book')
-    avg_rating = query_expression()
+
+    @property
+    def avg_rating(self) -> Optional[float]:
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def count_comments(self) -> int:
+        return self.comment_count or 0
 
 
 class Comment(Base):
@@ -75,12 +120,15 @@ class Comment(Base):
     user_id = Column(Integer, ForeignKey('user.id'))
     user = relationship('User', back_populates='comments')
 
-    book_id = Column(Integer, ForeignKey('book.id'))
+    book_id = Column(Integer, ForeignKey('book.id'), index=True)
     book = relationship('Book', back_populates='comments')
 
 
 class Tag(Base):
     __tablename__ = 'tag'
+    __table_args__ = (
+        Index('uq_tag_content', 'content', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String(100), nullable=False)
@@ -90,6 +138,10 @@ class Tag(Base):
 
 class Rating(Base):
     __tablename__ = 'rating'
+    __table_args__ = (
+        # One rating per user and book, target of the upsert in _set_rating
+        UniqueConstraint('user_id', 'book_id', name='uq_rating_user_book'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     value = Column(Integer)
@@ -97,5 +149,36 @@ class Rating(Base):
     user_id = Column(Integer, ForeignKey('user.id'))
     user = relationship('User', back_populates='ratings')
 
-    book_id = Column(Integer, ForeignKey('book.id'))
+    book_id = Column(Integer, ForeignKey('book.id'), index=True)
     book = relationship('Book', back_populates='ratings')
+
+
+class Reservation(Base):
+    __tablename__ = 'reservation'
+    __table_args__ = (
+        # Queue head lookup and at most one active reservation per user and book
+        Index('ix_reservation_book_waiting', 'book_id', 'id', postgresql_where=text("status = 'waiting'")),
+        Index('ix_reservation_held_until', 'held_until', postgresql_where=text("status = 'held'")),
+        Index('uq_reservation_active', 'book_id', 'user_id', unique=True,
+              postgresql_where=text("status IN ('waiting', 'held')")),
+    )
+
+    WAITING = 'waiting'
+    HELD = 'held'
+    FULFILLED = 'fulfilled'
+    EXPIRED = 'expired'
+    CANCELLED = 'cancelled'
+
+    id = Column(Integer, primary_key=True, index=True)
+    book_id = Column(Integer, ForeignKey('book.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    status = Column(String(20), default=WAITING, server_default=WAITING, nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+    # Until when a returned copy is kept for the user, set when the reservation is held
+    held_until = Column(TIMESTAMP, nullable=True)
+
+
+event.listen(Base.metadata, 'before_create', DDL(TRGM_DDL))
+for statement in SEARCH_DDL + VERSION_DDL + AVAILABILITY_DDL:
+    # DDL подставляет %(table)s и т.п., знак % в самом SQL экранируется
+    event.listen(Base.metadata, 'after_create', DDL(statement.replace('%', '%%')))
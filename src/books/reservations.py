@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, func, any_, bindparam, cast, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.auth.schema import CurrentUser
+from src.config import RESERVATION_HOLD_SECONDS, RESERVATION_RESCAN_SECONDS
+from src.events import notify
+from src.exceptions import ObjNotFoundException
+from .models import Book, Reservation
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+def _ids_param(name: str, ids: List[int]) -> Any:
+    # Тип массива указывается явно: asyncpg не выводит его для unnest($1)
+    return cast(bindparam(name, list(ids), type_=ARRAY(Integer)), ARRAY(Integer))
+
+
+async def assign_holds(book_ids: List[int], session: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Свободные экземпляры книг (available) закрепляются за первыми в очереди одним запросом:
+    резервации переходят в held, available уменьшается на кол-во закрепленных.
+    Вызывается в транзакции, которая уже изменила (и тем самым заблокировала) строки книг.
+    :return: Закрепленные резервации: id, book_id, user_id, held_until.
+    """
+    if not book_ids:
+        return []
+
+    held_until = datetime.utcnow() + timedelta(seconds=RESERVATION_HOLD_SECONDS)
+    queue = select(Reservation.id, Reservation.book_id,
+                   func.row_number().over(partition_by=Reservation.book_id,
+                                          order_by=Reservation.id).label('position')) \
+        .where(Reservation.book_id == any_(_ids_param('hold_book_ids', book_ids)),
+               Reservation.status == Reservation.WAITING) \
+        .cte('queue')
+    granted = select(queue.c.id) \
+        .join(Book, Book.id == queue.c.book_id) \
+        .where(queue.c.position <= Book.available)
+    held = update(Reservation.__table__) \
+        .where(Reservation.id.in_(granted)) \
+        .values(status=Reservation.HELD, held_until=held_until) \
+        .returning(Reservation.id, Reservation.book_id, Reservation.user_id, Reservation.held_until) \
+        .cte('held')
+    taken = select(held.c.book_id, func.count().label('count')) \
+        .group_by(held.c.book_id) \
+        .subquery()
+    take_copies = update(Book.__table__) \
+        .where(Book.id == taken.c.book_id) \
+        .values(available=Book.available - taken.c.count) \
+        .returning(Book.id) \
+        .cte('take_copies')
+
+    res = await session.execute(
+        select(held.c.id, held.c.book_id, held.c.user_id, held.c.held_until)
+        .add_cte(take_copies)
+    )
+    return [dict(row._mapping) for row in res]
+
+
+async def release_copies(counts: Dict[int, int], session: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Экземпляры, освободившиеся от отмененных или просроченных удержаний, передаются следующим
+    в очереди, остальные возвращаются в available.
+    """
+    rows = func.unnest(_ids_param('release_book_ids', list(counts)),
+                       _ids_param('release_counts', list(counts.values()))) \
+        .table_valued('book_id', 'count').render_derived()
+    await session.execute(
+        update(Book.__table__)
+        .where(Book.id == rows.c.book_id)
+        .values(available=Book.available + rows.c.count)
+    )
+    return await assign_holds(list(counts), session)
+
+
+async def notify_holds(holds: List[Dict[str, Any]], session: AsyncSession) -> None:
+    """
+    В транзакции, закрепившей экземпляры: уведомление пользователей (доставляется после коммита
+    на любой воркер) и постановка удержаний в планировщик истечения. Удержание из отмененной
+    транзакции планировщик пропустит по условию status = 'held'.
+    """
+    for hold in holds:
+        hold_scheduler.schedule(hold['id'], hold['held_until'])
+    await notify([(user_channel(hold['user_id']), 'hold', hold) for hold in holds], session)
+
+
+class HoldScheduler:
+    """
+    Истечение удержаний по куче (held_until, id): задача спит до ближайшего срока,
+    а не сканирует таблицу. Устаревшие записи кучи (резервация уже выдана или отменена)
+    отбрасываются условием status = 'held' при истечении.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[datetime, int]] = []
+        self._scheduled: Dict[int, datetime] = {}
+        # Создается в run(), внутри цикла событий приложения
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, reservation_id: int, expires_at: datetime) -> None:
+        if self._scheduled.get(reservation_id) == expires_at:
+            return
+        self._scheduled[reservation_id] = expires_at
+        if self._wakeup is not None and (not self._heap or expires_at < self._heap[0][0]):
+            self._wakeup.set()
+        heapq.heappush(self._heap, (expires_at, reservation_id))
+
+    def pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, reservation_id = heapq.heappop(self._heap)
+            if self._scheduled.get(reservation_id) == expires_at:
+                del self._scheduled[reservation_id]
+                due.append(reservation_id)
+        return due
+
+    def next_delay(self, now: datetime) -> Optional[float]:
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - now).total_seconds(), 0)
+
+    async def load(self, session: AsyncSession) -> None:
+        """
+        Удержания из БД, в т.ч. созданные другими воркерами.
+        """
+        res = await session.execute(
+            select(Reservation.id, Reservation.held_until).where(Reservation.status == Reservation.HELD)
+        )
+        for reservation_id, held_until in res:
+            self.schedule(reservation_id, held_until)
+
+    async def run(self, session_maker: Any, rescan_interval: Optional[int] = None) -> None:
+        rescan_interval = RESERVATION_RESCAN_SECONDS if rescan_interval is None else rescan_interval
+        self._wakeup = asyncio.Event()
+        next_rescan = datetime.utcnow()
+        while True:
+            self._wakeup.clear()
+            now = datetime.utcnow()
+            try:
+                async with session_maker() as session:
+                    if now >= next_rescan:
+                        await self.load(session)
+                        next_rescan = now + timedelta(seconds=rescan_interval)
+                    due = self.pop_due(now)
+                    if due:
+                        await expire_holds(due, session)
+            except Exception:
+                logger.exception('Reservation hold expiry failed.')
+
+            delay = self.next_delay(datetime.utcnow())
+            delay = rescan_interval if delay is None else min(delay, rescan_interval)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+hold_scheduler = HoldScheduler()
+
+
+async def expire_holds(reservation_ids: List[int], session: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Просроченные удержания: экземпляр переходит к следующему в очереди или возвращается в наличие.
+    """
+    res = await session.execute(
+        update(Reservation.__table__)
+        .where(Reservation.id == any_(_ids_param('expired_ids', reservation_ids)),
+               Reservation.status == Reservation.HELD,
+               Reservation.held_until <= datetime.utcnow())
+        .values(status=Reservation.EXPIRED)
+        .returning(Reservation.id, Reservation.book_id, Reservation.user_id)
+    )
+    expired = [dict(row._mapping) for row in res]
+    if not expired:
+        await session.rollback()
+        return []
+
+    counts: Dict[int, int] = {}
+    for reservation in expired:
+        counts[reservation['book_id']] = counts.get(reservation['book_id'], 0) + 1
+    holds = await release_copies(counts, session)
+    await notify([(user_channel(reservation['user_id']), 'expired', reservation) for reservation in expired],
+                 session)
+    await notify_holds(holds, session)
+    await session.commit()
+    return expired
+
+
+async def reserve_book(book_id: int, user: CurrentUser, session: AsyncSession) -> Reservation:
+    """
+    Встать в очередь на книгу. Если экземпляр есть в наличии, он сразу закрепляется за пользователем.
+    """
+    book = await session.scalar(select(Book).where(Book.id == book_id).with_for_update())
+    if book is None:
+        raise ObjNotFoundException
+
+    reservation = Reservation(book_id=book_id, user_id=user.id)
+    session.add(reservation)
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Book already reserved.'
+        )
+
+    holds = await assign_holds([book_id], session)
+    await notify_holds(holds, session)
+    await session.commit()
+    if holds:
+        await session.refresh(reservation)
+    return reservation
+
+
+async def cancel_reservation(reservation_id: int, user: CurrentUser, session: AsyncSession) -> Reservation:
+    reservation = await session.scalar(
+        select(Reservation).where(Reservation.id == reservation_id).with_for_update()
+    )
+    if reservation is None or reservation.user_id != user.id:
+        raise ObjNotFoundException
+    if reservation.status not in (Reservation.WAITING, Reservation.HELD):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Reservation is not active.'
+        )
+
+    was_held = reservation.status == Reservation.HELD
+    reservation.status = Reservation.CANCELLED
+    await session.flush()
+    holds = await release_copies({reservation.book_id: 1}, session) if was_held else []
+    await notify_holds(holds, session)
+    await session.commit()
+    return reservation
+
+
+async def get_user_reservations(user: CurrentUser, session: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Активные резервации пользователя с местом в очереди (1 - следующий).
+    """
+    ahead_table = Reservation.__table__.alias('ahead')
+    ahead = select(func.count()) \
+        .where(ahead_table.c.book_id == Reservation.book_id,
+               ahead_table.c.status == Reservation.WAITING,
+               ahead_table.c.id < Reservation.id) \
+        .scalar_subquery()
+
+    res = await session.execute(
+        select(Reservation, ahead)
+        .where(Reservation.user_id == user.id,
+               Reservation.status.in_([Reservation.WAITING, Reservation.HELD]))
+        .order_by(Reservation.id)
+    )
+    return [
+        {
+            'id': reservation.id,
+            'book_id': reservation.book_id,
+            'status': reservation.status,
+            'created_at': reservation.created_at,
+            'held_until': reservation.held_until,
+            'position': position + 1 if reservation.status == Reservation.WAITING else None,
+        }
+        for reservation, position in res
+    ]
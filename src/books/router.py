@@ -1,14 +1,33 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from src.auth.dependencies import get_current_user
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from src.auth.dependencies import get_current_user, get_current_user_claims
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import src.books.schema as book_schema
-from src.db import get_async_session
-from .models import Comment
-from .service import get_books_list, get_book_data, _update_comment, get_authors_list, get_author_book_list, _set_rating
-from ..auth.models import User
+from src.config import TRGM_SIMILARITY_THRESHOLD
+from src.db import get_async_session, get_async_read_session
+from src.events import sse_stream
+from src.exceptions import ObjNotFoundException
+from src.http_cache import make_etag, etag_matches, set_cache_headers, not_modified, public_cache
+from src.pagination import Page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.serialization import compile_serializer, parse_fields, serialize_page
+from .availability import MAX_SUBSCRIBED_BOOKS, book_channel, get_availability
+from .reservations import reserve_book, cancel_reservation, get_user_reservations, user_channel
+from .suggest import suggest_index
+from .versions import get_book_version, get_catalog_version
+from .service import (
+    get_books_list,
+    get_book_json,
+    get_authors_list,
+    get_author_book_list,
+    _set_rating,
+    _add_comment,
+    _update_comment,
+    _delete_comment,
+)
+from ..auth.schema import CurrentUser
 
 router = APIRouter(
     prefix='/library',
@@ -17,24 +36,120 @@ router = APIRouter(
 
 
 @router.get('/',
-            response_model=List[book_schema.BooksSchema],
+            response_model=Page[book_schema.BooksSchema],
             status_code=status.HTTP_200_OK)
 async def get_books(
         filter_str: str = '',
-        limmit: int = 20,
-        offset: int = 0,
-        session: AsyncSession = Depends(get_async_session)
+        fuzzy: bool = False,
+        similarity: float = Query(default=TRGM_SIMILARITY_THRESHOLD, ge=0, le=1),
+        limmit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        fields: Optional[str] = None,
+        if_none_match: Optional[str] = Header(default=None),
+        session: AsyncSession = Depends(get_async_read_session)
 ):
     """
-    Эндпоинт всех книг. Пагинация, по умолчанию 10.
-    :param filter_str: Искомое в названии или описании значение.
+    Эндпоинт всех книг. Keyset-пагинация, по умолчанию 20.
+    ETag зависит от версии каталога и параметров запроса, при совпадении с If-None-Match - 304 без запроса книг.
+    :param filter_str: Полнотекстовый поиск по названию, авторам и описанию, результаты по релевантности.
+    :param fuzzy: Нечеткий поиск по названию (триграммы), устойчивый к опечаткам.
+    :param similarity: Порог схожести для нечеткого поиска.
     :param limmit: Кол-во выводимых книг.
-    :param offset: Номер набора по limmit.
-    :param session: сессия БД
-    :return: Книга: id, название, авторы, год, средний рейтинг, кол-во коментариев, теги
+    :param cursor: Курсор следующей страницы (next_cursor из предыдущего ответа).
+    :param with_total: Добавить оценку общего кол-ва книг.
+    :param fields: Только эти поля книг через запятую, например fields=title,authors; id выводится всегда.
+    :param if_none_match: ETag из предыдущего ответа.
+    :param session: сессия чтения: реплика или основная БД
+    :return: Страница книг: id, название, авторы, год, средний рейтинг, кол-во коментариев, теги
+    """
+    field_set = parse_fields(fields, book_schema.BooksSchema)
+    version = await get_catalog_version(session)
+    etag = make_etag('books', version, filter_str, fuzzy, similarity, limmit, cursor, with_total,
+                     sorted(field_set) if field_set else None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    page = await get_books_list(filter_str, session, limmit, cursor, with_total, fuzzy, similarity, fields=field_set)
+    serializer = compile_serializer(book_schema.BooksSchema, field_set)
+    return set_cache_headers(ORJSONResponse(serialize_page(page, serializer)), etag)
+
+
+@router.get('/suggest',
+            response_model=List[book_schema.SuggestSchema],
+            status_code=status.HTTP_200_OK,
+            dependencies=[Depends(public_cache)])
+async def suggest(
+        q: str = Query(min_length=1, max_length=100),
+        limmit: int = Query(default=10, ge=1, le=50),
+):
+    """
+    Эндпоинт автодополнения по названиям книг, авторам и тегам. Отвечает из памяти, без запросов к БД.
+    :param q: Начало любого слова в названии, имени автора или теге.
+    :param limmit: Кол-во подсказок.
+    :return: Подсказки: вид (book, author, tag), id, текст
+    """
+    return suggest_index.search(q, limmit)
+
+
+@router.get('/availability/events',
+            response_class=StreamingResponse,
+            status_code=status.HTTP_200_OK)
+async def availability_events(
+        book_id: List[int] = Query(...),
+        session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Server-Sent Events с наличием книг вместо опроса /library/{book_id}.
+    Первым приходит снимок, затем событие availability на каждое изменение: available, quantity,
+    их дельты и version книги (события с version не больше известной можно отбросить).
+    Событие resync - события могли быть потеряны, нужно переподключиться.
+    :param book_id: id книг, параметр повторяется, не больше 200.
+    :param session: Сессия БД, только для снимка.
+    """
+    book_ids = sorted(set(book_id))
+    if len(book_ids) > MAX_SUBSCRIBED_BOOKS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f'Too many books, max {MAX_SUBSCRIBED_BOOKS}.'
+        )
+    return StreamingResponse(sse_stream([book_channel(i) for i in book_ids],
+                                        snapshot=lambda: get_availability(book_ids, session)),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@router.get('/reservations',
+            response_model=List[book_schema.ReservationSchema],
+            status_code=status.HTTP_200_OK)
+async def get_reservations(
+        session: AsyncSession = Depends(get_async_session),
+        user: CurrentUser = Depends(get_current_user_claims)
+):
     """
-    books = await get_books_list(filter_str, session)
-    return books[offset:][:limmit]
+    Эндпоинт активных резерваций пользователя.
+    :param session: Сессия БД.
+    :param user: Пользователь.
+    :return: Резервации: id, книга, статус (waiting - в очереди, held - экземпляр отложен),
+        срок удержания, место в очереди
+    """
+    return await get_user_reservations(user, session)
+
+
+@router.get('/reservations/events',
+            response_class=StreamingResponse,
+            status_code=status.HTTP_200_OK)
+async def reservation_events(
+        user: CurrentUser = Depends(get_current_user_claims)
+):
+    """
+    Server-Sent Events по резервациям пользователя вместо опроса:
+    hold - экземпляр отложен до held_until, expired - удержание истекло.
+    :param user: Пользователь.
+    """
+    return StreamingResponse(sse_stream([user_channel(user.id)]),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @router.get('/{book_id}',
@@ -42,39 +157,55 @@ async def get_books(
             status_code=status.HTTP_200_OK)
 async def get_book(
         book_id: int,
-        session: AsyncSession = Depends(get_async_session)
+        if_none_match: Optional[str] = Header(default=None),
+        session: AsyncSession = Depends(get_async_read_session)
 ):
     """
-    Энедпоин одной книги.
+    Энедпоин одной книги. ETag зависит от версии книги, при совпадении с If-None-Match - 304 без загрузки книги.
     :param book_id: id по каталогу
-    :param session: сессия БД
+    :param if_none_match: ETag из предыдущего ответа.
+    :param session: сессия чтения: реплика или основная БД
     :return: Книга: id, название, авторы, год, средний рейтинг, комментарии к книге, теги
     """
-    return await get_book_data(book_id, session)
+    version = await get_book_version(book_id, session)
+    if version is None:
+        raise ObjNotFoundException
+    etag = make_etag('book', book_id, version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    content = await get_book_json(book_id, version, session)
+    return set_cache_headers(Response(content=content, media_type='application/json'), etag)
 
 
 @router.get(path='/author/',
-            response_model=List[book_schema.AuthorSchema],
-            status_code=status.HTTP_200_OK)
+            response_model=Page[book_schema.AuthorSchema],
+            status_code=status.HTTP_200_OK,
+            dependencies=[Depends(public_cache)])
 async def get_authors(
         filter_str: str = '',
-        limmit: int = 20,
-        offset: int = 0,
-        session: AsyncSession = Depends(get_async_session),
+        fuzzy: bool = False,
+        similarity: float = Query(default=TRGM_SIMILARITY_THRESHOLD, ge=0, le=1),
+        limmit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        session: AsyncSession = Depends(get_async_read_session),
 ):
-    authors = await get_authors_list(filter_str, session)
-    return authors[offset:][:limmit]
+    return await get_authors_list(filter_str, session, limmit, cursor, with_total, fuzzy, similarity)
 
 
 @router.get('/author/{author_id}',
-            response_model=List[book_schema.BooksSchema],
+            response_model=Page[book_schema.BooksSchema],
             status_code=status.HTTP_200_OK)
 async def get_books_author(
         author_id: int,
-        session: AsyncSession = Depends(get_async_session),
+        limmit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        session: AsyncSession = Depends(get_async_read_session),
 ):
-    author = await get_author_book_list(author_id, session)
-    return author
+    page = await get_author_book_list(author_id, session, limmit, cursor, with_total)
+    return set_cache_headers(ORJSONResponse(serialize_page(page, book_schema.serialize_books)))
 
 
 @router.post('/{book_id}/rating',
@@ -84,7 +215,7 @@ async def set_rating(
         book_id: int,
         rating: book_schema.RatingBase,
         session: AsyncSession = Depends(get_async_session),
-        user: User = Depends(get_current_user)
+        user: CurrentUser = Depends(get_current_user)
 ):
     """
     Энепоин рейтинга книги от пользователя. Если ранее оченка ставила, то обновляет оценку.
@@ -102,6 +233,42 @@ async def set_rating(
     return res
 
 
+@router.post('/{book_id}/reserve',
+             response_model=book_schema.ReservationSchema,
+             status_code=status.HTTP_201_CREATED)
+async def reserve(
+        book_id: int,
+        session: AsyncSession = Depends(get_async_session),
+        user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Эндпоинт резервации книги. Если книга есть в наличии, экземпляр сразу откладывается.
+    :param book_id: id книги по каталогу.
+    :param session: Сессия БД.
+    :param user: Пользователь.
+    :return: Резервация.
+    """
+    return await reserve_book(book_id, user, session)
+
+
+@router.delete('/reservation/{reservation_id}',
+               response_model=book_schema.ReservationSchema,
+               status_code=status.HTTP_200_OK)
+async def cancel_reserve(
+        reservation_id: int,
+        session: AsyncSession = Depends(get_async_session),
+        user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Эндпоинт отмены резервации. Отложенный экземпляр переходит следующему в очереди.
+    :param reservation_id: id резервации.
+    :param session: Сессия БД.
+    :param user: Пользователь.
+    :return: Резервация.
+    """
+    return await cancel_reservation(reservation_id, user, session)
+
+
 @router.post('/{book_id}/comment',
              response_model=book_schema.CommentBase,
              status_code=status.HTTP_201_CREATED)
@@ -109,7 +276,7 @@ async def add_comment(
         book_id: int,
         comment: book_schema.CommentBase,
         session: AsyncSession = Depends(get_async_session),
-        user: User = Depends(get_current_user)
+        user: CurrentUser = Depends(get_current_user)
 ):
     """
     Эндпоин комментария от пользователя.
@@ -119,13 +286,10 @@ async def add_comment(
     :param session: Сессия БД.
     :return: Сообщение - комментаций добавлен.
     """
-
-    new_comment = Comment(content=comment.content, user=user, book_id=book_id)
-
-    session.add(new_comment)
-
-    await session.commit()
-    return new_comment
+    return await _add_comment(book_id=book_id,
+                              comment=comment,
+                              session=session,
+                              user=user)
 
 
 @router.patch('/comment/{comment_id}',
@@ -135,7 +299,7 @@ async def update_comment(
         comment_id: int,
         new_comment: book_schema.CommentBase,
         session: AsyncSession = Depends(get_async_session),
-        user: User = Depends(get_current_user)
+        user: CurrentUser = Depends(get_current_user)
 ):
     """
     Эндпоинт обновления комментария.
@@ -149,5 +313,22 @@ async def update_comment(
                                     new_comment=new_comment,
                                     user=user,
                                     session=session)
-    await session.commit()
     return comment
+
+
+@router.delete('/comment/{comment_id}',
+               status_code=status.HTTP_200_OK)
+async def delete_comment(
+        comment_id: int,
+        session: AsyncSession = Depends(get_async_session),
+        user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Эндпоинт удаления комментария автором или администратором.
+    :param comment_id: id комментария.
+    :param session: Сессия БД.
+    :param user: Пользователь.
+    :return: Сообщение - комментарий удален.
+    """
+    await _delete_comment(comment_id=comment_id, session=session, user=user)
+    return {'Message': 'Object was deleted.'}
@@ -1,12 +1,21 @@
-from typing import List
+import io
+import tempfile
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import src.books.schema as book_schema
 from src.auth.dependencies import get_current_admin_user
-from src.auth.models import User
+from src.auth.schema import CurrentUser
+from src.config import TRGM_SIMILARITY_THRESHOLD
 from src.db import get_async_session
+from src.pagination import Page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.serialization import compile_serializer, parse_fields, serialize_page
+from .export import stream_catalog, EXPORT_MEDIA_TYPES
+from .importer import import_books, read_records
 from .models import Book, Author, Tag
 from .service import (
     get_books_list,
@@ -21,6 +30,9 @@ from .service import (
     delete_instance,
     _give_book_to_user,
     _get_book_from_user,
+    circulate_batch,
+    recompute_book_counters,
+    link_books,
 )
 
 router = APIRouter(
@@ -30,17 +42,77 @@ router = APIRouter(
 
 
 @router.get('/',
-            response_model=List[book_schema.BooksAdminSchema],
+            response_model=Page[book_schema.BooksAdminSchema],
             status_code=status.HTTP_200_OK)
 async def get_books(
         filter_str: str = '',
-        limmit: int = 20,
-        offset: int = 0,
+        fuzzy: bool = False,
+        similarity: float = Query(default=TRGM_SIMILARITY_THRESHOLD, ge=0, le=1),
+        limmit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        fields: Optional[str] = None,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
-    books = await get_books_list(filter_str, session)
-    return books[offset:][:limmit]
+    """
+    Эндпоинт всех книг с кол-вом экземпляров и читателями.
+    :param fields: Только эти поля книг через запятую, например fields=title,available; id выводится всегда.
+    """
+    field_set = parse_fields(fields, book_schema.BooksAdminSchema)
+    page = await get_books_list(filter_str, session, limmit, cursor, with_total, fuzzy, similarity,
+                                admin=True, fields=field_set)
+    return ORJSONResponse(serialize_page(page, compile_serializer(book_schema.BooksAdminSchema, field_set)))
+
+
+@router.get('/export',
+            response_class=StreamingResponse,
+            status_code=status.HTTP_200_OK)
+async def export_books(
+        file_format: str = Query(default='ndjson', alias='format', regex='^(ndjson|csv)$'),
+        session: AsyncSession = Depends(get_async_session),
+        admin: CurrentUser = Depends(get_current_admin_user)
+):
+    """
+    Эндпоинт выгрузки всего каталога. Ответ отдается по мере чтения серверного курсора.
+    :param file_format: ndjson - книга на строку в JSON, csv - авторы и теги через '; '.
+    :param session: Сессия БД.
+    :param admin: Администратор.
+    :return: Книги: id, название, год, описание, кол-во, доступно, средний рейтинг, кол-во оценок,
+        кол-во комментариев, авторы, теги
+    """
+    return StreamingResponse(stream_catalog(session, file_format),
+                             media_type=EXPORT_MEDIA_TYPES[file_format],
+                             headers={'Content-Disposition': f'attachment; filename="catalog.{file_format}"'})
+
+
+@router.post('/import',
+             response_model=book_schema.ImportResultSchema,
+             status_code=status.HTTP_200_OK)
+async def import_books_file(
+        request: Request,
+        file_format: str = Query(default='csv', alias='format', regex='^(csv|ndjson)$'),
+        session: AsyncSession = Depends(get_async_session),
+        admin: CurrentUser = Depends(get_current_admin_user)
+):
+    """
+    Эндпоинт массового импорта книг. Тело запроса - файл CSV или JSON Lines в UTF-8,
+    авторы и теги по именам, отсутствующие создаются.
+    :param file_format: csv - авторы и теги через ';', ndjson - книга на строку в JSON.
+    :param session: Сессия БД.
+    :param admin: Администратор.
+    :return: Кол-во импортированных книг, созданных авторов и тегов, ошибки по номерам строк
+    """
+    # Запись на диск - в пуле потоков, чтение и разбор файла - там же, в import_books
+    upload = await run_in_threadpool(tempfile.TemporaryFile)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(upload.write, chunk)
+        await run_in_threadpool(upload.seek, 0)
+        file = io.TextIOWrapper(upload, encoding='utf-8', newline='')
+        return await import_books(read_records(file, file_format), session)
+    finally:
+        await run_in_threadpool(upload.close)
 
 
 @router.post('/',
@@ -49,7 +121,7 @@ async def get_books(
 async def add_book(
         book_data: book_schema.BookUpdateSchema,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     book = await add_new_book(book_data, session)
     return book
@@ -61,7 +133,7 @@ async def add_book(
 async def get_book(
         book_id: int,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     return await get_book_data(book_id, session)
 
@@ -73,7 +145,7 @@ async def patch_book(
         book_id: int,
         new_book_data: book_schema.BookUpdateSchema,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     return await update_book_data(book_id, new_book_data, session)
 
@@ -83,7 +155,7 @@ async def patch_book(
 async def delete_book(
         book_id: int,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     await delete_instance(book_id, Book, session)
     return {'Message': 'Object was deleted.'}
@@ -96,7 +168,7 @@ async def give_book_to_user(
         book_id: int,
         user_id: int,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     res = await _give_book_to_user(book_id, user_id, session)
     return res
@@ -109,19 +181,51 @@ async def get_book_from_user(
         book_id: int,
         user_id: int,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     res = await _get_book_from_user(book_id, user_id, session)
     return res
 
 
+@router.post('/circulation',
+             response_model=List[book_schema.CirculationResultSchema],
+             status_code=status.HTTP_200_OK)
+async def circulation_batch(
+        batch: book_schema.CirculationBatchSchema,
+        session: AsyncSession = Depends(get_async_session),
+        admin: CurrentUser = Depends(get_current_admin_user)
+):
+    """
+    Пакет выдач и возвратов книг (киоски, стойки выдачи) одним запросом и одной транзакцией.
+    :param batch: Операции по порядку: action (give - выдать, return - принять), book_id, user_id.
+    :return: Результат по каждой операции в том же порядке: ok и причина отказа.
+    """
+    return await circulate_batch(batch.operations, session)
+
+
+@router.post('/counters/recompute',
+             status_code=status.HTTP_200_OK)
+async def recompute_counters(
+        book_id: Optional[int] = None,
+        session: AsyncSession = Depends(get_async_session),
+        admin: CurrentUser = Depends(get_current_admin_user)
+):
+    """
+    Пересчет денормализованных счетчиков рейтинга и комментариев.
+    :param book_id: id книги, по умолчанию - весь каталог.
+    :return: Кол-во исправленных книг.
+    """
+    fixed = await recompute_book_counters(session, book_id)
+    return {'Message': 'Counters recomputed.', 'Fixed': fixed}
+
+
 @router.post('/author',
              response_model=book_schema.AuthorBase,
              status_code=status.HTTP_201_CREATED)
 async def add_author(
         author_name: str,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     author = await create_author(author_name, session)
     return author
@@ -134,7 +238,7 @@ async def update_author(
         author_id: int,
         new_author_data: book_schema.AuthorBase,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     author = await change_author_data(author_id, new_author_data, session)
     return author
@@ -145,23 +249,41 @@ async def update_author(
 async def delete_author(
         author_id: int,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     await delete_instance(author_id, Author, session)
     return {'Message': 'Object was deleted.'}
 
 
+@router.post('/author/{author_id}/books',
+             status_code=status.HTTP_200_OK)
+async def link_author_books(
+        author_id: int,
+        links: book_schema.BookLinksSchema,
+        session: AsyncSession = Depends(get_async_session),
+        admin: CurrentUser = Depends(get_current_admin_user)
+):
+    """
+    Массовое добавление или удаление автора у книг.
+    :param author_id: id автора.
+    :param links: id книг и действие: add=true - добавить автора, add=false - убрать.
+    :return: Кол-во измененных книг.
+    """
+    changed = await link_books(Author, author_id, links.book_ids, links.add, session)
+    return {'Message': 'Books updated.', 'Changed': changed}
+
+
 @router.get('/tag/',
-            response_model=List[book_schema.TagSchema],
+            response_model=Page[book_schema.TagSchema],
             status_code=status.HTTP_200_OK)
 async def get_tags(
-        limmit: int = 20,
-        offset: int = 0,
+        limmit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        with_total: bool = False,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
-    tags = await get_tags_list(session)
-    return tags[offset:][:limmit]
+    return await get_tags_list(session, limmit, cursor, with_total)
 
 
 @router.post('/tag/',
@@ -170,7 +292,7 @@ async def get_tags(
 async def add_tag(
         content: book_schema.TagBase,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     tag = await add_new_tag(content, session)
     return tag
@@ -183,19 +305,36 @@ async def update_tag(
         tag_id: int,
         content: book_schema.TagBase,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     tag = await change_instance(instance_id=tag_id, new_instance_data=content, model=Tag, session=session)
-    await session.commit()
     return tag
 
 
+@router.post('/tag/{tag_id}/books',
+             status_code=status.HTTP_200_OK)
+async def link_tag_books(
+        tag_id: int,
+        links: book_schema.BookLinksSchema,
+        session: AsyncSession = Depends(get_async_session),
+        admin: CurrentUser = Depends(get_current_admin_user)
+):
+    """
+    Массовое добавление или удаление тега у книг.
+    :param tag_id: id тега.
+    :param links: id книг и действие: add=true - добавить тег, add=false - убрать.
+    :return: Кол-во измененных книг.
+    """
+    changed = await link_books(Tag, tag_id, links.book_ids, links.add, session)
+    return {'Message': 'Books updated.', 'Changed': changed}
+
+
 @router.delete('/tag/{tag_id}',
                status_code=status.HTTP_204_NO_CONTENT)
 async def delete_tag(
         tag_id: int,
         session: AsyncSession = Depends(get_async_session),
-        admin: User = Depends(get_current_admin_user)
+        admin: CurrentUser = Depends(get_current_admin_user)
 ):
     res = await delete_instance(tag_id, Tag, session)
     return {'Message': 'Object was deleted.'}
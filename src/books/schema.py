@@ -1,9 +1,10 @@
 from datetime import datetime
-from typing import List, Union, Optional
+from typing import List, Literal, Union, Optional
 
 from pydantic import BaseModel, Field, validator, ValidationError
 
 from src.auth.schema import UserResponse
+from src.serialization import compile_serializer
 
 # TODO:
 #  упорядочить схемы, добавить валидацию
@@ -107,3 +108,93 @@ class AuthorSchema(AuthorBase):
 
 class TagSchema(TagBase):
     books: Optional[List[BookBase]]
+
+
+class SuggestSchema(BaseModel):
+    kind: str
+    id: int
+    text: str
+
+
+class BookImportSchema(BaseModel):
+    title: str = Field(min_length=1)
+    year_published: Optional[int]
+    description: Optional[str] = Field(max_length=250)
+    quantity: int = Field(default=0, ge=0)
+    authors: List[str] = []
+    tags: List[str] = []
+
+    @validator('year_published', 'description', 'quantity', pre=True)
+    def empty_as_none(cls, v, field):
+        if v == '':
+            return field.default
+        return v
+
+    @validator('year_published')
+    def year_early_current(cls, v):
+        if v and v > datetime.utcnow().year:
+            raise ValueError('Этот год еще не настал.')
+        return v
+
+    @validator('authors', 'tags', pre=True)
+    def split_names(cls, v):
+        if isinstance(v, str):
+            v = v.split(';')
+        return [name.strip() for name in v if name and name.strip()]
+
+    @validator('authors', 'tags', each_item=True)
+    def name_length(cls, v):
+        if len(v) > 100:
+            raise ValueError('Не больше 100 символов.')
+        return v
+
+
+class ImportErrorSchema(BaseModel):
+    line: int
+    error: str
+
+
+class ImportResultSchema(BaseModel):
+    imported: int = 0
+    authors_created: int = 0
+    tags_created: int = 0
+    failed: int = 0
+    errors: List[ImportErrorSchema] = []
+
+
+class BookLinksSchema(BaseModel):
+    book_ids: List[int] = Field(min_items=1, max_items=100000)
+    add: bool = True
+
+
+class CirculationOperationSchema(BaseModel):
+    action: Literal['give', 'return']
+    book_id: int
+    user_id: int
+
+
+class CirculationBatchSchema(BaseModel):
+    operations: List[CirculationOperationSchema] = Field(min_items=1, max_items=1000)
+
+
+class CirculationResultSchema(CirculationOperationSchema):
+    ok: bool
+    error: Optional[str]
+
+
+class ReservationSchema(BaseModel):
+    id: int
+    book_id: int
+    status: str
+    created_at: datetime
+    held_until: Optional[datetime]
+    position: Optional[int]
+
+    class Config:
+        orm_mode = True
+
+
+# Ответы горячих эндпоинтов собираются без валидации pydantic
+serialize_books = compile_serializer(BooksSchema)
+serialize_books_admin = compile_serializer(BooksAdminSchema)
+serialize_book = compile_serializer(BookSchema)
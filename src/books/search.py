@@ -0,0 +1,122 @@
+from typing import Optional
+
+from sqlalchemy import Float, func, literal, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+
+from src.config import TRGM_SIMILARITY_THRESHOLD
+
+SEARCH_CONFIGS = ('russian', 'english')
+
+# Триграммы для нечеткого поиска, расширение нужно до создания индексов gin_trgm_ops
+TRGM_DDL = 'CREATE EXTENSION IF NOT EXISTS pg_trgm'
+
+# Поисковый вектор книги: название (A), авторы (B), описание (C),
+# со стеммингом для русского и английского языков.
+# Поддерживается триггерами, поэтому массовые вставки (COPY) тоже индексируются.
+SEARCH_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION book_search_vector(title text, description text, authors text)
+    RETURNS tsvector AS $$
+    BEGIN
+        RETURN setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(authors, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(authors, '')), 'B')
+            || setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+            || setweight(to_tsvector('english', coalesce(description, '')), 'C');
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_author_names(target_book_id integer)
+    RETURNS text AS $$
+    BEGIN
+        RETURN (SELECT string_agg(author.name, ' ')
+                FROM author JOIN book_author ON book_author.author_id = author.id
+                WHERE book_author.book_id = target_book_id);
+    END
+    $$ LANGUAGE plpgsql STABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_search_vector_on_book() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := book_search_vector(NEW.title, NEW.description, book_author_names(NEW.id));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_search_vector_on_book_author() RETURNS trigger AS $$
+    BEGIN
+        UPDATE book
+        SET search_vector = book_search_vector(book.title, book.description, book_author_names(book.id))
+        WHERE book.id IN (SELECT book_id FROM changed_rows);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_search_vector_on_author() RETURNS trigger AS $$
+    BEGIN
+        UPDATE book
+        SET search_vector = book_search_vector(book.title, book.description, book_author_names(book.id))
+        WHERE book.id IN (SELECT book_id FROM book_author WHERE author_id = NEW.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER book_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description ON book
+    FOR EACH ROW EXECUTE FUNCTION book_search_vector_on_book()
+    """,
+    """
+    CREATE TRIGGER book_author_search_vector_insert
+    AFTER INSERT ON book_author REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_search_vector_on_book_author()
+    """,
+    """
+    CREATE TRIGGER book_author_search_vector_delete
+    AFTER DELETE ON book_author REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_search_vector_on_book_author()
+    """,
+    """
+    CREATE TRIGGER author_search_vector_update
+    AFTER UPDATE OF name ON author
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION book_search_vector_on_author()
+    """,
+]
+
+
+def search_query(search_str: str) -> ColumnElement:
+    """
+    tsquery из пользовательской строки для всех поддерживаемых языков (websearch-синтаксис).
+    """
+    queries = [func.websearch_to_tsquery(literal_column(f"'{config}'"), search_str) for config in SEARCH_CONFIGS]
+    ts_query = queries[0]
+    for query in queries[1:]:
+        ts_query = ts_query.op('||')(query)
+    return ts_query
+
+
+def fuzzy_match(search_str: str, column: ColumnElement) -> ColumnElement:
+    """
+    Нечеткое совпадение строки с любым словом в колонке (оператор <%, использует GIN-индекс gin_trgm_ops).
+    Порог задается set_similarity_threshold.
+    """
+    return literal(search_str).op('<%', is_comparison=True)(column)
+
+
+def fuzzy_rank(search_str: str, column: ColumnElement) -> ColumnElement:
+    return func.word_similarity(search_str, column, type_=Float)
+
+
+async def set_similarity_threshold(session: AsyncSession, threshold: Optional[float] = None) -> None:
+    """
+    Порог нечеткого поиска для текущей транзакции.
+    """
+    if threshold is None:
+        threshold = TRGM_SIMILARITY_THRESHOLD
+    await session.execute(select(func.set_config('pg_trgm.word_similarity_threshold', str(threshold), True)))
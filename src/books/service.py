@@ -1,47 +1,179 @@
-from datetime import datetime
-from typing import List, Union
+from datetime import datetime, timedelta
+from typing import List, Union, Optional, Dict, Any, FrozenSet
 
+import orjson
 from fastapi import HTTPException, status
 from pydantic import BaseModel
-from sqlalchemy import select, func, update, and_
+from sqlalchemy import select, func, update, insert, delete, or_, case, true, literal, any_, bindparam, tuple_, cast, \
+    literal_column, Integer, Float, TIMESTAMP
+from sqlalchemy.dialects.postgresql import ARRAY, JSON, aggregate_order_by, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, with_expression
+from sqlalchemy.orm import aliased, selectinload, with_expression
+from sqlalchemy.sql.elements import ColumnElement
 
 import src.books.schema as book_schema
+from src.cache import create_cache_backend
 from src.db import Base
 from src.auth.models import User
-from src.exceptions import ObjNotFoundException, InvalidDataException
-from .models import Book, Rating, Comment, Author, Tag, book_user
-
-
-async def get_books_list(filter_str: str, session: AsyncSession) -> List[Book]:
-    search_str = '%' + filter_str + '%'
-    query = select(Book) \
-        .filter(Book.title.ilike(search_str) | Book.description.ilike(search_str)) \
-        .outerjoin(Rating) \
-        .outerjoin(Comment) \
-        .options(joinedload(Book.authors),
-                 joinedload(Book.tags),
-                 joinedload(Book.users),
-                 with_expression(Book.avg_rating, func.avg(Rating.value).label('avg_rating')),
-                 with_expression(Book.count_comments, func.count(Comment.id).label('count_comments'))) \
-        .group_by(Book.id) \
-        .order_by(Book.id)
-
+from src.auth.schema import CurrentUser
+from src.exceptions import ErrorMsg, ObjNotFoundException, InvalidDataException
+from src.metrics import register_metrics
+from src.pagination import paginate, DEFAULT_PAGE_SIZE
+from .models import Book, Rating, Comment, Author, Tag, Reservation, book_user, book_author, book_tag
+from .search import search_query, fuzzy_match, fuzzy_rank, set_similarity_threshold
+from .reservations import assign_holds, notify_holds
+from .suggest import notify_indexed, notify_unindexed
+
+# Сериализованный BookSchema по id книги
+book_cache = create_cache_backend()
+register_metrics('book_cache', book_cache.stats)
+
+
+def book_cache_key(book_id: int) -> str:
+    return f'book:{book_id}'
+
+
+async def invalidate_book_cache(*book_ids: Optional[int]) -> None:
+    await book_cache.delete(*[book_cache_key(book_id) for book_id in book_ids if book_id is not None])
+
+
+async def _related_book_ids(model: Base, instance_id: int, session: AsyncSession) -> List[int]:
+    """
+    id книг, в ответе которых выводится автор или тег.
+    """
+    if model is Book:
+        return [instance_id]
+    if model is Author:
+        query = select(book_author.c.book_id).where(book_author.c.author_id == instance_id)
+    elif model is Tag:
+        query = select(book_tag.c.book_id).where(book_tag.c.tag_id == instance_id)
+    else:
+        return []
     res = await session.execute(query)
-    return res.unique().scalars().all()
+    return res.scalars().all()
+
+
+async def _name_taken(model: Base, session: AsyncSession) -> HTTPException:
+    """
+    Имена авторов и теги уникальны: импорт находит их по имени.
+    """
+    await session.rollback()
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f'{model.__name__} already exists.'
+    )
+
+
+def rating_sum_subquery():
+    """
+    Коррелированный подзапрос суммы оценок книги. Используется только для пересчета счетчиков.
+    """
+    return select(func.coalesce(func.sum(Rating.value), 0)) \
+        .where(Rating.book_id == Book.id) \
+        .scalar_subquery()
+
+
+def rating_count_subquery():
+    return select(func.count(Rating.value)) \
+        .where(Rating.book_id == Book.id) \
+        .scalar_subquery()
+
+
+def comment_count_subquery():
+    return select(func.count(Comment.id)) \
+        .where(Comment.book_id == Book.id) \
+        .scalar_subquery()
+
+
+def _json_list_subquery(fields: Dict[str, ColumnElement], table, link_column, order_by: ColumnElement):
+    """
+    Коррелированный подзапрос: связанные с книгой записи как JSON-массив объектов fields.
+    """
+    item = func.json_build_object(*[arg for key, column in fields.items()
+                                    for arg in (literal_column(f"'{key}'"), column)])
+    return select(func.coalesce(func.json_agg(aggregate_order_by(item, order_by)),
+                                literal_column("'[]'::json"), type_=JSON)) \
+        .select_from(table) \
+        .where(link_column == Book.id) \
+        .scalar_subquery()
+
+
+def book_list_columns(admin: bool = False, fields: Optional[FrozenSet[str]] = None) -> List[ColumnElement]:
+    """
+    Колонки BooksSchema (BooksAdminSchema при admin) для чтения строками, без объектов ORM:
+    средний рейтинг считается в запросе, авторы, теги и читатели собираются json_agg.
+    :param fields: Только эти поля схемы (parse_fields), id выбирается всегда - он нужен курсору.
+    """
+    columns = {
+        'id': Book.id,
+        'title': Book.title,
+        'year_published': Book.year_published,
+        'avg_rating': (cast(Book.rating_sum, Float) / func.nullif(Book.rating_count, 0, type_=Float))
+        .label('avg_rating'),
+        'count_comments': Book.comment_count.label('count_comments'),
+        'authors': lambda: _json_list_subquery({'id': Author.id, 'name': Author.name},
+                                               book_author.join(Author), book_author.c.book_id, Author.id),
+        'tags': lambda: _json_list_subquery({'id': Tag.id, 'content': Tag.content},
+                                            book_tag.join(Tag), book_tag.c.book_id, Tag.id),
+    }
+    if admin:
+        columns.update({
+            'users': lambda: _json_list_subquery(
+                {'email': User.email, 'username': User.username, 'is_admin': User.is_admin},
+                book_user.join(User), book_user.c.book_id, User.id),
+            'quantity': Book.quantity,
+            'available': Book.available,
+        })
+    return [column().label(name) if callable(column) else column
+            for name, column in columns.items()
+            if fields is None or name in fields or name == 'id']
+
+
+async def get_books_list(
+        filter_str: str,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        fuzzy: bool = False,
+        similarity: Optional[float] = None,
+        admin: bool = False,
+        fields: Optional[FrozenSet[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Страница книг строками результата (book_list_columns), одним запросом.
+    :param admin: Колонки BooksAdminSchema.
+    :param fields: Только эти поля, подзапросы неуказанных авторов, тегов и читателей не выполняются.
+    """
+    query = select(*book_list_columns(admin, fields))
+
+    if not filter_str:
+        return await paginate(query, session, [Book.id], limit, cursor, with_total, rows=True)
+
+    if fuzzy:
+        await set_similarity_threshold(session, similarity)
+        condition = fuzzy_match(filter_str, Book.title)
+        rank = fuzzy_rank(filter_str, Book.title).label('search_rank')
+    else:
+        ts_query = search_query(filter_str)
+        condition = Book.search_vector.bool_op('@@')(ts_query)
+        rank = func.ts_rank(Book.search_vector, ts_query, type_=Float).label('search_rank')
+
+    query = query \
+        .add_columns(rank) \
+        .where(condition)
+
+    return await paginate(query, session, [rank, Book.id], limit, cursor, with_total, descending=True, rows=True)
 
 
 async def get_book_data(book_id: int, session: AsyncSession) -> Union[Book, None]:
     query = select(Book)\
         .where(Book.id == book_id) \
-        .outerjoin(Rating) \
-        .options(joinedload(Book.authors),
-                 joinedload(Book.tags),
-                 joinedload(Book.users),
-                 joinedload(Book.comments).load_only(Comment.id, Comment.content, Comment.created, Comment.changed),
-                 with_expression(Book.avg_rating, func.avg(Rating.value).label('avg_rating')))\
-        .group_by(Book.id)
+        .options(selectinload(Book.authors),
+                 selectinload(Book.tags),
+                 selectinload(Book.users),
+                 selectinload(Book.comments).load_only(Comment.id, Comment.content, Comment.created, Comment.changed))
 
     res = await session.execute(query)
     if res is None:
@@ -49,33 +181,63 @@ async def get_book_data(book_id: int, session: AsyncSession) -> Union[Book, None
     return res.scalar()
 
 
-async def get_authors_list(filter_str: str, session: AsyncSession) -> List[Author]:
-    search_str = '%' + filter_str + '%'
-    query = select(Author)\
-        .filter(Author.name.ilike(search_str)) \
-        .options(joinedload(Author.books))\
-        .order_by(Author.name)\
-        .group_by(Author.id)
+async def get_book_json(book_id: int, version: int, session: AsyncSession) -> str:
+    """
+    Сериализованная карточка книги (BookSchema) через кэш.
+    Запись кэша хранится вместе с версией книги и не отдается, если версия устарела.
+    :param version: Текущая версия книги (get_book_version).
+    """
+    key = book_cache_key(book_id)
+    cached = await book_cache.get(key)
+    if cached is not None:
+        cached_version, _, data = cached.partition(':')
+        if cached_version == str(version):
+            return data
 
-    res = await session.execute(query)
-    return res.unique().scalars().all()
-
-
-async def get_author_book_list(author_id: int, session: AsyncSession) -> List[Book]:
-    query = select(Book) \
-        .filter(Book.authors.any(id=author_id)) \
-        .outerjoin(Rating) \
-        .outerjoin(Comment) \
-        .options(joinedload(Book.authors),
-                 joinedload(Book.tags),
-                 joinedload(Book.users),
-                 with_expression(Book.avg_rating, func.avg(Rating.value).label('avg_rating')),
-                 with_expression(Book.count_comments, func.count(Comment.id).label('count_comments'))) \
-        .group_by(Book.id) \
-        .order_by(Book.id)
+    book = await get_book_data(book_id, session)
+    if book is None:
+        raise ObjNotFoundException
+    data = orjson.dumps(book_schema.serialize_book(book)).decode()
+    await book_cache.set(key, f'{version}:{data}')
+    return data
 
-    res = await session.execute(query)
-    return res.unique().scalars().all()
+
+async def get_authors_list(
+        filter_str: str,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        fuzzy: bool = False,
+        similarity: Optional[float] = None,
+) -> Dict[str, Any]:
+    query = select(Author).options(selectinload(Author.books))
+
+    if not (fuzzy and filter_str):
+        search_str = '%' + filter_str + '%'
+        query = query.filter(Author.name.ilike(search_str))
+        return await paginate(query, session, [Author.name, Author.id], limit, cursor, with_total)
+
+    await set_similarity_threshold(session, similarity)
+    rank = fuzzy_rank(filter_str, Author.name).label('search_rank')
+    query = query \
+        .where(fuzzy_match(filter_str, Author.name)) \
+        .options(with_expression(Author.search_rank, rank))
+
+    return await paginate(query, session, [rank, Author.id], limit, cursor, with_total, descending=True)
+
+
+async def get_author_book_list(
+        author_id: int,
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+) -> Dict[str, Any]:
+    query = select(*book_list_columns()) \
+        .where(Book.authors.any(id=author_id))
+
+    return await paginate(query, session, [Book.id], limit, cursor, with_total, rows=True)
 
 
 async def add_new_book(
@@ -89,12 +251,14 @@ async def add_new_book(
     tags_id = book_data_dict.pop('tags_id', None)
 
     book = Book(**book_data_dict)
+    session.add(book)
+    await session.flush()
 
     if authors_id:
         book = await set_book_authors(book, authors_id, session)
     if tags_id:
         book = await set_book_tags(book, tags_id, session)
-    session.add(book)
+    await notify_indexed([book], session)
     await session.commit()
 
     return await get_book_data(book.id, session)
@@ -126,8 +290,44 @@ async def update_book_data(
     if tags_id:
         book = await set_book_tags(book, tags_id, session)
 
+    holds = []
+    if update_data.get('available', 0) > 0:
+        await session.flush()
+        holds = await assign_holds([book_id], session)
+        if holds:
+            session.expire(book, ['available'])
+    await notify_holds(holds, session)
+    if 'title' in update_data:
+        await notify_indexed([book], session)
+
     await session.commit()
-    return book
+    await invalidate_book_cache(book_id)
+    return await get_book_data(book_id, session)
+
+
+async def _set_book_links(
+        book_id: int,
+        table: Any,
+        model: Base,
+        ids: List[int],
+        session: AsyncSession
+) -> None:
+    """
+    Приводит связи книги к набору ids двумя запросами: удаление лишних и вставка недостающих.
+    Несуществующие id пропускаются.
+    """
+    column = table.c[f'{model.__tablename__}_id']
+    ids = list(set(ids))
+
+    await session.execute(
+        delete(table).where(table.c.book_id == book_id, column.notin_(ids))
+    )
+    await session.execute(
+        pg_insert(table)
+        .from_select(['book_id', column.key],
+                     select(literal(book_id), model.id).where(model.id.in_(ids)))
+        .on_conflict_do_nothing()
+    )
 
 
 async def set_book_authors(
@@ -137,18 +337,13 @@ async def set_book_authors(
 ) -> Union[Book, None]:
 
     if isinstance(book, int):
-        book = await get_book_data(book, session)
+        book = await session.get(Book, book)
         if not book:
             return
 
-    book.authors.clear()
-
-    for a_id in authors_id:
-        query = select(Author).where(Author.id == a_id)
-        author = await session.scalar(query)
-        if author:
-            book.authors.append(author)
-
+    await _set_book_links(book.id, book_author, Author, authors_id, session)
+    session.expire(book, ['authors'])
+    # Кэш книги сбрасывает вызывающий, после коммита
     return book
 
 
@@ -160,25 +355,64 @@ async def set_book_tags(
 ) -> Union[Book, None]:
 
     if isinstance(book, int):
-        book = await get_book_data(book, session)
+        book = await session.get(Book, book)
         if not book:
             return
 
-    book.tags.clear()
+    await _set_book_links(book.id, book_tag, Tag, tags_id, session)
+    session.expire(book, ['tags'])
+    # Кэш книги сбрасывает вызывающий, после коммита
+    return book
+
 
-    for t_id in tags_id:
-        query = select(Tag).where(Tag.id == t_id)
-        tag = await session.scalar(query)
-        if tag:
-            book.tags.append(tag)
+async def link_books(
+        model: Base,
+        instance_id: int,
+        book_ids: List[int],
+        add: bool,
+        session: AsyncSession
+) -> int:
+    """
+    Добавляет или убирает автора или тег у множества книг одним запросом.
+    :param model: Author или Tag.
+    :param add: True - добавить связь, False - удалить.
+    :return: Кол-во измененных книг.
+    """
+    if await session.get(model, instance_id) is None:
+        raise ObjNotFoundException
 
-    return book
+    table = book_author if model is Author else book_tag
+    column = table.c[f'{model.__tablename__}_id']
+    # Массив одним параметром вместо IN (...): тысячи id не упираются в лимит параметров запроса
+    book_ids = bindparam('book_ids', list(set(book_ids)), type_=ARRAY(Integer))
+
+    if add:
+        statement = pg_insert(table) \
+            .from_select(['book_id', column.key],
+                         select(Book.id, literal(instance_id)).where(Book.id == any_(book_ids))) \
+            .on_conflict_do_nothing() \
+            .returning(table.c.book_id)
+    else:
+        statement = delete(table) \
+            .where(column == instance_id, table.c.book_id == any_(book_ids)) \
+            .returning(table.c.book_id)
+
+    res = await session.execute(statement)
+    changed = res.scalars().all()
+    await session.commit()
+    await invalidate_book_cache(*changed)
+    return len(changed)
 
 
 async def create_author(author_name: str, session: AsyncSession) -> Author:
     author = Author(name=author_name)
     session.add(author)
 
+    try:
+        await session.flush()
+    except IntegrityError:
+        raise await _name_taken(Author, session)
+    await notify_indexed([author], session)
     await session.commit()
 
     return author
@@ -204,12 +438,17 @@ async def change_author_data(
         raise InvalidDataException
 
     query = update(Author).where(Author.id == author_id).values(**update_data).returning(Author)
-    author = await session.scalar(query)
+    try:
+        author = await session.scalar(query)
+    except IntegrityError:
+        raise await _name_taken(Author, session)
 
     if author is None:
         raise ObjNotFoundException
 
+    await notify_indexed([author], session)
     await session.commit()
+    await invalidate_book_cache(*await _related_book_ids(Author, author_id, session))
     return author
 
 
@@ -226,16 +465,23 @@ async def add_new_tag(
 
     tag = Tag(**tag_data)
     session.add(tag)
+    try:
+        await session.flush()
+    except IntegrityError:
+        raise await _name_taken(Tag, session)
+    await notify_indexed([tag], session)
     await session.commit()
     return tag
 
 
 async def get_tags_list(
-        session: AsyncSession
-):
-    query = select(Tag).options(joinedload(Tag.books)).group_by(Tag.id).order_by(Tag.id)
-    res = await session.execute(query)
-    return res.unique().scalars().all()
+        session: AsyncSession,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+) -> Dict[str, Any]:
+    query = select(Tag).options(selectinload(Tag.books))
+    return await paginate(query, session, [Tag.id], limit, cursor, with_total)
 
 
 async def change_tag_data(
@@ -250,10 +496,15 @@ async def change_tag_data(
         raise InvalidDataException
 
     query = update(Tag).where(Tag.id == tag_id).values(**update_data).returning(Tag)
-    tag = await session.scalar(query)
+    try:
+        tag = await session.scalar(query)
+    except IntegrityError:
+        raise await _name_taken(Tag, session)
 
     if tag is not None:
+        await notify_indexed([tag], session)
         await session.commit()
+        await invalidate_book_cache(*await _related_book_ids(Tag, tag_id, session))
         return tag
 
 
@@ -273,11 +524,19 @@ async def change_instance(
         update_data = new_instance_data
 
     query = update(model).where(model.id == instance_id).values(**update_data).returning(model)
-    res = await session.execute(query)
+    try:
+        res = await session.execute(query)
+    except IntegrityError:
+        raise await _name_taken(model, session)
 
     if res is None:
         raise ObjNotFoundException
-    return res.scalar()
+    instance = res.scalar()
+    if instance is not None:
+        await notify_indexed([instance], session)
+        await session.commit()
+        await invalidate_book_cache(*await _related_book_ids(model, instance_id, session))
+    return instance
 
 
 async def delete_instance(
@@ -289,8 +548,11 @@ async def delete_instance(
     instance = await session.scalar(query)
     if instance is None:
         raise ObjNotFoundException
+    book_ids = await _related_book_ids(model, instance_id, session)
     await session.delete(instance)
+    await notify_unindexed(model, instance_id, session)
     await session.commit()
+    await invalidate_book_cache(*book_ids)
     return True
 
 
@@ -299,65 +561,268 @@ async def _give_book_to_user(
         user_id: int,
         session: AsyncSession,
 ) -> Book:
-
-    query_book = select(Book).where(Book.id == book_id).options(joinedload(Book.users))
-    book = await session.scalar(query_book)
+    """
+    Выдача книги одним запросом: условное уменьшение available и запись в book_user.
+    Блокировка строки книги держится только на время запроса, выдать больше, чем есть в наличии, нельзя.
+    Экземпляр, удерживаемый для пользователя по резервации, выдается без уменьшения available.
+    """
+    hold = update(Reservation.__table__) \
+        .where(Reservation.book_id == book_id,
+               Reservation.user_id == user_id,
+               Reservation.status == Reservation.HELD) \
+        .values(status=Reservation.FULFILLED) \
+        .returning(Reservation.id) \
+        .cte('hold')
+    has_hold = select(hold.c.id).exists()
+    checked_out = update(Book.__table__) \
+        .where(Book.id == book_id,
+               or_(Book.available > 0, has_hold),
+               select(User.id).where(User.id == user_id).exists()) \
+        .values(available=Book.available - case((has_hold, 0), else_=1)) \
+        .returning(*Book.__table__.c) \
+        .cte('checked_out')
+    # Обычный insert: postgresql insert в этой версии SQLAlchemy не кэширует компиляцию,
+    # и весь запрос с CTE компилировался бы заново на каждую выдачу
+    loan = insert(book_user) \
+        .from_select(['book_id', 'user_id', 'give_at'],
+                     select(checked_out.c.id, literal(user_id), literal(datetime.utcnow()))) \
+        .returning(book_user.c.book_id) \
+        .cte('loan')
+    # Встал в очередь, но получил экземпляр из наличия - резервация больше не нужна
+    waiting = update(Reservation.__table__) \
+        .where(Reservation.book_id == book_id,
+               Reservation.user_id == user_id,
+               Reservation.status == Reservation.WAITING,
+               select(checked_out.c.id).exists()) \
+        .values(status=Reservation.FULFILLED) \
+        .returning(Reservation.id) \
+        .cte('waiting')
+    book_alias = aliased(Book, checked_out)
+    # waiting подключается соединением: add_cte не сохраняется в ORM-запросе
+    query = select(book_alias) \
+        .join(loan, loan.c.book_id == book_alias.id) \
+        .outerjoin(waiting, true()) \
+        .execution_options(populate_existing=True)
+
+    book = await session.scalar(query)
     if book is None:
-        raise ObjNotFoundException
-
-    query_user = select(User).where(User.id == user_id)
-    user = await session.scalar(query_user)
-    if user is None:
-        raise ObjNotFoundException
-
-    if book.available > 0:
-        book.available -= 1
-        book.users.append(user)
-        await session.commit()
-        return book
-    elif book.available == 0:
+        await session.rollback()
+        if await session.get(Book, book_id) is None or await session.get(User, user_id) is None:
+            raise ObjNotFoundException
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail='Book not available.'
         )
 
+    await session.commit()
+    await invalidate_book_cache(book_id)
+    return book
+
 
 async def _get_book_from_user(
         book_id: int,
         user_id: int,
         session: AsyncSession,
 ) -> Book:
-
-    statement = update(book_user)\
+    """
+    Возврат книги одним запросом: отметка о возврате самой ранней выдачи и увеличение available.
+    Повторный одновременный возврат той же выдачи не проходит условие returned_at IS NULL.
+    Вернувшийся экземпляр закрепляется за первым в очереди резерваций.
+    """
+    open_loan = select(book_user.c.give_at) \
+        .where(book_user.c.book_id == book_id,
+               book_user.c.user_id == user_id,
+               book_user.c.returned_at == None) \
+        .order_by(book_user.c.give_at) \
+        .limit(1) \
+        .scalar_subquery()
+    returned = update(book_user) \
         .values(returned_at=datetime.utcnow()) \
-        .where(and_(book_user.c.book_id == book_id,
-                    book_user.c.user_id == user_id,
-                    book_user.c.returned_at == None))\
-        .returning(book_user)
-
-    book = await session.scalar(statement)
-
-    if not book:
+        .where(book_user.c.book_id == book_id,
+               book_user.c.user_id == user_id,
+               book_user.c.give_at == open_loan,
+               book_user.c.returned_at == None) \
+        .returning(book_user.c.book_id) \
+        .cte('returned')
+    checked_in = update(Book.__table__) \
+        .where(Book.id.in_(select(returned.c.book_id))) \
+        .values(available=Book.available + 1) \
+        .returning(*Book.__table__.c) \
+        .cte('checked_in')
+    query = select(aliased(Book, checked_in)).execution_options(populate_existing=True)
+
+    book = await session.scalar(query)
+    if book is None:
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="Book wasn't taken by user."
         )
 
-    query_book = select(Book).where(Book.id == book_id).options(joinedload(Book.users))
-    book = await session.scalar(query_book)
-    if not book:
-        raise ObjNotFoundException
-
-    book.available += 1
+    holds = await assign_holds([book_id], session)
+    await notify_holds(holds, session)
     await session.commit()
+    await invalidate_book_cache(book_id)
+    if holds:
+        await session.refresh(book, ['available'])
     return book
 
 
+async def circulate_batch(
+        operations: List[book_schema.CirculationOperationSchema],
+        session: AsyncSession,
+) -> List[Dict[str, Any]]:
+    """
+    Пакет выдач и возвратов в одной транзакции. Операции применяются по порядку, результат
+    совпадает с последовательным выполнением: возврат видит выдачу из предыдущей операции пакета.
+    Ошибка одной операции не отменяет остальные.
+    Книги пакета блокируются одним SELECT ... FOR UPDATE (по возрастанию id, без взаимных блокировок),
+    изменения записываются несколькими запросами независимо от размера пакета.
+    Резервации учитываются как в одиночных выдачах: удерживаемый экземпляр выдается своему читателю,
+    возвращенные экземпляры книг с очередью закрепляются за очередью, а не выдаются дальше в пакете.
+    :return: Результат по каждой операции: ok и текст ошибки.
+    """
+    book_ids = sorted({op.book_id for op in operations})
+    user_ids = list({op.user_id for op in operations})
+    give_pairs = list({(op.book_id, op.user_id) for op in operations if op.action == 'give'})
+    return_pairs = list({(op.book_id, op.user_id) for op in operations if op.action == 'return'})
+
+    res = await session.execute(
+        select(Book.id, Book.available)
+        .where(Book.id == any_(bindparam('book_ids', book_ids, type_=ARRAY(Integer))))
+        .order_by(Book.id)
+        .with_for_update()
+    )
+    available = dict(res.all())
+
+    res = await session.execute(
+        select(User.id).where(User.id == any_(bindparam('user_ids', user_ids, type_=ARRAY(Integer))))
+    )
+    users = set(res.scalars().all())
+
+    # Открытые выдачи по (книга, читатель), от ранней к поздней: give_at выдач из БД
+    # или строки новых выдач пакета (их возврат записывается сразу в returned_at)
+    open_loans: Dict[tuple, List[Union[datetime, Dict[str, Any]]]] = {}
+    if return_pairs:
+        res = await session.execute(
+            select(book_user.c.book_id, book_user.c.user_id, book_user.c.give_at)
+            .where(tuple_(book_user.c.book_id, book_user.c.user_id).in_(return_pairs),
+                   book_user.c.returned_at == None)
+            .order_by(book_user.c.give_at)
+            .with_for_update()
+        )
+        for book_id, user_id, give_at in res:
+            open_loans.setdefault((book_id, user_id), []).append(give_at)
+
+    reservations: Dict[tuple, tuple] = {}
+    if give_pairs:
+        res = await session.execute(
+            select(Reservation.book_id, Reservation.user_id, Reservation.id, Reservation.status)
+            .where(tuple_(Reservation.book_id, Reservation.user_id).in_(give_pairs),
+                   Reservation.status.in_([Reservation.WAITING, Reservation.HELD]))
+        )
+        reservations = {(book_id, user_id): (reservation_id, reservation_status)
+                        for book_id, user_id, reservation_id, reservation_status in res}
+
+    waiting: Dict[int, int] = {}
+    if return_pairs:
+        res = await session.execute(
+            select(Reservation.book_id, func.count())
+            .where(Reservation.book_id == any_(bindparam('waiting_book_ids', book_ids, type_=ARRAY(Integer))),
+                   Reservation.status == Reservation.WAITING)
+            .group_by(Reservation.book_id)
+        )
+        waiting = dict(res.all())
+
+    now = datetime.utcnow()
+    deltas: Dict[int, int] = {}
+    new_loans, returned_loans, fulfilled, results = [], [], [], []
+    for i, op in enumerate(operations):
+        error = None
+        reservation = reservations.get((op.book_id, op.user_id))
+        if op.book_id not in available or op.user_id not in users:
+            error = ErrorMsg.NOT_FOUND
+        elif op.action == 'give':
+            held = reservation and reservation[1] == Reservation.HELD
+            if held or available[op.book_id] > 0:
+                if reservation:
+                    del reservations[(op.book_id, op.user_id)]
+                    fulfilled.append(reservation[0])
+                if not held:
+                    available[op.book_id] -= 1
+                    deltas[op.book_id] = deltas.get(op.book_id, 0) - 1
+                # give_at входит в первичный ключ, выдачи одного пакета не должны совпадать
+                loan = {'book_id': op.book_id, 'user_id': op.user_id,
+                        'give_at': now + timedelta(microseconds=i), 'returned_at': None}
+                new_loans.append(loan)
+                open_loans.setdefault((op.book_id, op.user_id), []).append(loan)
+            else:
+                error = 'Book not available.'
+        else:
+            loans = open_loans.get((op.book_id, op.user_id))
+            if loans:
+                if waiting.get(op.book_id):
+                    waiting[op.book_id] -= 1
+                else:
+                    available[op.book_id] += 1
+                deltas[op.book_id] = deltas.get(op.book_id, 0) + 1
+                loan = loans.pop(0)
+                if isinstance(loan, dict):
+                    loan['returned_at'] = now
+                else:
+                    returned_loans.append((op.book_id, op.user_id, loan))
+            else:
+                error = "Book wasn't taken by user."
+        results.append({**op.dict(), 'ok': error is None, 'error': error})
+
+    changes = {book_id: delta for book_id, delta in deltas.items() if delta}
+    if changes:
+        rows = func.unnest(cast(bindparam('change_ids', list(changes), type_=ARRAY(Integer)), ARRAY(Integer)),
+                           cast(bindparam('change_deltas', list(changes.values()), type_=ARRAY(Integer)),
+                                ARRAY(Integer))) \
+            .table_valued('book_id', 'delta').render_derived()
+        await session.execute(
+            update(Book.__table__)
+            .where(Book.id == rows.c.book_id)
+            .values(available=Book.available + rows.c.delta)
+        )
+    if new_loans:
+        await session.execute(pg_insert(book_user), new_loans)
+    if returned_loans:
+        loan_book_ids, loan_user_ids, loan_give_ats = zip(*returned_loans)
+        rows = func.unnest(cast(bindparam('loan_book_ids', list(loan_book_ids), type_=ARRAY(Integer)),
+                                ARRAY(Integer)),
+                           cast(bindparam('loan_user_ids', list(loan_user_ids), type_=ARRAY(Integer)),
+                                ARRAY(Integer)),
+                           cast(bindparam('loan_give_ats', list(loan_give_ats), type_=ARRAY(TIMESTAMP)),
+                                ARRAY(TIMESTAMP))) \
+            .table_valued('book_id', 'user_id', 'give_at').render_derived()
+        await session.execute(
+            update(book_user)
+            .where(book_user.c.book_id == rows.c.book_id,
+                   book_user.c.user_id == rows.c.user_id,
+                   book_user.c.give_at == rows.c.give_at)
+            .values(returned_at=now)
+        )
+    if fulfilled:
+        await session.execute(
+            update(Reservation.__table__)
+            .where(Reservation.id == any_(bindparam('fulfilled_ids', fulfilled, type_=ARRAY(Integer))))
+            .values(status=Reservation.FULFILLED)
+        )
+    holds = await assign_holds([book_id for book_id, _ in return_pairs], session)
+    await notify_holds(holds, session)
+
+    await session.commit()
+    await invalidate_book_cache(*deltas)
+    return results
+
+
 async def _update_comment(
         comment_id,
         new_comment: book_schema.CommentBase,
         session: AsyncSession,
-        user: User
+        user: CurrentUser
 ) -> Union[Comment, None, str]:
 
     query = select(Comment).where(Comment.id == comment_id)
@@ -378,6 +843,8 @@ async def _update_comment(
     comment.content = update_data['content']
     comment.changed = datetime.utcnow()
 
+    await session.commit()
+    await invalidate_book_cache(comment.book_id)
     return comment
 
 
@@ -385,21 +852,128 @@ async def _set_rating(
         book_id: int,
         rating: book_schema.RatingBase,
         session: AsyncSession,
-        user: User
-) -> Union[Rating, str]:
+        user: CurrentUser
+) -> Dict[str, Any]:
+    """
+    Оценка книги одним upsert по (user_id, book_id). Строка книги блокируется заранее:
+    оценки книги все равно упорядочены обновлением ее счетчиков, а под блокировкой
+    подзапрос в RETURNING видит предыдущую оценку, в том числе только что зафиксированную.
+    """
+    locked = await session.scalar(select(Book.id).where(Book.id == book_id).with_for_update(key_share=True))
+    if locked is None:
+        raise ObjNotFoundException
+
+    # Core-вставка: ORM-вариант insert не поддерживает подзапрос в RETURNING
+    rating_table = Rating.__table__
+    previous = rating_table.alias('previous')
+    statement = pg_insert(rating_table) \
+        .values(value=rating.value, book_id=book_id, user_id=user.id)
+    statement = statement \
+        .on_conflict_do_update(index_elements=[rating_table.c.user_id, rating_table.c.book_id],
+                               set_={'value': statement.excluded.value}) \
+        .returning(rating_table.c.id,
+                   select(previous.c.value)
+                   .where(previous.c.user_id == user.id, previous.c.book_id == book_id)
+                   .scalar_subquery()
+                   .label('old_value'))
+    res = (await session.execute(statement)).one()
+
+    await _change_book_counters(book_id, session,
+                                rating_sum=rating.value - (res.old_value or 0),
+                                rating_count=0 if res.old_value is not None else 1)
+    await session.commit()
+    await invalidate_book_cache(book_id)
+    return {'id': res.id, 'value': rating.value}
+
+
+async def _add_comment(
+        book_id: int,
+        comment: book_schema.CommentBase,
+        session: AsyncSession,
+        user: CurrentUser
+) -> Comment:
 
-    update_data = rating.dict(exclude_unset=True)
-    update_data.pop('id', None)
+    new_comment = Comment(content=comment.content, user_id=user.id, book_id=book_id)
+    session.add(new_comment)
+
+    await _change_book_counters(book_id, session, comment_count=1)
+    await session.commit()
+    await invalidate_book_cache(book_id)
+    return new_comment
+
+
+async def _delete_comment(
+        comment_id: int,
+        session: AsyncSession,
+        user: CurrentUser
+) -> bool:
+
+    query = select(Comment).where(Comment.id == comment_id)
+    comment = await session.scalar(query)
+    if not comment:
+        raise ObjNotFoundException
+    if comment.user_id != user.id and not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Comment created by another user.'
+        )
+
+    statement = delete(Comment)\
+        .where(Comment.id == comment_id)\
+        .returning(Comment.book_id)\
+        .execution_options(synchronize_session='evaluate')
+    deleted = (await session.execute(statement)).first()
 
-    statement = update(Rating)\
-        .where(and_(Rating.user == user, Rating.book_id == book_id))\
-        .values(**update_data)\
-        .returning(Rating)
+    if deleted and deleted.book_id is not None:
+        await _change_book_counters(deleted.book_id, session, comment_count=-1)
+    await session.commit()
+    if deleted:
+        await invalidate_book_cache(deleted.book_id)
+    return True
 
-    res = await session.scalar(statement)
-    if not res:
-        res = Rating(value=rating.value, book_id=book_id, user_id=user.id)
-        session.add(res)
 
+async def _change_book_counters(book_id: int, session: AsyncSession, **deltas: int) -> None:
+    """
+    Атомарный сдвиг денормализованных счетчиков книги в текущей транзакции.
+    :param deltas: Имя счетчика - приращение (rating_sum, rating_count, comment_count).
+    """
+    values = {key: getattr(Book, key) + delta for key, delta in deltas.items() if delta}
+    if not values:
+        return
+    statement = update(Book)\
+        .where(Book.id == book_id)\
+        .values(**values)\
+        .execution_options(synchronize_session='fetch')
+    await session.execute(statement)
+
+
+async def recompute_book_counters(
+        session: AsyncSession,
+        book_id: Optional[int] = None
+) -> int:
+    """
+    Пересчет счетчиков рейтинга и комментариев по таблицам rating и comment.
+    :param book_id: id книги, по умолчанию - весь каталог.
+    :return: Кол-во книг, у которых счетчики разошлись с данными.
+    """
+    rating_sum = rating_sum_subquery()
+    rating_count = rating_count_subquery()
+    comment_count = comment_count_subquery()
+
+    statement = update(Book)\
+        .where(or_(Book.rating_sum != rating_sum,
+                   Book.rating_count != rating_count,
+                   Book.comment_count != comment_count))\
+        .values(rating_sum=rating_sum,
+                rating_count=rating_count,
+                comment_count=comment_count)\
+        .returning(Book.id)\
+        .execution_options(synchronize_session=False)
+    if book_id is not None:
+        statement = statement.where(Book.id == book_id)
+
+    res = await session.execute(statement)
+    fixed = res.scalars().all()
     await session.commit()
-    return res
+    await invalidate_book_cache(*fixed)
+    return len(fixed)
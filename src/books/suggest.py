@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Any
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import SUGGEST_REFRESH_SECONDS
+from src.events import Message, notification_listener, notify, RESYNC_EVENT
+from src.metrics import register_metrics
+from .models import Book, Author, Tag
+
+logger = logging.getLogger(__name__)
+
+# Ключи обрезаются, поиск по более длинной строке дофильтровывается по полному тексту
+MAX_KEY_LENGTH = 32
+
+# Вид объекта - модель и индексируемая колонка
+SUGGEST_SOURCES = {
+    'book': (Book, Book.title),
+    'author': (Author, Author.name),
+    'tag': (Tag, Tag.content),
+}
+KINDS = list(SUGGEST_SOURCES)
+KIND_BY_MODEL = {model: kind for kind, (model, _) in SUGGEST_SOURCES.items()}
+
+# Изменения индекса рассылаются всем воркерам через NOTIFY (add, remove, rebuild)
+SUGGEST_CHANNEL = 'suggest'
+REBUILD_EVENT = 'rebuild'
+# Текст в уведомлении обрезается: полезная нагрузка NOTIFY ограничена 8000 байт
+MAX_NOTIFY_TEXT_LENGTH = 1000
+
+
+def normalize(text: str) -> str:
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+def text_keys(text: str) -> Set[str]:
+    """
+    Ключи для поиска с начала любого слова: 'война и мир' -> 'война и мир', 'и мир', 'мир'.
+    """
+    words = normalize(text).split(' ')
+    return {' '.join(words[i:])[:MAX_KEY_LENGTH] for i in range(len(words)) if words[i]}
+
+
+def _full_keys(text: str) -> List[str]:
+    words = normalize(text).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """
+    Префиксный индекс для автодополнения: отсортированный массив ключей с поиском через bisect.
+    Ссылки на объекты хранятся в параллельных компактных массивах (вид, id).
+
+    Основные массивы строятся целиком (from_entries). Изменения между перестройками
+    попадают в небольшой отсортированный список _delta, удаленные записи основного
+    массива скрываются через _deleted.
+    """
+
+    def __init__(self) -> None:
+        self._keys: List[str] = []
+        self._kinds = array('B')
+        self._ids = array('q')
+        self._texts: Dict[Tuple[int, int], str] = {}
+        self._delta: List[Tuple[str, int, int]] = []
+        self._deleted: Set[Tuple[int, int]] = set()
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._delta)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[str, int, str]]) -> 'PrefixIndex':
+        """
+        Построение индекса одной сортировкой.
+        :param entries: (вид, id, текст)
+        """
+        index = cls()
+        keys, kinds, ids = [], array('B'), array('q')
+        for kind, obj_id, text in entries:
+            code = KINDS.index(kind)
+            index._texts[(code, obj_id)] = text
+            for key in text_keys(text):
+                keys.append(key)
+                kinds.append(code)
+                ids.append(obj_id)
+
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        index._keys = [keys[i] for i in order]
+        index._kinds = array('B', (kinds[i] for i in order))
+        index._ids = array('q', (ids[i] for i in order))
+        return index
+
+    def load(self, other: 'PrefixIndex') -> None:
+        self._keys, self._kinds, self._ids = other._keys, other._kinds, other._ids
+        self._texts, self._delta, self._deleted = other._texts, other._delta, other._deleted
+
+    def add(self, kind: str, obj_id: int, text: str) -> None:
+        ref = (KINDS.index(kind), obj_id)
+        if ref in self._texts:
+            self.remove(kind, obj_id)
+        self._texts[ref] = text
+        for key in text_keys(text):
+            insort(self._delta, (key, *ref))
+
+    def remove(self, kind: str, obj_id: int) -> None:
+        ref = (KINDS.index(kind), obj_id)
+        text = self._texts.pop(ref, None)
+        if text is None:
+            return
+        self._deleted.add(ref)
+        for key in text_keys(text):
+            i = bisect_left(self._delta, (key, *ref))
+            if i < len(self._delta) and self._delta[i] == (key, *ref):
+                del self._delta[i]
+
+    def _scan_main(self, key: str) -> Iterator[Tuple[str, int, int]]:
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key):
+            ref = (self._kinds[i], self._ids[i])
+            if ref not in self._deleted:
+                yield self._keys[i], ref[0], ref[1]
+            i += 1
+
+    def _scan_delta(self, key: str) -> Iterator[Tuple[str, int, int]]:
+        i = bisect_left(self._delta, (key,))
+        while i < len(self._delta) and self._delta[i][0].startswith(key):
+            yield self._delta[i]
+            i += 1
+
+    def search(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        query = normalize(prefix)
+        if not query:
+            return []
+        key = query[:MAX_KEY_LENGTH]
+
+        result = []
+        seen = set()
+        for _, code, obj_id in merge(self._scan_main(key), self._scan_delta(key)):
+            ref = (code, obj_id)
+            if ref in seen:
+                continue
+            seen.add(ref)
+            text = self._texts[ref]
+            if len(query) > MAX_KEY_LENGTH and not any(k.startswith(query) for k in _full_keys(text)):
+                continue
+            result.append({'kind': KINDS[code], 'id': obj_id, 'text': text})
+            if len(result) >= limit:
+                break
+        return result
+
+
+suggest_index = PrefixIndex()
+
+
+def _apply_change(index: PrefixIndex, event: str, data: Dict[str, Any]) -> None:
+    if event == 'add':
+        index.add(data['kind'], data['id'], data['text'])
+    elif event == 'remove':
+        index.remove(data['kind'], data['id'])
+
+
+class SuggestIndexSync:
+    """
+    Согласование индекса воркера с БД. Добавления и удаления приходят всем воркерам через
+    NOTIFY после коммита. Полная перестройка - при старте, после переподключения LISTEN
+    (уведомления за время разрыва потеряны) и после массового импорта (событие rebuild).
+    Изменения, пришедшие во время перестройки, применяются и к новому индексу перед подменой.
+    """
+
+    def __init__(self, index: PrefixIndex) -> None:
+        self._index = index
+        self._session_maker: Any = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._pending: Optional[List[Tuple[str, Dict[str, Any]]]] = None
+        self._queued = False
+        self._tasks: Set[asyncio.Task] = set()
+        self.rebuilds = 0
+
+    def start(self, session_maker: Any) -> None:
+        """
+        :param session_maker: Фабрика сессий для перестроек по уведомлениям.
+        """
+        self._session_maker = session_maker
+
+    def on_notification(self, event: str, data: Dict[str, Any]) -> None:
+        if event in (RESYNC_EVENT, REBUILD_EVENT):
+            self.schedule_rebuild()
+            return
+        _apply_change(self._index, event, data)
+        if self._pending is not None:
+            self._pending.append((event, data))
+
+    def schedule_rebuild(self) -> None:
+        # Уже ожидающая перестройка прочитает БД позже этого запроса
+        if self._session_maker is None or self._queued:
+            return
+        self._queued = True
+        task = asyncio.get_running_loop().create_task(self._scheduled_rebuild())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _scheduled_rebuild(self) -> None:
+        try:
+            async with self._session_maker() as session:
+                await self.rebuild(session)
+        except Exception:
+            logger.exception('Suggest index rebuild failed.')
+
+    async def rebuild(self, session: AsyncSession) -> int:
+        """
+        Полная перестройка индекса из БД. Сортировка выполняется в отдельном потоке,
+        новый индекс подменяет текущий целиком. Перестройки выполняются по одной.
+        :return: Кол-во ключей в индексе.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._queued = False
+            self._pending = []
+            try:
+                entries = []
+                for kind, (model, column) in SUGGEST_SOURCES.items():
+                    res = await session.stream(select(model.id, column).execution_options(yield_per=10000))
+                    async for obj_id, text in res:
+                        entries.append((kind, obj_id, text))
+
+                loop = asyncio.get_running_loop()
+                index = await loop.run_in_executor(None, PrefixIndex.from_entries, entries)
+                for event, data in self._pending:
+                    _apply_change(index, event, data)
+                self._index.load(index)
+            finally:
+                self._pending = None
+            self.rebuilds += 1
+        return len(self._index)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'size': len(self._index), 'rebuilds': self.rebuilds, 'rebuilding': self._pending is not None}
+
+
+suggest_sync = SuggestIndexSync(suggest_index)
+notification_listener.add_handler(SUGGEST_CHANNEL, suggest_sync.on_notification)
+register_metrics('suggest_index', suggest_sync.stats)
+
+
+def index_message(kind: str, obj_id: int, text: str) -> Message:
+    return SUGGEST_CHANNEL, 'add', {'kind': kind, 'id': obj_id, 'text': text[:MAX_NOTIFY_TEXT_LENGTH]}
+
+
+async def notify_indexed(instances: Iterable[Any], session: AsyncSession) -> None:
+    """
+    Добавление объектов в индексы всех воркеров. Вызывается в транзакции изменения
+    (id уже назначен): уведомления доставляются после коммита.
+    """
+    messages = []
+    for instance in instances:
+        kind = KIND_BY_MODEL.get(type(instance))
+        if kind is not None:
+            _, column = SUGGEST_SOURCES[kind]
+            messages.append(index_message(kind, instance.id, getattr(instance, column.key)))
+    await notify(messages, session)
+
+
+async def notify_unindexed(model: Any, instance_id: int, session: AsyncSession) -> None:
+    kind = KIND_BY_MODEL.get(model)
+    if kind is not None:
+        await notify([(SUGGEST_CHANNEL, 'remove', {'kind': kind, 'id': instance_id})], session)
+
+
+async def notify_rebuild(session: AsyncSession) -> None:
+    """
+    Полная перестройка индексов всех воркеров, например после массового импорта.
+    """
+    await notify([(SUGGEST_CHANNEL, REBUILD_EVENT, {})], session)
+
+
+async def refresh_suggest_index_periodically(session_maker, interval: Optional[int] = None) -> None:
+    """
+    Необязательная периодическая перестройка (SUGGEST_REFRESH_SECONDS, по умолчанию выключена):
+    индексы и так получают все изменения через NOTIFY.
+    """
+    interval = SUGGEST_REFRESH_SECONDS if interval is None else interval
+    while interval > 0:
+        await asyncio.sleep(interval)
+        try:
+            async with session_maker() as session:
+                await suggest_sync.rebuild(session)
+        except Exception:
+            logger.exception('Suggest index refresh failed.')
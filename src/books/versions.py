@@ -0,0 +1,130 @@
+from typing import Optional
+
+from sqlalchemy import column, func, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Кол-во строк счетчика каталога. Транзакции разных соединений увеличивают разные строки
+# и не ждут друг друга на блокировке одной строки.
+CATALOG_VERSION_SHARDS = 16
+
+# Версии для ETag: book.version растет при любом изменении книги и связанных с ней
+# авторов, тегов, комментариев; catalog_version - при добавлении и удалении книг и при
+# изменении колонок, которые выводит публичный список (выдача и возврат книг, меняющие
+# available, его не сбрасывают). Теги и комментарии доходят до него через book.version,
+# авторы - через search_vector.
+# Счетчики транзакционные, поэтому версия, прочитанная до запроса данных,
+# никогда не опережает сами данные.
+VERSION_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION book_version_on_book() RETURNS trigger AS $$
+    BEGIN
+        NEW.version := greatest(NEW.version, OLD.version + 1);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_version_on_book_tag() RETURNS trigger AS $$
+    BEGIN
+        UPDATE book SET version = version + 1
+        WHERE id IN (SELECT book_id FROM changed_rows);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_version_on_tag() RETURNS trigger AS $$
+    BEGIN
+        UPDATE book SET version = version + 1
+        WHERE id IN (SELECT book_id FROM book_tag WHERE tag_id = NEW.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION book_version_on_comment() RETURNS trigger AS $$
+    BEGIN
+        UPDATE book SET version = version + 1 WHERE id = NEW.book_id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION catalog_version_on_book() RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (SELECT FROM changed_rows) THEN
+            INSERT INTO catalog_version (shard, value) VALUES (pg_backend_pid() % {CATALOG_VERSION_SHARDS}, 1)
+            ON CONFLICT (shard) DO UPDATE SET value = catalog_version.value + 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION catalog_version_bump() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO catalog_version (shard, value) VALUES (pg_backend_pid() % {CATALOG_VERSION_SHARDS}, 1)
+        ON CONFLICT (shard) DO UPDATE SET value = catalog_version.value + 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER book_version_update
+    BEFORE UPDATE ON book
+    FOR EACH ROW EXECUTE FUNCTION book_version_on_book()
+    """,
+    """
+    CREATE TRIGGER book_tag_version_insert
+    AFTER INSERT ON book_tag REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_version_on_book_tag()
+    """,
+    """
+    CREATE TRIGGER book_tag_version_delete
+    AFTER DELETE ON book_tag REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_version_on_book_tag()
+    """,
+    """
+    CREATE TRIGGER tag_version_update
+    AFTER UPDATE OF content ON tag
+    FOR EACH ROW WHEN (OLD.content IS DISTINCT FROM NEW.content)
+    EXECUTE FUNCTION book_version_on_tag()
+    """,
+    """
+    CREATE TRIGGER comment_version_update
+    AFTER UPDATE OF content ON comment
+    FOR EACH ROW WHEN (OLD.content IS DISTINCT FROM NEW.content)
+    EXECUTE FUNCTION book_version_on_comment()
+    """,
+    """
+    CREATE TRIGGER catalog_version_insert
+    AFTER INSERT ON book REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_on_book()
+    """,
+    """
+    CREATE TRIGGER catalog_version_update
+    AFTER UPDATE OF title, year_published, description, rating_sum, rating_count, comment_count,
+        search_vector, version ON book
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_bump()
+    """,
+    """
+    CREATE TRIGGER catalog_version_delete
+    AFTER DELETE ON book REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_version_on_book()
+    """,
+]
+
+_book = table('book', column('id'), column('version'))
+_catalog_version = table('catalog_version', column('value'))
+
+
+async def get_book_version(book_id: int, session: AsyncSession) -> Optional[int]:
+    """
+    Версия книги по первичному ключу, без загрузки самой книги.
+    :return: None, если книги нет.
+    """
+    return await session.scalar(select(_book.c.version).where(_book.c.id == book_id))
+
+
+async def get_catalog_version(session: AsyncSession) -> int:
+    return await session.scalar(select(func.coalesce(func.sum(_catalog_version.c.value), 0)))
@@ -0,0 +1,139 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import CACHE_BACKEND, CACHE_URL, CACHE_TTL, CACHE_MAX_SIZE
+
+
+class CacheBackend(ABC):
+    """
+    Базовый кэш строк по ключу. Реализации определяют _get, _set, _delete.
+    """
+
+    def __init__(self, ttl: int = CACHE_TTL) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        await self._set(key, value, self.ttl if ttl is None else ttl)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._delete(*keys)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def _set(self, key: str, value: str, ttl: int) -> None:
+        ...
+
+    @abstractmethod
+    async def _delete(self, *keys: str) -> None:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    LRU с TTL в памяти процесса.
+    """
+
+    def __init__(self, ttl: int = CACHE_TTL, max_size: int = CACHE_MAX_SIZE) -> None:
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._data: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+
+    async def _get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.evictions += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def _set(self, key: str, value: str, ttl: int) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def _delete(self, *keys: str) -> None:
+        self.discard(*keys)
+
+    def discard(self, *keys: str) -> None:
+        """
+        Синхронное удаление, для обработчиков вне корутин.
+        """
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def stats(self) -> Dict[str, Any]:
+        stats = await super().stats()
+        stats['size'] = len(self._data)
+        return stats
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Кэш вне процесса, общий для всех воркеров. Требует пакет redis.
+    """
+
+    def __init__(self, url: str, ttl: int = CACHE_TTL) -> None:
+        super().__init__(ttl)
+        from redis import asyncio as aioredis
+        self._redis = aioredis.from_url(url, decode_responses=True)
+
+    async def _get(self, key: str) -> Optional[str]:
+        return await self._redis.get(key)
+
+    async def _set(self, key: str, value: str, ttl: int) -> None:
+        await self._redis.set(key, value, ex=ttl)
+
+    async def _delete(self, *keys: str) -> None:
+        await self._redis.delete(*keys)
+
+    async def stats(self) -> Dict[str, Any]:
+        """
+        Вытеснение ключей выполняет Redis, сам кэш его не видит: evictions не выводится.
+        Счетчики INFO - по всему серверу Redis, а не только по ключам этого кэша.
+        """
+        stats = await super().stats()
+        del stats['evictions']
+        info = await self._redis.info('stats')
+        stats['server_evicted_keys'] = info.get('evicted_keys', 0)
+        stats['server_expired_keys'] = info.get('expired_keys', 0)
+        return stats
+
+
+def create_cache_backend(backend: str = CACHE_BACKEND, url: Optional[str] = CACHE_URL) -> CacheBackend:
+    if backend == 'redis':
+        return RedisCacheBackend(url)
+    return MemoryCacheBackend()
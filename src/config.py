@@ -5,5 +5,69 @@ load_dotenv()
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+# Реплика для публичных GET, без нее все запросы идут в DATABASE_URL
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
 JWT_SECRET = os.environ.get('JWT_SECRET')
 JWY_ALGORITHM = os.environ.get('JWY_ALGORITHM')
+
+TRGM_SIMILARITY_THRESHOLD = float(os.environ.get('TRGM_SIMILARITY_THRESHOLD', 0.3))
+# Периодическая полная перестройка индекса автодополнения, 0 - выключена (изменения приходят через NOTIFY)
+SUGGEST_REFRESH_SECONDS = int(os.environ.get('SUGGEST_REFRESH_SECONDS', 0))
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_URL = os.environ.get('CACHE_URL')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+CACHE_MAX_SIZE = int(os.environ.get('CACHE_MAX_SIZE', 10000))
+
+# Cache-Control публичных эндпоинтов каталога: клиент перепроверяет ETag, CDN хранит s-maxage секунд
+HTTP_CACHE_CONTROL = os.environ.get('HTTP_CACHE_CONTROL', 'public, max-age=0, s-maxage=30')
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+
+RESERVATION_HOLD_SECONDS = int(os.environ.get('RESERVATION_HOLD_SECONDS', 48 * 60 * 60))
+RESERVATION_RESCAN_SECONDS = int(os.environ.get('RESERVATION_RESCAN_SECONDS', 300))
+SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+
+# Отдельное соединение LISTEN для событий между воркерами: в обход пула и pgbouncer в режиме transaction
+EVENTS_DATABASE_URL = os.environ.get('EVENTS_DATABASE_URL', DATABASE_URL)
+EVENTS_LISTEN_CHECK_SECONDS = int(os.environ.get('EVENTS_LISTEN_CHECK_SECONDS', 30))
+
+# bcrypt вне цикла событий: thread (bcrypt отпускает GIL) или process, кол-во воркеров пула
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+# Больше запросов в очереди к пулу - 503, вход при наплыве не отнимает воркер у каталога
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 64))
+
+# Пользователь для зависимостей get_current_user: cache - кэш в памяти процесса (сброс через NOTIFY),
+# db - запрос на каждый вызов. Только данные токена - зависимость get_current_user_claims
+AUTH_USER_LOOKUP = os.environ.get('AUTH_USER_LOOKUP', 'cache')
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 10000))
+
+# Кол-во проверенных JWT в LRU процесса, 0 - проверять подпись на каждый запрос
+JWT_CACHE_MAX_SIZE = int(os.environ.get('JWT_CACHE_MAX_SIZE', 10000))
+
+# Живых refresh-токенов на пользователя (устройств), при входе сверх лимита удаляются самые старые
+REFRESH_TOKENS_PER_USER = int(os.environ.get('REFRESH_TOKENS_PER_USER', 10))
+REFRESH_TOKEN_PURGE_SECONDS = int(os.environ.get('REFRESH_TOKEN_PURGE_SECONDS', 3600))
+REFRESH_TOKEN_PURGE_BATCH = int(os.environ.get('REFRESH_TOKEN_PURGE_BATCH', 10000))
+
+# Пул соединений БД на процесс. DB_POOL_RECYCLE -1 - не пересоздавать соединения по времени
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 20))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'false').lower() in ('1', 'true', 'yes')
+# Кэш подготовленных запросов asyncpg на соединение
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+# statement_timeout сервера в мс, 0 - без ограничения. С pgbouncer не передается,
+# задается для роли: ALTER ROLE ... SET statement_timeout
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+# pgbouncer в режиме transaction/statement: без кэшей подготовленных запросов и с уникальными именами
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes')
+
+# Отставание реплики в секундах, сверх которого чтения уходят на основную БД;
+# отставание проверяется не чаще раза в DB_REPLICA_LAG_CHECK_SECONDS
+DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('DB_REPLICA_LAG_CHECK_SECONDS', 1))
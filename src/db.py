@@ -1,13 +1,191 @@
-from typing import AsyncGenerator
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Dict, Optional
+from uuid import uuid4
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import orjson
+from asyncpg import Connection
+from fastapi import Depends
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from .config import DATABASE_URL
+from .config import (
+    DATABASE_URL,
+    DATABASE_REPLICA_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_STATEMENT_TIMEOUT_MS,
+    DB_PGBOUNCER,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_LAG_CHECK_SECONDS,
+)
+from .metrics import register_metrics
 
-engine = create_async_engine(DATABASE_URL)
+# Последние ожидания выдачи соединения для перцентилей в метриках
+POOL_WAIT_SAMPLES = 1000
+REPLICA_LAG_CHECK_TIMEOUT = 1
+
+# Реплика без новых WAL (простой основной БД) не отстает, хотя время последней транзакции старое
+REPLICA_LAG_QUERY = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN 0 ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class PgBouncerConnection(Connection):
+    """
+    Имена подготовленных запросов asyncpg - счетчик процесса, у разных воркеров они совпадают.
+    За pgbouncer воркеры делят серверные соединения, поэтому имена должны быть уникальными.
+    """
+
+    def _get_unique_id(self, prefix: str) -> str:
+        return f'__asyncpg_{prefix}_{uuid4().hex}__'
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул, замеряющий ожидание выдачи соединения: при нехватке соединений запросы
+    стоят в очереди пула, и это видно в метриках, а не только по задержке ответов.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.waits: 'deque[float]' = deque(maxlen=POOL_WAIT_SAMPLES)
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        self.waits.append(time.perf_counter() - started)
+        self.checkouts += 1
+        return connection
+
+    def recreate(self) -> 'InstrumentedPool':
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        return pool
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+        max_connections = self.size() + self._max_overflow
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'max_connections': max_connections,
+            'occupancy': round(self.checkedout() / max_connections, 3) if max_connections else None,
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_p50_ms': round(waits[len(waits) // 2] * 1000, 3) if waits else None,
+            'wait_p99_ms': round(waits[int(len(waits) * 0.99)] * 1000, 3) if waits else None,
+            'wait_max_ms': round(waits[-1] * 1000, 3) if waits else None,
+        }
+
+
+def engine_options() -> Dict[str, Any]:
+    connect_args: Dict[str, Any] = {'statement_cache_size': DB_STATEMENT_CACHE_SIZE}
+    if DB_PGBOUNCER:
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            connection_class=PgBouncerConnection,
+        )
+    elif DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args['server_settings'] = {'statement_timeout': str(DB_STATEMENT_TIMEOUT_MS)}
+
+    return {
+        'poolclass': InstrumentedPool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+        # json_agg в списках книг
+        'json_deserializer': orjson.loads,
+    }
+
+
+class ReplicaLagGuard:
+    """
+    Отставание реплики, проверяемое не чаще раза в check_interval. Пока отставание
+    больше max_lag или реплика не отвечает, чтения идут на основную БД.
+    """
+
+    def __init__(self, engine: AsyncEngine, max_lag: float = DB_REPLICA_MAX_LAG,
+                 check_interval: float = DB_REPLICA_LAG_CHECK_SECONDS) -> None:
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: Optional[float] = None
+        self.fallbacks = 0
+        self.errors = 0
+        self._checked_at = float('-inf')
+        # Создается в цикле событий воркера, а не при импорте
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def healthy(self) -> bool:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                # Пока ждали блокировку, отставание мог проверить другой запрос
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    await self.check()
+        if self.lag is not None and self.lag <= self.max_lag:
+            return True
+        self.fallbacks += 1
+        return False
+
+    async def check(self) -> None:
+        try:
+            self.lag = await asyncio.wait_for(self._query_lag(), timeout=REPLICA_LAG_CHECK_TIMEOUT)
+        except (exc.SQLAlchemyError, OSError, asyncio.TimeoutError):
+            self.errors += 1
+            self.lag = None
+        finally:
+            self._checked_at = time.monotonic()
+
+    async def _query_lag(self) -> Optional[float]:
+        async with self.engine.connect() as connection:
+            lag = await connection.scalar(REPLICA_LAG_QUERY)
+        return float(lag) if lag is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'lag_seconds': self.lag,
+            'max_lag_seconds': self.max_lag,
+            'fallbacks': self.fallbacks,
+            'errors': self.errors,
+            'pool': self.engine.pool.stats(),
+        }
+
+
+engine = create_async_engine(DATABASE_URL, **engine_options())
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+register_metrics('db_pool', lambda: engine.pool.stats())
+
+read_engine: Optional[AsyncEngine] = None
+replica_guard: Optional[ReplicaLagGuard] = None
+if DATABASE_REPLICA_URL:
+    read_engine = create_async_engine(DATABASE_REPLICA_URL, **engine_options())
+    replica_guard = ReplicaLagGuard(read_engine)
+    register_metrics('db_replica', replica_guard.stats)
+async_read_session_maker = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -15,3 +193,18 @@ Base = declarative_base()
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+
+async def get_async_read_session(
+        session: AsyncSession = Depends(get_async_session)
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия только для чтения: реплика, если она настроена и не отстает, иначе основная БД.
+    Сессия основной БД не берет соединение, пока к ней нет запросов.
+    Записи и чтения сразу после записи (ответ на изменение) - только через get_async_session.
+    """
+    if replica_guard is None or not await replica_guard.healthy():
+        yield session
+        return
+    async with async_read_session_maker() as read_session:
+        yield read_session
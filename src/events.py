@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import asyncpg
+from sqlalchemy import select, func, bindparam, cast, Text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import SSE_KEEPALIVE_SECONDS, EVENTS_DATABASE_URL, EVENTS_LISTEN_CHECK_SECONDS
+from src.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Очередь подписчика не растет бесконечно: медленный клиент теряет старые события
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Канал Postgres NOTIFY, через который события доходят до брокеров всех воркеров
+EVENTS_CHANNEL = 'library_events'
+
+# Событие всем подписчикам воркера после переподключения LISTEN: уведомления за время
+# разрыва потеряны, клиент должен перечитать состояние
+RESYNC_EVENT = 'resync'
+
+KEEPALIVE = ': keepalive\n\n'
+
+Message = Tuple[str, str, Dict[str, Any]]
+
+
+class EventBroker:
+    """
+    Pub/sub в памяти процесса: канал - множество очередей подписчиков.
+    В очереди - готовые сообщения SSE: событие сериализуется один раз на всех подписчиков.
+    Keepalive для всех подписчиков шлет одна задача, а не таймер на каждое соединение.
+    """
+
+    def __init__(self, keepalive_interval: int = SSE_KEEPALIVE_SECONDS) -> None:
+        self._channels: Dict[str, Set[asyncio.Queue]] = {}
+        self._keepalive_interval = keepalive_interval
+        self._keepalive: Optional[asyncio.Task] = None
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, channels: Iterable[str]) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        for channel in channels:
+            self._channels.setdefault(channel, set()).add(queue)
+        if self._keepalive is None or self._keepalive.done():
+            self._keepalive = asyncio.create_task(self._send_keepalive())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, channels: Iterable[str]) -> None:
+        for channel in channels:
+            subscribers = self._channels.get(channel)
+            if subscribers is None:
+                continue
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._channels[channel]
+
+    def _put(self, queue: asyncio.Queue, message: str) -> None:
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(message)
+
+    def _queues(self) -> Set[asyncio.Queue]:
+        return {queue for subscribers in self._channels.values() for queue in subscribers}
+
+    def publish(self, channel: str, event: str, data: Dict[str, Any]) -> None:
+        self.published += 1
+        subscribers = self._channels.get(channel)
+        if not subscribers:
+            return
+        message = format_sse(event, data)
+        for queue in subscribers:
+            self._put(queue, message)
+
+    def publish_all(self, event: str, data: Dict[str, Any]) -> None:
+        message = format_sse(event, data)
+        for queue in self._queues():
+            self._put(queue, message)
+
+    async def _send_keepalive(self) -> None:
+        while self._channels:
+            await asyncio.sleep(self._keepalive_interval)
+            for queue in self._queues():
+                # Полной очереди есть что отправить, keepalive не должен вытеснять события
+                if queue.empty():
+                    queue.put_nowait(KEEPALIVE)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'channels': len(self._channels),
+            'subscriptions': sum(len(subscribers) for subscribers in self._channels.values()),
+            'published': self.published,
+            'dropped': self.dropped,
+        }
+
+
+broker = EventBroker()
+
+
+def notification_payload(channel: str, event: str, data: Dict[str, Any]) -> str:
+    return json.dumps({'channel': channel, 'event': event, 'data': data}, default=str, ensure_ascii=False)
+
+
+async def notify(messages: Iterable[Message], session: AsyncSession) -> None:
+    """
+    Публикация событий через NOTIFY в транзакции сессии, одним запросом.
+    Postgres доставляет их слушателям только после коммита, отмененная транзакция событий не порождает.
+    :param messages: (канал брокера, событие, данные)
+    """
+    payloads = [notification_payload(*message) for message in messages]
+    if not payloads:
+        return
+    # Тип массива указывается явно: asyncpg не выводит его для unnest($1)
+    payloads_param = cast(bindparam('payloads', payloads, type_=ARRAY(Text)), ARRAY(Text))
+    rows = func.unnest(payloads_param).table_valued('payload').render_derived()
+    await session.execute(select(func.pg_notify(EVENTS_CHANNEL, rows.c.payload)).select_from(rows))
+
+
+Handler = Callable[[str, Dict[str, Any]], None]
+
+
+class NotificationListener:
+    """
+    Мост Postgres LISTEN -> брокер процесса. Держит одно соединение asyncpg на воркер,
+    проверяет его раз в check_interval секунд и переподключается при обрыве.
+    Кроме брокера, события канала получают обработчики add_handler (например, сброс кэшей),
+    после переподключения они вызываются с событием resync.
+    """
+
+    def __init__(self, event_broker: EventBroker) -> None:
+        self._broker = event_broker
+        self._handlers: Dict[str, List[Handler]] = {}
+        self.connected = False
+        self.received = 0
+        self.reconnects = 0
+
+    def add_handler(self, channel: str, handler: Handler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def _call_handlers(self, channel: str, event: str, data: Dict[str, Any]) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(event, data)
+            except Exception:
+                logger.exception('Notification handler failed.')
+
+    def _on_notification(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            channel, event, data = message['channel'], message['event'], message['data']
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Malformed notification: %r', payload)
+            return
+        self.received += 1
+        self._call_handlers(channel, event, data)
+        self._broker.publish(channel, event, data)
+
+    async def run(self, url: Optional[str] = None, check_interval: Optional[int] = None) -> None:
+        dsn = make_url(url or EVENTS_DATABASE_URL).set(drivername='postgresql').render_as_string(hide_password=False)
+        check_interval = EVENTS_LISTEN_CHECK_SECONDS if check_interval is None else check_interval
+        first = True
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                await connection.add_listener(EVENTS_CHANNEL, self._on_notification)
+                self.connected = True
+                if not first:
+                    self.reconnects += 1
+                    for handler_channel in self._handlers:
+                        self._call_handlers(handler_channel, RESYNC_EVENT, {})
+                    self._broker.publish_all(RESYNC_EVENT, {})
+                first = False
+                while True:
+                    await asyncio.sleep(check_interval)
+                    await connection.execute('SELECT 1')
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                logger.exception('Event listener connection lost.')
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+            await asyncio.sleep(min(check_interval, 5))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'listening': self.connected, 'received': self.received, 'reconnects': self.reconnects}
+
+
+notification_listener = NotificationListener(broker)
+register_metrics('events', lambda: {**broker.stats(), **notification_listener.stats()})
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f'event: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n'
+
+
+async def sse_stream(
+        channels: Iterable[str],
+        snapshot: Optional[Callable[[], Awaitable[Iterable[Tuple[str, Dict[str, Any]]]]]] = None,
+) -> AsyncIterator[str]:
+    """
+    Поток Server-Sent Events из каналов брокера, с комментарием-keepalive при простое.
+    Подписка снимается при отключении клиента: StreamingResponse отменяет генератор.
+    :param snapshot: Текущее состояние (событие, данные), отправляется первым. Читается уже после
+        подписки, поэтому изменения между ними не теряются.
+    """
+    channels = list(channels)
+    queue = broker.subscribe(channels)
+    try:
+        yield ': connected\n\n'
+        if snapshot is not None:
+            for event, data in await snapshot():
+                yield format_sse(event, data)
+        while True:
+            yield await queue.get()
+    finally:
+        broker.unsubscribe(queue, channels)
@@ -1,3 +1,5 @@
+from typing import Dict, Optional
+
 from fastapi import HTTPException, status
 
 
@@ -11,14 +13,17 @@ class ErrorMsg:
     INVALID_REFRESH_TOKEN = 'Refresh token is not valid.'
     NOT_FOUND = 'Object not found.'
     NO_DATA = 'No data given.'
+    INVALID_CURSOR = 'Invalid pagination cursor.'
+    OVERLOADED = 'Server is busy, try again later.'
 
 
 class BaseHTTPException(HTTPException):
     STATUS_CODE = status.HTTP_500_INTERNAL_SERVER_ERROR
     DETAIL = 'Server error'
+    HEADERS: Optional[Dict[str, str]] = None
 
     def __init__(self) -> None:
-        super().__init__(status_code=self.STATUS_CODE, detail=self.DETAIL)
+        super().__init__(status_code=self.STATUS_CODE, detail=self.DETAIL, headers=self.HEADERS)
 
 
 class InvalidTokenException(BaseHTTPException):
@@ -55,3 +60,13 @@ class ObjNotFoundException(BaseHTTPException):
 class InvalidDataException(BaseHTTPException):
     STATUS_CODE = status.HTTP_422_UNPROCESSABLE_ENTITY
     DETAIL = ErrorMsg.NO_DATA
+
+
+class InvalidCursorException(InvalidDataException):
+    DETAIL = ErrorMsg.INVALID_CURSOR
+
+
+class ServiceOverloadedException(BaseHTTPException):
+    STATUS_CODE = status.HTTP_503_SERVICE_UNAVAILABLE
+    DETAIL = ErrorMsg.OVERLOADED
+    HEADERS = {'Retry-After': '1'}
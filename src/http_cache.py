@@ -0,0 +1,45 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Response, status
+
+from src.config import HTTP_CACHE_CONTROL
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Сильный ETag из версии данных и параметров запроса.
+    """
+    raw = json.dumps(parts, separators=(',', ':'), sort_keys=True, default=str)
+    return '"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Сравнение с заголовком If-None-Match (слабое сравнение, RFC 9110).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(','))
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in tags)
+
+
+def set_cache_headers(response: Response, etag: Optional[str] = None) -> Response:
+    response.headers['Cache-Control'] = HTTP_CACHE_CONTROL
+    if etag is not None:
+        response.headers['ETag'] = etag
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    return set_cache_headers(Response(status_code=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+def public_cache(response: Response) -> None:
+    """
+    Зависимость для публичных эндпоинтов без ETag.
+    """
+    set_cache_headers(response)
@@ -1,12 +1,23 @@
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from src.books.router import router as router_books
 from src.books.router_admin import router as router_books_admin
 from src.auth.router import router as router_auth
+from src.metrics import router as router_metrics
+from src.books.reservations import hold_scheduler
+from src.books.suggest import suggest_sync, refresh_suggest_index_periodically
+from src.db import async_session_maker
+from src.events import notification_listener
+from src.auth.utils import password_hasher
+from src.auth.service import purge_refresh_tokens_periodically
 
 app = FastAPI(
-    title='Library fastapi'
+    title='Library fastapi',
+    default_response_class=ORJSONResponse
 )
 
 app.include_router(
@@ -21,5 +32,58 @@ app.include_router(
     router=router_auth
 )
 
+app.include_router(
+    router=router_metrics
+)
+
+
+@app.on_event('startup')
+async def build_suggest_index():
+    suggest_sync.start(async_session_maker)
+    async with async_session_maker() as session:
+        await suggest_sync.rebuild(session)
+    app.state.suggest_refresh = asyncio.create_task(refresh_suggest_index_periodically(async_session_maker))
+
+
+@app.on_event('shutdown')
+async def stop_suggest_index_refresh():
+    app.state.suggest_refresh.cancel()
+
+
+@app.on_event('startup')
+async def start_hold_scheduler():
+    app.state.hold_scheduler = asyncio.create_task(hold_scheduler.run(async_session_maker))
+
+
+@app.on_event('shutdown')
+async def stop_hold_scheduler():
+    app.state.hold_scheduler.cancel()
+
+
+@app.on_event('startup')
+async def start_notification_listener():
+    app.state.notification_listener = asyncio.create_task(notification_listener.run())
+
+
+@app.on_event('shutdown')
+async def stop_notification_listener():
+    app.state.notification_listener.cancel()
+
+
+@app.on_event('startup')
+async def start_refresh_token_purge():
+    app.state.refresh_token_purge = asyncio.create_task(purge_refresh_tokens_periodically(async_session_maker))
+
+
+@app.on_event('shutdown')
+async def stop_refresh_token_purge():
+    app.state.refresh_token_purge.cancel()
+
+
+@app.on_event('shutdown')
+async def stop_password_hasher():
+    password_hasher.shutdown()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,40 @@
+import inspect
+from typing import Any, Callable, Dict
+
+from fastapi import APIRouter, Depends, status
+
+from src.auth.jwt import decode_jwt_data_admin
+from src.auth.schema import JWTData
+
+# Имя группы метрик - функция (обычная или async), возвращающая словарь значений
+_collectors: Dict[str, Callable[[], Any]] = {}
+
+
+def register_metrics(name: str, collector: Callable[[], Any]) -> None:
+    _collectors[name] = collector
+
+
+async def collect_metrics() -> Dict[str, Dict[str, Any]]:
+    metrics = {}
+    for name, collector in _collectors.items():
+        value = collector()
+        if inspect.isawaitable(value):
+            value = await value
+        metrics[name] = value
+    return metrics
+
+
+router = APIRouter(
+    prefix='/metrics',
+    tags=['Metrics']
+)
+
+
+@router.get('/', status_code=status.HTTP_200_OK)
+async def get_metrics(
+        jwt_data: JWTData = Depends(decode_jwt_data_admin)
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Внутренние счетчики процесса (кэши, пулы). Значения у каждого воркера свои.
+    """
+    return await collect_metrics()
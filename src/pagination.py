@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+from typing import Generic, List, Optional, TypeVar, Any, Dict
+
+from pydantic.generics import GenericModel
+from sqlalchemy import Select, select, tuple_, literal_column
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+
+from src.exceptions import InvalidCursorException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+ItemT = TypeVar('ItemT')
+
+
+class Page(GenericModel, Generic[ItemT]):
+    items: List[ItemT] = []
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _key_type(key: ColumnElement) -> Optional[type]:
+    try:
+        return key.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _matches_type(value: Any, expected: Optional[type]) -> bool:
+    if expected is None:
+        return True
+    if isinstance(value, bool):
+        return expected is bool
+    if expected is float:
+        return isinstance(value, (int, float))
+    if expected is int:
+        # Ключи-id - integer Postgres, больше значение asyncpg не передаст
+        return isinstance(value, int) and -2 ** 31 <= value < 2 ** 31
+    return isinstance(value, expected)
+
+
+def decode_cursor(
+        cursor: Optional[str],
+        size: int,
+        types: Optional[List[Optional[type]]] = None,
+) -> Optional[List[Any]]:
+    """
+    :param size: Кол-во ключей сортировки.
+    :param types: Типы значений ключей (int для id, float для ранга, str для имени), None - без проверки.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise InvalidCursorException
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorException
+    if types is not None and not all(_matches_type(value, expected) for value, expected in zip(values, types)):
+        raise InvalidCursorException
+    return values
+
+
+async def estimate_count(query: Select, session: AsyncSession) -> int:
+    """
+    Оценка кол-ва строк запроса по плану Postgres (EXPLAIN), без полного COUNT(*).
+    """
+    count_query = select(literal_column('1')).select_from(query.subquery())
+    compiled = count_query.compile(dialect=postgresql.dialect(paramstyle='named'),
+                                   compile_kwargs={'literal_binds': True})
+    connection = await session.connection()
+    res = await connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}')
+    plan = res.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+async def paginate(
+        query: Select,
+        session: AsyncSession,
+        keys: List[ColumnElement],
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        descending: bool = False,
+        rows: bool = False,
+) -> Dict[str, Any]:
+    """
+    Keyset-пагинация: WHERE (keys) > (cursor) ORDER BY keys LIMIT limit + 1.
+    :param query: Запрос с фильтрами, без сортировки и лимита.
+    :param keys: Уникальный набор колонок сортировки, последняя - первичный ключ.
+        Значения курсора берутся из одноименных атрибутов элементов (key.key).
+    :param limit: Кол-во элементов на странице.
+    :param cursor: Непрозрачный курсор из next_cursor предыдущей страницы.
+    :param with_total: Добавить оценку общего кол-ва элементов.
+    :param descending: Сортировка по убыванию ключей.
+    :param rows: Элементы - строки результата (запрос колонок), а не объекты ORM.
+    :return: Словарь для схемы Page.
+    """
+    total = await estimate_count(query, session) if with_total else None
+
+    values = decode_cursor(cursor, len(keys), [_key_type(key) for key in keys])
+    if values is not None:
+        key = keys[0] if len(keys) == 1 else tuple_(*keys)
+        value = values[0] if len(keys) == 1 else tuple_(*values)
+        query = query.where(key < value if descending else key > value)
+
+    order_by = [key.desc() for key in keys] if descending else keys
+    query = query.order_by(*order_by).limit(limit + 1)
+    res = await session.execute(query)
+    items = res.all() if rows else res.unique().scalars().all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([getattr(items[-1], key.key) for key in keys])
+
+    return {'items': items, 'next_cursor': next_cursor, 'total': total}
@@ -4,17 +4,16 @@ from typing import AsyncGenerator
 import pytest_asyncio
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from src.auth.jwt import create_access_token
+from src.auth.service import create_refresh_token
 from src.auth.schema import JWTData
 from src.config import TEST_DATABASE_URL
 from src.db import Base, get_async_session
 from src.main import app
 
-from src.auth.models import AuthRefreshToken
 
 metadata = Base.metadata
 
@@ -57,12 +56,11 @@ def event_loop(request):
     loop.close()
 
 
-@pytest_asyncio.fixture(scope='session')
+@pytest_asyncio.fixture
 async def get_refresh_token_db() -> str:
+    """ В БД только хеш токена, поэтому токен выпускается заново """
     async with async_session_maker() as session:
-        query = select(AuthRefreshToken).where(AuthRefreshToken.user_id == 1)
-        db_refresh_token = await session.scalar(query)
-        return db_refresh_token.refresh_token
+        return await create_refresh_token(1, session)
 
 
 @pytest_asyncio.fixture(scope='session')
@@ -5,7 +5,7 @@ from factory import fuzzy
 from factory.alchemy import SESSION_PERSISTENCE_FLUSH, SESSION_PERSISTENCE_COMMIT
 
 from src.auth.models import User
-from src.books.models import Book, Author, Tag
+from src.books.models import Book, Author, Tag, Rating, Comment
 from .conftest import async_session_maker
 
 
@@ -45,7 +45,7 @@ class UserFactory(AsyncFactory):
 
     email = 'email@gmail.com'
     username = 'testuser'
-    hashed_password = 'somepassword'
+    hashed_password = b'somepassword'
 
 
 class AuthorFactory(AsyncFactory):
@@ -78,3 +78,21 @@ class BookFactory(AsyncFactory):
     quantity = 10
     available = quantity
     authors = []
+
+
+class RatingFactory(AsyncFactory):
+    class Meta:
+        model = Rating
+        sqlalchemy_session = async_session_maker()
+        sqlalchemy_session_persistence = "commit"
+
+    value = fuzzy.FuzzyInteger(0, 5)
+
+
+class CommentFactory(AsyncFactory):
+    class Meta:
+        model = Comment
+        sqlalchemy_session = async_session_maker()
+        sqlalchemy_session_persistence = "commit"
+
+    content = fuzzy.FuzzyText(length=100)
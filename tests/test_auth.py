@@ -1,5 +1,22 @@
+import asyncio
+from datetime import datetime, timedelta
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import select, func, update
+
+from src.auth.dependencies import get_current_user, get_current_user_claims
+from src.auth.jwt import VerifiedTokenCache, create_access_token
+from src.auth.models import User, AuthRefreshToken
+from src.auth.service import create_refresh_token, purge_expired_refresh_tokens
+from src.auth.schema import JWTData
+from src.auth.user_cache import UserCache
+from src.auth.utils import PasswordHasher, hash_password, hash_refresh_token
+from src.config import TEST_DATABASE_URL, REFRESH_TOKENS_PER_USER
+from src.events import EventBroker, NotificationListener
+from src.exceptions import ServiceOverloadedException, InvalidTokenException
+from .conftest import async_session_maker
+from .factories import UserFactory
 
 
 class TestRegistration:
@@ -71,6 +88,17 @@ class TestRefreshTokens:
         assert response.cookies.get('access_token')
         assert response.cookies.get('refresh_token')
 
+    @pytest.mark.asyncio
+    async def test_refresh_concurrent(self, get_test_client: AsyncClient, get_refresh_token_db: str):
+        responses = await asyncio.gather(*(
+            get_test_client.put(self.endpoint, cookies={'refresh_token': get_refresh_token_db})
+            for _ in range(5)
+        ))
+        assert sorted(response.status_code for response in responses) == [200, 400, 400, 400, 400]
+
+        response = await get_test_client.put(self.endpoint, cookies={'refresh_token': get_refresh_token_db})
+        assert response.status_code == 400
+
     @pytest.mark.asyncio
     async def test_refresh_wrong_token(self, get_test_client: AsyncClient):
         response = await get_test_client.put(self.endpoint,
@@ -116,6 +144,15 @@ class TestLogout:
         assert response.cookies.get('access_token', None) is None
         assert response.cookies.get('refresh_token', None) is None
 
+    @pytest.mark.asyncio
+    async def test_logout_twice(self, get_test_client: AsyncClient, get_refresh_token_db: str):
+        response = await get_test_client.delete(self.endpoint,
+                                                cookies={'refresh_token': get_refresh_token_db})
+        assert response.status_code == 200
+        response = await get_test_client.delete(self.endpoint,
+                                                cookies={'refresh_token': get_refresh_token_db})
+        assert response.status_code == 400
+
     @pytest.mark.asyncio
     async def test_logout_no_token(self, get_test_client: AsyncClient):
         response = await get_test_client.delete(self.endpoint)
@@ -126,3 +163,120 @@ class TestLogout:
         response = await get_test_client.delete(self.endpoint,
                                                 cookies={'refresh_token': 'get_refresh_token_db'})
         assert response.status_code == 400
+
+
+class TestPasswordHasher:
+
+    @pytest.mark.asyncio
+    async def test_check_password(self):
+        hasher = PasswordHasher(workers=1, max_pending=4)
+        hashed = await hasher.hash('Qwe123!')
+        assert await hasher.check('Qwe123!', hashed)
+        assert not await hasher.check('Qwe1234!', hashed)
+        hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_overloaded(self):
+        hasher = PasswordHasher(workers=1, max_pending=1)
+        hashed = hash_password('Qwe123!')
+        results = await asyncio.gather(*(hasher.check('Qwe123!', hashed) for _ in range(3)),
+                                       return_exceptions=True)
+        assert results[:2] == [True, True]
+        assert isinstance(results[2], ServiceOverloadedException)
+        assert results[2].status_code == 503
+        assert hasher.stats()['rejected'] == 1
+        hasher.shutdown()
+
+
+class TestUserCache:
+
+    @pytest.mark.asyncio
+    async def test_user_cache_invalidation(self):
+        user = await UserFactory.create(email='cached@gmail.com', username='cached_user')
+        cache = UserCache()
+        # Свой слушатель: обработчик теста не остается в общем notification_listener
+        notification_listener = NotificationListener(EventBroker())
+        notification_listener.add_handler('users', cache.on_notification)
+        listener = asyncio.create_task(notification_listener.run(TEST_DATABASE_URL))
+        try:
+            async with async_session_maker() as session:
+                cached = await cache.get(user.id, session)
+                assert cached.username == user.username
+                assert (await cache.get(user.id, session)).username == user.username
+                assert (await cache.stats())['hits'] == 1
+
+                while not notification_listener.connected:
+                    await asyncio.sleep(0.05)
+                await session.execute(update(User).where(User.id == user.id).values(username='renamed_user'))
+                await session.commit()
+
+                for _ in range(100):
+                    if (await cache.stats())['size'] == 0:
+                        break
+                    await asyncio.sleep(0.05)
+                assert (await cache.get(user.id, session)).username == 'renamed_user'
+        finally:
+            listener.cancel()
+
+    @pytest.mark.asyncio
+    async def test_current_user_claims(self):
+        jwt_data = JWTData(sub=777, is_admin=True)
+        claims_user = await get_current_user_claims(jwt_data)
+        assert (claims_user.id, claims_user.is_admin) == (777, True)
+
+        async with async_session_maker() as session:
+            assert await get_current_user(jwt_data, session) is None
+
+
+class TestTokenCache:
+
+    def test_token_cache_hit(self):
+        cache = VerifiedTokenCache(max_size=1)
+        token = create_access_token(user=JWTData(sub=1, is_admin=True))
+        assert cache.decode(token).is_admin
+        assert cache.decode(token).id == 1
+        assert cache.stats()['hits'] == 1
+
+        cache.decode(create_access_token(user=JWTData(sub=2)))
+        assert cache.stats()['evictions'] == 1
+        assert cache.stats()['size'] == 1
+
+    def test_token_cache_expired(self):
+        cache = VerifiedTokenCache()
+        token = create_access_token(user=JWTData(sub=1), exp_delta=timedelta(seconds=-1))
+        with pytest.raises(InvalidTokenException):
+            cache.decode(token)
+        assert cache.stats()['size'] == 0
+
+
+class TestRefreshTokenStore:
+
+    @pytest.mark.asyncio
+    async def test_refresh_tokens_per_user(self, get_test_client: AsyncClient):
+        async with async_session_maker() as session:
+            tokens = [await create_refresh_token(1, session) for _ in range(REFRESH_TOKENS_PER_USER + 2)]
+            count = await session.scalar(
+                select(func.count()).where(AuthRefreshToken.user_id == 1)
+            )
+        assert count == REFRESH_TOKENS_PER_USER
+
+        response = await get_test_client.put('/auth/user/token', cookies={'refresh_token': tokens[0]})
+        assert response.status_code == 400
+        response = await get_test_client.put('/auth/user/token', cookies={'refresh_token': tokens[-1]})
+        assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_purge_expired_refresh_tokens(self):
+        async with async_session_maker() as session:
+            session.add_all([
+                AuthRefreshToken(token_hash=hash_refresh_token(f'expired_{i}'), user_id=2,
+                                 expires_at=datetime.utcnow() - timedelta(minutes=1))
+                for i in range(5)
+            ])
+            await session.commit()
+
+            assert await purge_expired_refresh_tokens(session, batch_size=2) >= 5
+            count = await session.scalar(
+                select(func.count()).where(AuthRefreshToken.expires_at <= datetime.utcnow())
+            )
+        assert count == 0
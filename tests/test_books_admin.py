@@ -1,7 +1,17 @@
+import asyncio
+import json
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import select
 
-from .factories import BookFactory
+import src.books.service as book_service
+from src.books.models import Book, Tag, book_user
+from src.books.suggest import PrefixIndex, SuggestIndexSync
+from src.config import DB_MAX_OVERFLOW, TEST_DATABASE_URL
+from src.events import notification_listener
+from .conftest import async_session_maker
+from .factories import BookFactory, AuthorFactory, TagFactory
 
 class TestCreateBook:
     endpoint = '/library/admin/'
@@ -62,6 +72,21 @@ class TestUpdateBook:
         assert response.status_code == 200
         assert response.json()['title'] == 'New book 0 title'
 
+    @pytest.mark.asyncio
+    async def test_update_book_authors(self, get_test_client: AsyncClient, access_login_admin: str):
+        first, second = await AuthorFactory.create_batch(2)
+        response = await get_test_client.patch(self.endpoint,
+                                               cookies={'access_token': access_login_admin},
+                                               json={'authors_id': [first.id, second.id, 777]})
+        assert response.status_code == 200
+        assert {a['id'] for a in response.json()['authors']} == {first.id, second.id}
+
+        response = await get_test_client.patch(self.endpoint,
+                                               cookies={'access_token': access_login_admin},
+                                               json={'authors_id': [second.id]})
+        assert response.status_code == 200
+        assert [a['id'] for a in response.json()['authors']] == [second.id]
+
 
 class TestDeleteBook:
     endpoint = '/library/admin/2'
@@ -108,6 +133,27 @@ class TestGiveBookToUser:
         assert response.status_code == 404
         assert response.json()['detail'] == 'Книги нет в наличии.'
 
+    @pytest.mark.asyncio
+    async def test_give_book_concurrent(self, get_test_client: AsyncClient, access_login_admin: str):
+        book = await BookFactory.create(quantity=2, available=2)
+        responses = await asyncio.gather(*(get_test_client.post(f'/library/admin/{book.id}/give',
+                                                                cookies={'access_token': access_login_admin},
+                                                                params={'user_id': 1})
+                                           for _ in range(5)))
+        assert sorted(response.status_code for response in responses) == [200, 200, 422, 422, 422]
+
+        response = await get_test_client.get('/library/admin/', params={'filter_str': book.title},
+                                             cookies={'access_token': access_login_admin})
+        assert response.json()['items'][0]['available'] == 0
+        assert {'email', 'username', 'is_admin'} <= response.json()['items'][0]['users'][0].keys()
+
+    @pytest.mark.asyncio
+    async def test_get_books_fields(self, get_test_client: AsyncClient, access_login_admin: str):
+        response = await get_test_client.get('/library/admin/', params={'fields': 'title,available'},
+                                             cookies={'access_token': access_login_admin})
+        assert response.status_code == 200
+        assert response.json()['items'][0].keys() == {'id', 'title', 'available'}
+
 
 class TestGetBookFromUser:
     endpoint = '/library/admin/1/get'
@@ -129,6 +175,57 @@ class TestGetBookFromUser:
         assert response.json()['title'] == 'New book 0 title'
 
 
+class TestCirculationBatch:
+    endpoint = '/library/admin/circulation'
+
+    @pytest.mark.asyncio
+    async def test_circulation_batch(self, get_test_client: AsyncClient, access_login_admin: str):
+        book = await BookFactory.create(quantity=1, available=1)
+        operations = [
+            {'action': 'give', 'book_id': book.id, 'user_id': 1},
+            {'action': 'give', 'book_id': book.id, 'user_id': 1},
+            {'action': 'return', 'book_id': book.id, 'user_id': 1},
+            {'action': 'return', 'book_id': book.id, 'user_id': 1},
+            {'action': 'give', 'book_id': 777, 'user_id': 1},
+        ]
+        response = await get_test_client.post(self.endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              json={'operations': operations})
+        assert response.status_code == 200
+        assert [item['ok'] for item in response.json()] == [True, False, True, False, False]
+        assert response.json()[1]['error'] == 'Book not available.'
+
+    @pytest.mark.asyncio
+    async def test_circulation_batch_give_then_return(self, get_test_client: AsyncClient, access_login_admin: str):
+        book = await BookFactory.create(quantity=1, available=1)
+        operations = [
+            {'action': 'give', 'book_id': book.id, 'user_id': 1},
+            {'action': 'return', 'book_id': book.id, 'user_id': 1},
+            {'action': 'return', 'book_id': book.id, 'user_id': 1},
+            {'action': 'give', 'book_id': book.id, 'user_id': 2},
+        ]
+        response = await get_test_client.post(self.endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              json={'operations': operations})
+        assert response.status_code == 200
+        assert [item['ok'] for item in response.json()] == [True, True, False, True]
+        assert response.json()[2]['error'] == "Book wasn't taken by user."
+
+        async with async_session_maker() as session:
+            assert await session.scalar(select(Book.available).where(Book.id == book.id)) == 0
+            res = await session.execute(select(book_user.c.user_id, book_user.c.returned_at != None)
+                                        .where(book_user.c.book_id == book.id)
+                                        .order_by(book_user.c.give_at))
+            assert res.all() == [(1, True), (2, False)]
+
+    @pytest.mark.asyncio
+    async def test_circulation_batch_empty(self, get_test_client: AsyncClient, access_login_admin: str):
+        response = await get_test_client.post(self.endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              json={'operations': []})
+        assert response.status_code == 422
+
+
 class TestAddAuthor:
     endpoint = '/library/admin/author'
 
@@ -139,6 +236,58 @@ class TestAddAuthor:
                                               params={'author_name': 'New Author'})
         assert response.status_code == 201
 
+    @pytest.mark.asyncio
+    async def test_add_author_taken(self, get_test_client: AsyncClient, access_login_admin: str):
+        response = await get_test_client.post(self.endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              params={'author_name': 'New Author'})
+        assert response.status_code == 422
+
+
+class TestSuggest:
+    endpoint = '/library/suggest'
+
+    @pytest.mark.asyncio
+    async def test_suggest_new_author(self, get_test_client: AsyncClient, access_login_admin: str):
+        listener = asyncio.create_task(notification_listener.run(TEST_DATABASE_URL))
+        try:
+            while not notification_listener.connected:
+                await asyncio.sleep(0.05)
+            response = await get_test_client.post('/library/admin/author',
+                                                  cookies={'access_token': access_login_admin},
+                                                  params={'author_name': 'Suggested Author'})
+            assert response.status_code == 201
+
+            for _ in range(100):
+                response = await get_test_client.get(self.endpoint, params={'q': 'suggested au'})
+                if response.json():
+                    break
+                await asyncio.sleep(0.05)
+            assert response.status_code == 200
+            assert [item['kind'] for item in response.json() if item['text'] == 'Suggested Author'] == ['author']
+        finally:
+            listener.cancel()
+
+    @pytest.mark.asyncio
+    async def test_suggest_change_during_rebuild(self):
+        index = PrefixIndex()
+        sync = SuggestIndexSync(index)
+        async with async_session_maker() as session:
+            rebuild = asyncio.create_task(sync.rebuild(session))
+            while not sync.stats()['rebuilding']:
+                await asyncio.sleep(0)
+            sync.on_notification('add', {'kind': 'author', 'id': 777, 'text': 'Added While Rebuilding'})
+            await rebuild
+
+        assert sync.stats()['rebuilds'] == 1
+        assert [item['id'] for item in index.search('added while')] == [777]
+
+    @pytest.mark.asyncio
+    async def test_suggest_empty_query(self, get_test_client: AsyncClient):
+        response = await get_test_client.get(self.endpoint,
+                                             params={'q': ''})
+        assert response.status_code == 422
+
 
 class TestUpdateAuthor:
     endpoint = '/library/admin/author/1'
@@ -181,7 +330,37 @@ class TestGetTags:
         response = await get_test_client.get(self.endpoint,
                                              cookies={'access_token': access_login_admin})
         assert response.status_code == 200
-        assert response.json()[0]['id'] == 1
+        assert response.json()['items'][0]['id'] == 1
+
+
+class TestLinkTagBooks:
+
+    @pytest.mark.asyncio
+    async def test_link_tag_books(self, get_test_client: AsyncClient, access_login_admin: str):
+        tag = await TagFactory.create()
+        books = await BookFactory.create_batch(3)
+        endpoint = f'/library/admin/tag/{tag.id}/books'
+
+        response = await get_test_client.post(endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              json={'book_ids': [book.id for book in books] + [777]})
+        assert response.status_code == 200
+        assert response.json()['Changed'] == 3
+
+        response = await get_test_client.post(endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              json={'book_ids': [books[0].id], 'add': False})
+        assert response.json()['Changed'] == 1
+
+        response = await get_test_client.get(f'/library/{books[1].id}')
+        assert [t['id'] for t in response.json()['tags']] == [tag.id]
+
+    @pytest.mark.asyncio
+    async def test_link_tag_not_exists(self, get_test_client: AsyncClient, access_login_admin: str):
+        response = await get_test_client.post('/library/admin/tag/777/books',
+                                              cookies={'access_token': access_login_admin},
+                                              json={'book_ids': [1]})
+        assert response.status_code == 404
 
 
 class TestUpdateTag:
@@ -195,6 +374,28 @@ class TestUpdateTag:
         assert response.status_code == 200
         assert response.json()['content'] == 'New tag data'
 
+    @pytest.mark.asyncio
+    async def test_update_tag_invalidates_after_commit(self, get_test_client: AsyncClient, access_login_admin: str,
+                                                       monkeypatch):
+        tag = await TagFactory.create()
+        book = await BookFactory.create(tags=[tag])
+        seen = []
+
+        async def delete(*keys):
+            # Читатель, пришедший сразу после сброса, должен видеть уже новые данные
+            async with async_session_maker() as session:
+                seen.append(await session.scalar(select(Tag.content).where(Tag.id == tag.id)))
+
+        monkeypatch.setattr(book_service.book_cache, 'delete', delete)
+        response = await get_test_client.patch(f'/library/admin/tag/{tag.id}',
+                                               cookies={'access_token': access_login_admin},
+                                               json={'content': 'Committed tag'})
+        assert response.status_code == 200
+        assert seen == ['Committed tag']
+
+        response = await get_test_client.get(f'/library/{book.id}')
+        assert response.json()['tags'] == [{'id': tag.id, 'content': 'Committed tag'}]
+
 
 class TestDeleteTag:
     endpoint = '/library/admin/tag/1'
@@ -204,3 +405,101 @@ class TestDeleteTag:
         response = await get_test_client.delete(self.endpoint,
                                                 cookies={'access_token': access_login_admin})
         assert response.status_code == 204
+
+
+class TestExportBooks:
+    endpoint = '/library/admin/export'
+
+    @pytest.mark.asyncio
+    async def test_export_books_not_admin(self, get_test_client: AsyncClient, access_login_user: str):
+        response = await get_test_client.get(self.endpoint,
+                                             cookies={'access_token': access_login_user})
+        assert response.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_export_books_ndjson(self, get_test_client: AsyncClient, access_login_admin: str):
+        response = await get_test_client.get(self.endpoint,
+                                             cookies={'access_token': access_login_admin})
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+
+        books = [json.loads(line) for line in response.text.splitlines()]
+        assert books
+        assert books == sorted(books, key=lambda book: book['id'])
+        assert {'authors', 'tags', 'avg_rating', 'count_comments'} <= set(books[0])
+
+    @pytest.mark.asyncio
+    async def test_export_books_csv(self, get_test_client: AsyncClient, access_login_admin: str):
+        response = await get_test_client.get(self.endpoint,
+                                             cookies={'access_token': access_login_admin},
+                                             params={'format': 'csv'})
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/csv')
+        assert response.text.splitlines()[0].startswith('id,title,')
+
+
+class TestImportBooks:
+    endpoint = '/library/admin/import'
+
+    @pytest.mark.asyncio
+    async def test_import_books_csv(self, get_test_client: AsyncClient, access_login_admin: str):
+        content = ('title,year_published,description,quantity,authors,tags\n'
+                   'Imported book 1,1990,,3,Imported Author; Second Author,imported\n'
+                   ',3000,,1,,\n'
+                   'Imported book 2,,,,Imported Author,\n')
+        response = await get_test_client.post(self.endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              content=content.encode('utf-8'))
+        assert response.status_code == 200
+        assert response.json()['imported'] == 2
+        assert response.json()['authors_created'] == 2
+        assert response.json()['tags_created'] == 1
+        assert response.json()['failed'] == 1
+        assert response.json()['errors'][0]['line'] == 3
+
+        response = await get_test_client.get('/library/', params={'filter_str': 'Imported Author'})
+        assert len(response.json()['items']) == 2
+
+    @pytest.mark.asyncio
+    async def test_import_books_ndjson(self, get_test_client: AsyncClient, access_login_admin: str):
+        content = ('{"title": "Imported book 3", "authors": ["Imported Author"], "quantity": 1}\n'
+                   'not json\n')
+        response = await get_test_client.post(self.endpoint,
+                                              cookies={'access_token': access_login_admin},
+                                              params={'format': 'ndjson'},
+                                              content=content.encode('utf-8'))
+        assert response.status_code == 200
+        assert response.json()['imported'] == 1
+        assert response.json()['authors_created'] == 0
+        assert response.json()['errors'][0]['line'] == 2
+
+    @pytest.mark.asyncio
+    async def test_import_books_concurrent(self, get_test_client: AsyncClient, access_login_admin: str):
+        content = ('title,year_published,description,quantity,authors,tags\n'
+                   'Concurrent book,,,1,Concurrent Author,concurrent\n')
+        responses = await asyncio.gather(*(get_test_client.post(self.endpoint,
+                                                                cookies={'access_token': access_login_admin},
+                                                                content=content.encode('utf-8'))
+                                           for _ in range(4)))
+        assert [response.json()['imported'] for response in responses] == [1] * 4
+        assert sum(response.json()['authors_created'] for response in responses) == 1
+        assert sum(response.json()['tags_created'] for response in responses) == 1
+
+        response = await get_test_client.get('/library/author/', params={'filter_str': 'Concurrent Author'})
+        assert len(response.json()['items']) == 1
+
+
+class TestMetrics:
+
+    @pytest.mark.asyncio
+    async def test_metrics_db_pool(self, get_test_client: AsyncClient, access_login_admin: str):
+        response = await get_test_client.get('/metrics/', cookies={'access_token': access_login_admin})
+        assert response.status_code == 200
+        pool = response.json()['db_pool']
+        assert pool['max_connections'] == pool['size'] + DB_MAX_OVERFLOW
+        assert {'checked_out', 'occupancy', 'timeouts', 'wait_p99_ms'} <= set(pool)
+
+    @pytest.mark.asyncio
+    async def test_metrics_admin_required(self, get_test_client: AsyncClient, access_login_user: str):
+        response = await get_test_client.get('/metrics/', cookies={'access_token': access_login_user})
+        assert response.status_code == 401